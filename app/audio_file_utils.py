@@ -1,27 +1,324 @@
-import wave
+import os
+import struct
 import numpy as np
+from dataclasses import dataclass
 from pathlib import Path
+from typing import BinaryIO, Iterator, Optional, Union
+
+# Frames decoded or encoded at once by the WAV reader and writer: the memory they use doesn't
+# grow with the file
+WAV_BLOCK_FRAMES = int(os.getenv("WAV_BLOCK_FRAMES", 1 << 16))
+
+WAVE_FORMAT_PCM = 1
+WAVE_FORMAT_IEEE_FLOAT = 3
+WAVE_FORMAT_EXTENSIBLE = 0xFFFE
+# Float samples are in [-1, 1], audio arrays in the 16-bit range
+FLOAT_SCALE = 32768.0
+
+
+@dataclass(frozen=True)
+class WavInfo:
+    framerate: int
+    nchannels: int
+    sampwidth: int  # bytes per sample
+    is_float: bool
+    data_offset: int  # position of the first sample in the file
+    nframes: int
+
+    @property
+    def block_align(self) -> int:
+        return self.nchannels * self.sampwidth
+
+
+def read_wav_info(filepath: Union[str, Path]) -> WavInfo:
+    """
+    Parses the RIFF chunks of a WAV file up to its `data` chunk. Unknown chunks are skipped; a
+    data size past the end of the file (e.g. the 0xFFFFFFFF of a streamed header, or a file
+    still being written) is cut to what is there.
+
+    Raises:
+        ValueError: Not a WAV file, or an encoding other than 8/16/24/32-bit PCM or 32/64-bit float.
+    """
+    file_size = os.path.getsize(filepath)
+    fmt = None
+    with open(filepath, "rb") as f:
+        riff = f.read(12)
+        if len(riff) < 12 or riff[:4] != b"RIFF" or riff[8:] != b"WAVE":
+            raise ValueError(f"Not a WAV file: {filepath}")
+        while True:
+            header = f.read(8)
+            if len(header) < 8:
+                raise ValueError(f"No data chunk in {filepath}")
+            chunk_id, size = header[:4], struct.unpack("<I", header[4:])[0]
+            if chunk_id == b"fmt ":
+                body = f.read(size)
+                if len(body) < 16:
+                    raise ValueError(f"Truncated fmt chunk in {filepath}")
+                tag, nchannels, framerate, _, _, bits = struct.unpack("<HHIIHH", body[:16])
+                if tag == WAVE_FORMAT_EXTENSIBLE and len(body) >= 26:
+                    tag = struct.unpack("<H", body[24:26])[0]  # first field of the sub-format GUID
+                fmt = (tag, nchannels, framerate, bits)
+                if size % 2:
+                    f.seek(1, os.SEEK_CUR)
+            elif chunk_id == b"data":
+                break
+            else:
+                f.seek(size + size % 2, os.SEEK_CUR)
+        data_offset = f.tell()
+
+    if fmt is None:
+        raise ValueError(f"No fmt chunk before the data in {filepath}")
+    tag, nchannels, framerate, bits = fmt
+    is_float = tag == WAVE_FORMAT_IEEE_FLOAT
+    if not ((tag == WAVE_FORMAT_PCM and bits in (8, 16, 24, 32)) or (is_float and bits in (32, 64))):
+        raise ValueError(f"Unsupported WAV encoding: format {tag}, {bits} bits")
+    if nchannels < 1:
+        raise ValueError(f"Invalid channel count: {nchannels}")
+
+    sampwidth = bits // 8
+    size = min(size, file_size - data_offset)
+    return WavInfo(framerate, nchannels, sampwidth, is_float, data_offset, size // (nchannels * sampwidth))
+
+
+def _wav_header(framerate: int, sampwidth: int, nchannels: int, data_size: int, is_float: bool = False) -> bytes:
+    block_align = nchannels * sampwidth
+    tag = WAVE_FORMAT_IEEE_FLOAT if is_float else WAVE_FORMAT_PCM
+    return b"".join([
+        b"RIFF", struct.pack("<I", min(36 + data_size, 0xFFFFFFFF)), b"WAVE",
+        b"fmt ", struct.pack("<IHHIIHH", 16, tag, nchannels, framerate, framerate * block_align,
+                             block_align, sampwidth * 8),
+        b"data", struct.pack("<I", min(data_size, 0xFFFFFFFF)),
+    ])
+
+
+class WavReader:
+    """
+    Reads a WAV file through a memory map of its samples: nothing is read before it is
+    decoded, and a block is decoded (and downmixed to mono, averaging the channels) straight
+    from the mapped bytes, so only the output is allocated.
+
+        with WavReader(path) as reader:
+            for block in reader.blocks():
+                ...
+    """
+
+    def __init__(self, filepath: Union[str, Path]):
+        self.filepath = Path(filepath)
+        self.info = read_wav_info(filepath)
+        size = self.info.nframes * self.info.block_align
+        self._data = (np.memmap(filepath, dtype=np.uint8, mode="r", offset=self.info.data_offset, shape=(size,))
+                      if size else np.zeros(0, dtype=np.uint8))
+
+    @property
+    def framerate(self) -> int:
+        return self.info.framerate
+
+    @property
+    def nframes(self) -> int:
+        return self.info.nframes
+
+    def read(self, start: int = 0, count: Optional[int] = None, out: Optional[np.ndarray] = None) -> np.ndarray:
+        """
+        Frames [start, start + count) as mono float32 in the 16-bit range, written to `out` if given.
+        """
+        info = self.info
+        end = info.nframes if count is None else min(info.nframes, start + count)
+        start = min(start, end)
+        if out is None:
+            out = np.empty(end - start, dtype=np.float32)
+        raw = self._data[start * info.block_align:end * info.block_align]
+        nchannels = info.nchannels
+
+        if info.sampwidth == 3 and not info.is_float:
+            # Sign-extended into the top 3 bytes of an int32
+            padded = np.zeros((len(raw) // 3, 4), dtype=np.uint8)
+            padded[:, 1:] = raw.reshape(-1, 3)
+            samples, scale, shift = padded.view("<i4").reshape(-1), 1 / 65536, 0.0
+        elif info.is_float:
+            samples = raw.view("<f4" if info.sampwidth == 4 else "<f8")
+            scale, shift = FLOAT_SCALE, 0.0
+        else:
+            samples = raw.view({1: np.uint8, 2: "<i2", 4: "<i4"}[info.sampwidth])
+            scale, shift = {1: 256.0, 2: 1.0, 4: 1 / 65536}[info.sampwidth], -128.0 if info.sampwidth == 1 else 0.0
+
+        if nchannels == 1:
+            out[:] = samples
+        else:
+            np.mean(samples.reshape(-1, nchannels), axis=1, dtype=np.float64 if info.sampwidth > 2 else np.float32, out=out)
+        if shift:
+            out += shift
+        if scale != 1.0:
+            out *= scale
+        return out
+
+    def read_all(self) -> np.ndarray:
+        """
+        The whole file as mono float32, decoded block by block into one array.
+        """
+        audio = np.empty(self.info.nframes, dtype=np.float32)
+        for start in range(0, self.info.nframes, WAV_BLOCK_FRAMES):
+            self.read(start, WAV_BLOCK_FRAMES, out=audio[start:start + WAV_BLOCK_FRAMES])
+        return audio
+
+    def blocks(self, block_frames: int = WAV_BLOCK_FRAMES) -> Iterator[np.ndarray]:
+        """
+        Yields the file as mono float32 blocks of `block_frames` frames.
+        """
+        for start in range(0, self.info.nframes, block_frames):
+            yield self.read(start, block_frames)
+
+    def close(self) -> None:
+        mmap = getattr(self._data, "_mmap", None)
+        self._data = np.zeros(0, dtype=np.uint8)
+        if mmap is not None:
+            mmap.close()
+
+    def __enter__(self) -> "WavReader":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+
+class WavWriter:
+    """
+    Writes a mono WAV file block by block, for audio whose length isn't known up front; the
+    sizes in the header are filled in on close. `sampwidth` is 1, 2, 3 or 4 bytes of PCM, or 4
+    with `is_float` for float32 samples.
+    """
+
+    def __init__(self, filepath: Union[str, Path], framerate: int, sampwidth: int = 2, is_float: bool = False):
+        if is_float and sampwidth != 4:
+            raise ValueError("Float WAV files are written with 4-byte samples")
+        self.filepath = Path(filepath)
+        self.framerate = framerate
+        self.sampwidth = sampwidth
+        self.is_float = is_float
+        self.nframes = 0
+        self._file: Optional[BinaryIO] = open(filepath, "wb")
+        self._file.write(_wav_header(framerate, sampwidth, 1, 0, is_float))
+
+    def write(self, audio: np.ndarray) -> None:
+        for start in range(0, len(audio), WAV_BLOCK_FRAMES):
+            self._file.write(_encode(audio[start:start + WAV_BLOCK_FRAMES], self.sampwidth, self.is_float))
+        self.nframes += len(audio)
+
+    def close(self) -> None:
+        if self._file is None:
+            return
+        data_size = self.nframes * self.sampwidth
+        if data_size % 2:
+            self._file.write(b"\0")  # chunks are word aligned
+        self._file.seek(0)
+        self._file.write(_wav_header(self.framerate, self.sampwidth, 1, data_size, self.is_float))
+        self._file.close()
+        self._file = None
+
+    def __enter__(self) -> "WavWriter":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+
+def _encode(audio: np.ndarray, sampwidth: int, is_float: bool) -> bytes:
+    if is_float:
+        return (np.asarray(audio, dtype=np.float32) / FLOAT_SCALE).astype("<f4").tobytes()
+    return AudioFileUtils.audio_to_pcm(audio, sampwidth)
+
+
+def write_wav(filepath: Union[str, Path], audio: np.ndarray, framerate: int, sampwidth: int = 2,
+              is_float: bool = False) -> None:
+    """
+    Writes mono audio (float32 in the 16-bit range) to a WAV file: the file is sized up front
+    and the samples are encoded block by block into a memory map of it, so there is never a
+    second copy of the whole clip.
+    """
+    if is_float and sampwidth != 4:
+        raise ValueError("Float WAV files are written with 4-byte samples")
+    data_size = len(audio) * sampwidth
+    header = _wav_header(framerate, sampwidth, 1, data_size, is_float)
+    with open(filepath, "wb") as f:
+        f.write(header)
+        f.truncate(len(header) + data_size + data_size % 2)
+    if not data_size:
+        return
+
+    data = np.memmap(filepath, dtype=np.uint8, mode="r+", offset=len(header), shape=(data_size,))
+    try:
+        for start in range(0, len(audio), WAV_BLOCK_FRAMES):
+            chunk = audio[start:start + WAV_BLOCK_FRAMES]
+            data[start * sampwidth:(start + len(chunk)) * sampwidth] = np.frombuffer(
+                _encode(chunk, sampwidth, is_float), dtype=np.uint8)
+        data.flush()
+    finally:
+        data._mmap.close()
+
 
 class AudioFileUtils:
     @staticmethod
     def wav_to_audio(filepath: Path):
-        with wave.open(str(filepath), 'rb') as wf:
-            nchannels, sampwidth, framerate, nframes, _, _ = wf.getparams()
-            if nchannels != 1:
-                raise ValueError("Only mono WAV files are supported")
+        """
+        Reads a WAV file (8/16/24/32-bit PCM or float, any channel count, downmixed to mono).
+
+        Returns:
+            Tuple[np.ndarray, int]: float32 samples in the 16-bit range, and the sample rate.
+        """
+        with WavReader(filepath) as reader:
+            return reader.read_all(), reader.framerate
+
+    @staticmethod
+    def audio_to_wav(audio: np.ndarray, framerate: int, output_path: Path, sampwidth: int = 2):
+        write_wav(output_path, audio, framerate, sampwidth)
 
-            frames = wf.readframes(nframes)
-            audio = np.frombuffer(frames, dtype=np.int16)
+    @staticmethod
+    def pcm16_to_audio(frames: bytes) -> np.ndarray:
+        return np.frombuffer(frames, dtype=np.int16).astype(np.float32)
+
+    @staticmethod
+    def audio_to_pcm16(audio: np.ndarray) -> bytes:
+        return np.clip(audio, -32768, 32767).astype(np.int16).tobytes()
 
-        return audio.astype(np.float32), framerate
+    @staticmethod
+    def pcm_to_audio(frames: bytes, sampwidth: int) -> np.ndarray:
+        """
+        Decodes little-endian PCM (8-bit unsigned, 16/24/32-bit signed) to float32 in the 16-bit range.
+        """
+        if sampwidth == 1:
+            return (np.frombuffer(frames, dtype=np.uint8).astype(np.float32) - 128) * 256
+        if sampwidth == 2:
+            return AudioFileUtils.pcm16_to_audio(frames)
+        if sampwidth == 3:
+            raw = np.frombuffer(frames, dtype=np.uint8).reshape(-1, 3)
+            # Sign-extended into the top 3 bytes of an int32
+            padded = np.zeros((len(raw), 4), dtype=np.uint8)
+            padded[:, 1:] = raw
+            return padded.view("<i4").reshape(-1).astype(np.float32) / 65536
+        if sampwidth == 4:
+            return np.frombuffer(frames, dtype="<i4").astype(np.float32) / 65536
+        raise ValueError(f"Unsupported sample width: {sampwidth}")
+
+    @staticmethod
+    def audio_to_pcm(audio: np.ndarray, sampwidth: int) -> bytes:
+        """
+        Encodes float32 audio in the 16-bit range to little-endian PCM of the given sample width.
+        """
+        if sampwidth == 2:
+            return AudioFileUtils.audio_to_pcm16(audio)
+        audio = np.clip(audio, -32768, 32767)
+        if sampwidth == 1:
+            return (np.round(audio / 256) + 128).clip(0, 255).astype(np.uint8).tobytes()
+        if sampwidth == 3:
+            samples = np.round(audio * 256).astype("<i4")
+            return samples.view(np.uint8).reshape(-1, 4)[:, :3].tobytes()
+        if sampwidth == 4:
+            return np.round(audio.astype(np.float64) * 65536).astype("<i4").tobytes()
+        raise ValueError(f"Unsupported sample width: {sampwidth}")
 
     @staticmethod
-    def audio_to_wav(audio: np.ndarray, framerate: int, output_path: Path):
-        # Ensure correct format
-        audio_clipped = np.clip(audio, -32768, 32767).astype(np.int16)
-
-        with wave.open(str(output_path), 'wb') as wf:
-            wf.setnchannels(1)
-            wf.setsampwidth(2)  # 16-bit
-            wf.setframerate(framerate)
-            wf.writeframes(audio_clipped.tobytes())
+    def wav_stream_header(framerate: int, sampwidth: int = 2, nchannels: int = 1) -> bytes:
+        """
+        WAV header for a stream of unknown length: the RIFF and data sizes are set to
+        0xFFFFFFFF, which players treat as "read until the end".
+        """
+        return _wav_header(framerate, sampwidth, nchannels, 0xFFFFFFFF)
@@ -0,0 +1,232 @@
+import io
+import os
+import struct
+import threading
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Callable, Dict, Optional
+
+import numpy as np
+
+from audio_file_utils import AudioFileUtils
+from resampler import resample
+from metrics import stage
+
+try:
+    import soundfile
+except ImportError:  # FLAC and Opus need it, WAV and G.711 do not
+    soundfile = None
+
+G711_RATE = 8000
+# Rates the Opus encoder accepts, anything else is resampled to 48kHz
+OPUS_RATES = (8000, 12000, 16000, 24000, 48000)
+
+
+@dataclass(frozen=True)
+class AudioFormat:
+    name: str
+    suffix: str  # replaces ".wav" in the source name
+    media_type: str
+    encode: Optional[Callable[[np.ndarray, int], bytes]]  # None for the source WAV itself
+
+
+# G.711 segment ends (ITU-T reference implementation)
+_ULAW_SEGMENT_ENDS = np.array([0x3F, 0x7F, 0xFF, 0x1FF, 0x3FF, 0x7FF, 0xFFF, 0x1FFF])
+_ALAW_SEGMENT_ENDS = np.array([0x1F, 0x3F, 0x7F, 0xFF, 0x1FF, 0x3FF, 0x7FF, 0xFFF])
+
+
+def linear_to_ulaw(audio: np.ndarray) -> np.ndarray:
+    """
+    G.711 μ-law encoding of float32 samples in the 16-bit range.
+    """
+    pcm = np.clip(np.round(audio), -32768, 32767).astype(np.int32) >> 2
+    mask = np.where(pcm < 0, 0x7F, 0xFF)
+    magnitude = np.minimum(np.abs(pcm), 8159) + (0x84 >> 2)
+    segment = np.searchsorted(_ULAW_SEGMENT_ENDS, magnitude)
+    value = (segment << 4) | ((magnitude >> (segment + 1)) & 0x0F)
+    value = np.where(segment >= 8, 0x7F, value)
+    return (value ^ mask).astype(np.uint8)
+
+
+def linear_to_alaw(audio: np.ndarray) -> np.ndarray:
+    """
+    G.711 A-law encoding of float32 samples in the 16-bit range.
+    """
+    pcm = np.clip(np.round(audio), -32768, 32767).astype(np.int32) >> 3
+    negative = pcm < 0
+    mask = np.where(negative, 0x55, 0xD5)
+    magnitude = np.where(negative, -pcm - 1, pcm)
+    segment = np.searchsorted(_ALAW_SEGMENT_ENDS, magnitude)
+    shift = np.where(segment < 2, 1, segment)
+    value = (segment << 4) | ((magnitude >> shift) & 0x0F)
+    value = np.where(segment >= 8, 0x7F, value)
+    return (value ^ mask).astype(np.uint8)
+
+
+def _g711_wav(samples: np.ndarray, format_tag: int) -> bytes:
+    # Non-PCM WAV: 18 bytes fmt chunk and a fact chunk with the sample count
+    data = samples.tobytes()
+    fmt = struct.pack("<HHIIHHH", format_tag, 1, G711_RATE, G711_RATE, 1, 8, 0)
+    fact = struct.pack("<I", len(samples))
+    chunks = b"".join([
+        b"fmt ", struct.pack("<I", len(fmt)), fmt,
+        b"fact", struct.pack("<I", len(fact)), fact,
+        b"data", struct.pack("<I", len(data)), data,
+    ])
+    if len(data) % 2:
+        chunks += b"\0"
+    return b"RIFF" + struct.pack("<I", 4 + len(chunks)) + b"WAVE" + chunks
+
+
+def _encode_ulaw(audio: np.ndarray, framerate: int) -> bytes:
+    return _g711_wav(linear_to_ulaw(resample(audio, framerate, G711_RATE)), 7)
+
+
+def _encode_alaw(audio: np.ndarray, framerate: int) -> bytes:
+    return _g711_wav(linear_to_alaw(resample(audio, framerate, G711_RATE)), 6)
+
+
+def _soundfile_encode(audio: np.ndarray, framerate: int, format: str, subtype: str) -> bytes:
+    if soundfile is None:
+        raise ValueError(f"{format.lower()} output needs the soundfile package")
+    samples = np.clip(audio, -32768, 32767).astype(np.int16)
+    buffer = io.BytesIO()
+    soundfile.write(buffer, samples, framerate, format=format, subtype=subtype)
+    return buffer.getvalue()
+
+
+def _encode_flac(audio: np.ndarray, framerate: int) -> bytes:
+    return _soundfile_encode(audio, framerate, "FLAC", "PCM_16")
+
+
+def _encode_opus(audio: np.ndarray, framerate: int) -> bytes:
+    if framerate not in OPUS_RATES:
+        audio, framerate = resample(audio, framerate, 48000), 48000
+    return _soundfile_encode(audio, framerate, "OGG", "OPUS")
+
+
+OUTPUT_FORMATS: Dict[str, AudioFormat] = {
+    "wav": AudioFormat("wav", ".wav", "audio/wav", None),
+    "flac": AudioFormat("flac", ".flac", "audio/flac", _encode_flac),
+    "opus": AudioFormat("opus", ".opus", "audio/ogg; codecs=opus", _encode_opus),
+    "mulaw": AudioFormat("mulaw", ".ulaw.wav", "audio/wav", _encode_ulaw),
+    "alaw": AudioFormat("alaw", ".alaw.wav", "audio/wav", _encode_alaw),
+}
+
+# Accept header media types, "audio/*" and "*/*" get the source WAV
+_MEDIA_TYPES: Dict[str, str] = {
+    "audio/wav": "wav",
+    "audio/wave": "wav",
+    "audio/x-wav": "wav",
+    "audio/vnd.wave": "wav",
+    "audio/*": "wav",
+    "*/*": "wav",
+    "audio/flac": "flac",
+    "audio/x-flac": "flac",
+    "audio/ogg": "opus",
+    "audio/opus": "opus",
+    "audio/basic": "mulaw",
+    "audio/pcmu": "mulaw",
+    "audio/x-mulaw": "mulaw",
+    "audio/pcma": "alaw",
+    "audio/x-alaw": "alaw",
+}
+
+
+def get_format(name: str) -> AudioFormat:
+    fmt = OUTPUT_FORMATS.get((name or "wav").lower())
+    if fmt is None:
+        raise ValueError(f"Unknown output format: {name} ({', '.join(OUTPUT_FORMATS)})")
+    return fmt
+
+
+def negotiate(accept: Optional[str]) -> Optional[AudioFormat]:
+    """
+    Picks the output format from an Accept header: highest q-value first, then explicit types
+    before wildcards, then the source WAV, then the order in the header. No header, or nothing
+    we know in it (e.g. `application/octet-stream`), means WAV; None means the client excluded
+    WAV (q=0) and accepts nothing else we have.
+    """
+    wav = OUTPUT_FORMATS["wav"]
+    if not accept:
+        return wav
+
+    candidates = []
+    # q of WAV from the most specific range naming it: a WAV type, then audio/*, then */*
+    wav_quality = {}
+    for position, media_range in enumerate(accept.split(",")):
+        media_type, *parameters = [part.strip() for part in media_range.split(";")]
+        media_type = media_type.lower()
+        quality = 1.0
+        for parameter in parameters:
+            key, _, value = parameter.partition("=")
+            if key.strip().lower() == "q":
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0.0
+        name = _MEDIA_TYPES.get(media_type)
+        if name is None:
+            continue
+        wildcard = media_type.endswith("/*")
+        if name == "wav":
+            specificity = 0 if media_type == "*/*" else 1 if wildcard else 2
+            wav_quality.setdefault(specificity, quality)
+        if quality > 0:
+            candidates.append((-quality, wildcard, name != "wav", position, name))
+
+    if candidates:
+        return OUTPUT_FORMATS[min(candidates)[4]]
+    if wav_quality and wav_quality[max(wav_quality)] <= 0:
+        return None
+    return wav
+
+
+def variant_path(source: Path, fmt: AudioFormat) -> Path:
+    """
+    Where the `fmt` encoding of a WAV file is kept: next to it, `<name>.wav` -> `<name><suffix>`.
+    """
+    return source.with_name(source.name.split(".", 1)[0] + fmt.suffix)
+
+
+def is_variant(path: Path) -> bool:
+    return "".join(path.suffixes) != ".wav"
+
+
+_locks: Dict[Path, threading.Lock] = {}
+_locks_guard = threading.Lock()
+
+
+def ensure_variant(source: Path, fmt: AudioFormat) -> Path:
+    """
+    Returns the `fmt` encoding of a WAV file, encoding it the first time only. Concurrent
+    calls for the same file and format wait for a single encode.
+    """
+    if fmt.encode is None:
+        return source
+
+    target = variant_path(source, fmt)
+    if target.exists():
+        return target
+
+    with _locks_guard:
+        lock = _locks.setdefault(target, threading.Lock())
+    try:
+        with lock:
+            if target.exists():
+                return target
+            if not source.exists():
+                raise FileNotFoundError(f"Source file not found: {source.name}")
+
+            with stage("encode"):
+                audio, framerate = AudioFileUtils.wav_to_audio(source)
+                data = fmt.encode(audio, framerate)
+
+            with stage("write"):
+                tmp_path = target.with_name(f".{target.name}.tmp")
+                tmp_path.write_bytes(data)
+                os.replace(tmp_path, target)
+            return target
+    finally:
+        with _locks_guard:
+            _locks.pop(target, None)
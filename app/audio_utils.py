@@ -1,44 +1,88 @@
-import wave
-import audioop
 from pathlib import Path
+from typing import Tuple
 
-def to_portable_file(input_path: Path, output_path: Path) -> None:
+import numpy as np
+
+from audio_file_utils import AudioFileUtils, WavReader, WavWriter
+from resampler import PolyphaseResampler, resample
+
+PORTABLE_RATE = 48000
+PORTABLE_SAMPLE_WIDTH = 2
+
+
+def to_portable_audio(audio: np.ndarray, framerate: int, target_rate: int = PORTABLE_RATE) -> Tuple[np.ndarray, int]:
+    """
+    Converts mono audio (float32, 16-bit PCM range) to the target rate in memory.
+    Args:
+        audio (np.ndarray): Input samples.
+        framerate (int): Input sample rate.
+        target_rate (int): Output sample rate, 48kHz by default (e.g. 8000 for telephony).
+    Returns:
+        Tuple[np.ndarray, int]: Resampled audio and its sample rate.
     """
-    Converts a WAV file to mono, 16-bit, 48kHz.
+    if framerate == target_rate:
+        return audio, framerate
+
+    return resample(audio, framerate, target_rate), target_rate
+
+def to_portable_file(
+    input_path: Path,
+    output_path: Path,
+    target_rate: int = PORTABLE_RATE,
+    sampwidth: int = PORTABLE_SAMPLE_WIDTH
+) -> None:
+    """
+    Converts a WAV file to mono, 16-bit, 48kHz (or another rate / sample width). The input is
+    read, resampled and written block by block, so long files don't need to fit in memory.
     Args:
         input_path (Path): Path to the input WAV file.
         output_path (Path): Path where the converted WAV file will be saved.
+        target_rate (int): Output sample rate.
+        sampwidth (int): Output sample width in bytes (1, 2, 3 or 4).
     """
     if not input_path.exists():
         raise FileNotFoundError(f"Input file not found: {input_path}")
 
-    with wave.open(str(input_path), 'rb') as wf:
-        nchannels, sampwidth, framerate, nframes, _, _ = wf.getparams()
-        frames = wf.readframes(nframes)
+    with WavReader(input_path) as reader:
+        info = reader.info
+        print(f"Original: Channels={info.nchannels}, SampleWidth={info.sampwidth*8}bit{' float' if info.is_float else ''}, "
+              f"FrameRate={info.framerate}, Frames={info.nframes}")
 
-        print(f"Original: Channels={nchannels}, SampleWidth={sampwidth*8}bit, FrameRate={framerate}, Frames={nframes}")
+        framerate = info.framerate
+        resampler = PolyphaseResampler(framerate, target_rate) if framerate != target_rate else None
+        with WavWriter(output_path, target_rate, sampwidth) as writer:
+            # Blocks come out of the reader already downmixed to mono
+            for block in reader.blocks():
+                writer.write(resampler.process(block) if resampler is not None else block)
+            if resampler is not None:
+                writer.write(resampler.flush())
+        framerate = target_rate
 
-        # Convert to mono
-        if nchannels != 1:
-            frames = audioop.tomono(frames, sampwidth, 0.5, 0.5)
-            nchannels = 1
+    print(f"Converted to {framerate // 1000 if framerate % 1000 == 0 else framerate / 1000}kHz, {sampwidth * 8}-bit mono WAV: {output_path}")
 
-        # Convert to 16-bit
-        if sampwidth != 2:
-            frames = audioop.lin2lin(frames, sampwidth, 2)
-            sampwidth = 2
 
-        # Resample to 48kHz if needed
-        target_rate = 48000
-        if framerate != target_rate:
-            frames, _ = audioop.ratecv(frames, sampwidth, nchannels, framerate, target_rate, None)
-            framerate = target_rate
+class PortableStreamConverter:
+    """
+    Streaming counterpart of to_portable_file for 16-bit mono PCM chunks: resamples to the target
+    rate and sample width, carrying the resampler state from one chunk to the next. `flush`
+    returns the last samples once the input is over.
+    """
+
+    def __init__(self, framerate: int, target_rate: int = PORTABLE_RATE, sampwidth: int = PORTABLE_SAMPLE_WIDTH):
+        self.framerate = framerate
+        self.target_rate = target_rate
+        self.sampwidth = sampwidth
+        self._resampler = PolyphaseResampler(framerate, target_rate) if framerate != target_rate else None
 
-    # Write converted WAV
-    with wave.open(str(output_path), 'wb') as wf_out:
-        wf_out.setnchannels(1)
-        wf_out.setsampwidth(2)
-        wf_out.setframerate(48000)
-        wf_out.writeframes(frames)
+    def convert(self, frames: bytes) -> bytes:
+        if self._resampler is None and self.sampwidth == 2:
+            return frames
+        audio = AudioFileUtils.pcm16_to_audio(frames)
+        if self._resampler is not None:
+            audio = self._resampler.process(audio)
+        return AudioFileUtils.audio_to_pcm(audio, self.sampwidth)
 
-    print(f"Converted to 48kHz, 16-bit mono WAV: {output_path}")
+    def flush(self) -> bytes:
+        if self._resampler is None:
+            return b""
+        return AudioFileUtils.audio_to_pcm(self._resampler.flush(), self.sampwidth)
@@ -0,0 +1,161 @@
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, Hashable, List, Optional, Sequence, Tuple
+
+from worker_pool import PoolSaturatedError, WORKER_QUEUE_DEPTH
+
+
+@dataclass
+class BatchItem:
+    payload: Any
+    future: Future = field(default_factory=Future)
+    enqueued_at: float = field(default_factory=time.monotonic)
+
+
+class BatchScheduler:
+    """
+    Groups requests into batches for a model that is cheaper to call once with N inputs than
+    N times with one.
+
+    A single thread blocks on the queue; as soon as a request arrives it keeps collecting until
+    `max_batch_size` requests are in hand or `max_wait` seconds have passed since the first one,
+    then hands the batch to `process_batch`. Requests with different `group_key` values are
+    never batched together (e.g. different voices or generation settings); they go out in
+    separate, consecutive calls.
+
+    At most `max_queue` requests wait for a batch; beyond that `submit` raises
+    PoolSaturatedError right away, like the worker pool, instead of queueing without bound.
+
+    `process_batch(payloads)` must return one result per payload, in order. A result that is an
+    exception instance fails only its own request; an exception raised by `process_batch`
+    fails the whole batch.
+    """
+
+    _STOP = object()
+
+    def __init__(
+        self,
+        process_batch: Callable[[List[Any]], Sequence[Any]],
+        max_batch_size: int = 8,
+        max_wait: float = 0.02,
+        max_queue: int = WORKER_QUEUE_DEPTH,
+        group_key: Optional[Callable[[Any], Hashable]] = None,
+        name: str = "batch-scheduler"
+    ):
+        self.process_batch = process_batch
+        self.max_batch_size = max(1, max_batch_size)
+        self.max_wait = max(0.0, max_wait)
+        self.max_queue = max(1, max_queue)
+        self.group_key = group_key or (lambda payload: None)
+        self.name = name
+
+        self._queue: "queue.Queue" = queue.Queue(maxsize=self.max_queue)
+        self._thread: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+        self._batches = 0
+        self._items = 0
+        self._rejected = 0
+
+    def start(self) -> "BatchScheduler":
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name=self.name, daemon=True)
+                self._thread.start()
+        return self
+
+    def submit(self, payload: Any) -> Future:
+        """
+        Queues a request and returns a future resolved with its result, raising
+        PoolSaturatedError when `max_queue` requests are already waiting.
+        """
+        self.start()
+        item = BatchItem(payload)
+        try:
+            self._queue.put_nowait(item)
+        except queue.Full:
+            with self._lock:
+                self._rejected += 1
+            raise PoolSaturatedError(f"{self.name} queue is full")
+        return item.future
+
+    def stop(self, wait: bool = True):
+        """
+        Processes what is already queued, then stops the scheduler thread.
+        """
+        with self._lock:
+            thread = self._thread
+        if thread is None:
+            return
+        self._queue.put(self._STOP)  # waits for room, the thread is draining the queue
+        if wait:
+            thread.join()
+        with self._lock:
+            self._thread = None
+
+    def stats(self) -> Dict:
+        with self._lock:
+            batches = self._batches
+            items = self._items
+            rejected = self._rejected
+        return {
+            "queue_depth": self._queue.qsize(),
+            "batches": batches,
+            "items": items,
+            "rejected": rejected,
+            "mean_batch_size": round(items / batches, 3) if batches else 0.0,
+        }
+
+    def _collect(self, first: BatchItem) -> Tuple[List[BatchItem], bool]:
+        batch = [first]
+        deadline = time.monotonic() + self.max_wait
+        while len(batch) < self.max_batch_size:
+            timeout = deadline - time.monotonic()
+            try:
+                item = self._queue.get(timeout=timeout) if timeout > 0 else self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if item is self._STOP:
+                return batch, True
+            batch.append(item)
+        return batch, False
+
+    def _run(self):
+        stopping = False
+        while not stopping:
+            # Blocks until there is work, no polling
+            first = self._queue.get()
+            if first is self._STOP:
+                break
+
+            batch, stopping = self._collect(first)
+
+            groups: Dict[Hashable, List[BatchItem]] = {}
+            for item in batch:
+                if item.future.set_running_or_notify_cancel():
+                    groups.setdefault(self.group_key(item.payload), []).append(item)
+
+            for items in groups.values():
+                self._dispatch(items)
+
+    def _dispatch(self, items: List[BatchItem]):
+        with self._lock:
+            self._batches += 1
+            self._items += len(items)
+
+        try:
+            results = list(self.process_batch([item.payload for item in items]))
+            if len(results) != len(items):
+                raise RuntimeError(f"process_batch returned {len(results)} results for {len(items)} requests")
+        except Exception as e:
+            for item in items:
+                item.future.set_exception(e)
+            return
+
+        for item, result in zip(items, results):
+            if isinstance(result, BaseException):
+                item.future.set_exception(result)
+            else:
+                item.future.set_result(result)
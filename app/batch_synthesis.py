@@ -0,0 +1,132 @@
+import os
+import json
+import asyncio
+import zipfile
+from pathlib import Path
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, List, Optional, Tuple
+
+from result_cache import request_key
+from synthesis import cacheable
+from worker_pool import PoolSaturatedError, WORKER_COUNT, WORKER_RETRY_AFTER
+
+BATCH_MAX_ITEMS = int(os.getenv("BATCH_MAX_ITEMS", 5000))
+BATCH_PARALLELISM = int(os.getenv("BATCH_PARALLELISM", WORKER_COUNT))  # items synthesized at once, per batch
+BATCH_SATURATED_RETRIES = int(os.getenv("BATCH_SATURATED_RETRIES", 10))
+
+
+def deduplicate(items: List[Dict[str, Any]]) -> Tuple[List[Dict[str, Any]], List[int]]:
+    """
+    Collapses identical requests (same canonical key as the result cache, output format included).
+    Requests with an unseeded random effect are all kept, each gets its own draw.
+
+    Returns:
+        Tuple[List[Dict], List[int]]: The distinct requests, and for each item the index of its
+        distinct request.
+    """
+    unique: List[Dict[str, Any]] = []
+    positions: Dict[str, int] = {}
+    mapping = []
+    for position, params in enumerate(items):
+        key = request_key(params) if cacheable(params) else f"uncached-{position}"
+        if key not in positions:
+            positions[key] = len(unique)
+            unique.append(params)
+        mapping.append(positions[key])
+    return unique, mapping
+
+
+async def fan_out(
+    unique: List[Dict[str, Any]],
+    synthesize: Callable[[Dict[str, Any]], Awaitable[str]],
+    parallelism: int
+) -> AsyncIterator[Tuple[int, Optional[str], Optional[str]]]:
+    """
+    Runs `synthesize(params)` for each distinct request, at most `parallelism` at a time, and
+    yields (position, filename, error) as they complete. A saturated worker pool is waited
+    for rather than reported, other errors are reported for their item only.
+    """
+    semaphore = asyncio.Semaphore(max(1, parallelism))
+
+    async def run(position: int, params: Dict[str, Any]):
+        async with semaphore:
+            for attempt in range(BATCH_SATURATED_RETRIES + 1):
+                try:
+                    return position, await synthesize(params), None
+                except PoolSaturatedError:
+                    if attempt == BATCH_SATURATED_RETRIES:
+                        return position, None, "Server busy, retry later"
+                    await asyncio.sleep(WORKER_RETRY_AFTER)
+                except Exception as e:
+                    return position, None, str(e)
+
+    tasks = [asyncio.create_task(run(position, params)) for position, params in enumerate(unique)]
+    try:
+        for completed in asyncio.as_completed(tasks):
+            yield await completed
+    finally:
+        # Client gone or error: nothing left should keep the workers busy
+        for task in tasks:
+            task.cancel()
+
+
+class _StreamBuffer:
+    """
+    Write-only, non-seekable file object: zipfile then writes data descriptors after each
+    entry instead of seeking back to the local header, so the archive can be streamed.
+    """
+
+    def __init__(self):
+        self._chunks: List[bytes] = []
+
+    def write(self, data: bytes) -> int:
+        self._chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def drain(self) -> bytes:
+        data = b"".join(self._chunks)
+        self._chunks.clear()
+        return data
+
+
+async def stream_zip(
+    results: AsyncIterator[Tuple[int, Optional[str], Optional[str]]],
+    mapping: List[int],
+    directory: Path
+) -> AsyncIterator[bytes]:
+    """
+    Streams a ZIP of the batch as items complete: one entry per item, named after its index,
+    and a `manifest.json` at the end with the status of every item.
+    """
+    buffer = _StreamBuffer()
+    archive = zipfile.ZipFile(buffer, mode="w", compression=zipfile.ZIP_STORED)
+
+    items_of: Dict[int, List[int]] = {}
+    for index, position in enumerate(mapping):
+        items_of.setdefault(position, []).append(index)
+
+    width = max(5, len(str(len(mapping))))
+    manifest: List[Optional[Dict[str, Any]]] = [None] * len(mapping)
+
+    async for position, filename, error in results:
+        data = None
+        if filename is not None:
+            try:
+                data = await asyncio.to_thread((directory / filename).read_bytes)
+            except OSError as e:
+                error = f"Could not read result: {e}"
+
+        for index in items_of[position]:
+            if data is None:
+                manifest[index] = {"index": index, "error": error}
+                continue
+            name = f"{index:0{width}d}{''.join(Path(filename).suffixes)}"
+            archive.writestr(name, data)
+            manifest[index] = {"index": index, "file": name, "filename": filename}
+            yield buffer.drain()
+
+    archive.writestr("manifest.json", json.dumps({"items": manifest}, indent=2))
+    archive.close()
+    yield buffer.drain()
@@ -1,78 +1,264 @@
 import os
-import queue
+import logging
+import importlib.util
 import threading
 import time
 import uuid
+from concurrent.futures import Future
+from contextlib import nullcontext
+from functools import lru_cache
+from typing import Any, Dict, Iterable, List, Optional
 
-import torchaudio as ta
-from chatterbox.tts import ChatterboxTTS
+import numpy as np
 from pathlib import Path
 
+from audio_file_utils import AudioFileUtils
+from batch_scheduler import BatchScheduler
+from conditionals_cache import ConditionalsCache
+
+logger = logging.getLogger(__name__)
+
+
+@lru_cache(maxsize=None)
+def _torch():
+    # Imported on first use like chatterbox: importing this module must stay cheap for the server
+    try:
+        import torch
+    except ImportError:
+        return None
+    return torch
+
+
+def _chatterbox():
+    # Imported when the real model is loaded only: it takes seconds, and a stub model doesn't need it
+    from chatterbox.tts import ChatterboxTTS, Conditionals
+    return ChatterboxTTS, Conditionals
+
 OUTPUT_DIR = Path(os.getenv("OUTPUT_PATH", "/output")).resolve()
-VOICES_DIR = Path(os.getenv("VOICE_PATH", "/chattervoice")).resolve()
+# CHATTER_VOICE_PATH keeps the reference voices apart from the piper models when both run in the server
+VOICES_DIR = Path(os.getenv("CHATTER_VOICE_PATH") or os.getenv("VOICE_PATH", "/chattervoice")).resolve()
+CHATTER_DEVICE = os.getenv("CHATTER_DEVICE", "auto").lower()  # "cuda", "cpu", or "auto" (cuda when available)
+CHATTER_CPU_THREADS = int(os.getenv("CHATTER_CPU_THREADS", 0))  # torch intra-op threads, 0 = torch default
+CHATTER_PRELOAD = os.getenv("CHATTER_PRELOAD", "1") == "1"  # load the model when the server starts
+CHATTER_BATCH_SIZE = int(os.getenv("CHATTER_BATCH_SIZE", 8))
+CHATTER_BATCH_WAIT_MS = float(os.getenv("CHATTER_BATCH_WAIT_MS", 20))
+CHATTER_CONDS_CACHE_SIZE = int(os.getenv("CHATTER_CONDS_CACHE_SIZE", 32))
+CHATTER_CONDS_CACHE_DIR = os.getenv("CHATTER_CONDS_CACHE_DIR", "")  # empty = memory only
+CHATTER_PREWARM_VOICES = os.getenv("CHATTER_PREWARM_VOICES", "")  # comma separated names, or "*"
 
 OUTPUT_DIR.mkdir(exist_ok=True)
 
-file_queue = queue.Queue()
-
 
 class Chatter:
-    def __init__(self):
-        self.model = None
-        self.is_running = False
+    def __init__(self, model=None, max_batch_size: int = CHATTER_BATCH_SIZE, max_wait_ms: float = CHATTER_BATCH_WAIT_MS):
+        """
+        Args:
+            model: Already loaded model, e.g. a stub for tests. Loaded on first use when omitted.
+            max_batch_size (int): Most queued messages generated together.
+            max_wait_ms (float): How long the first queued message waits for others to join its batch.
+        """
+        self.model = model
+        self._builtin_conds = getattr(model, "conds", None)
+        # The model holds the active voice in `model.conds`, so a voice switch and the generation
+        # that follows must not interleave with another one
+        self._model_lock = threading.RLock()
+        self.conditionals = ConditionalsCache(
+            self._compute_conditionals,
+            max_entries=CHATTER_CONDS_CACHE_SIZE,
+            directory=Path(CHATTER_CONDS_CACHE_DIR) if CHATTER_CONDS_CACHE_DIR else None,
+            load=self._load_conditionals if Chatter.available() else None,
+            save=lambda conds, path: conds.save(path)
+        )
+        # Messages with the same voice & settings share one model call
+        self.scheduler = BatchScheduler(
+            self.process_batch,
+            max_batch_size=max_batch_size,
+            max_wait=max_wait_ms / 1000,
+            group_key=lambda message: (message['voice'], message['exaggeration'], message['cfg_weight']),
+            name="chatter-batch"
+        )
 
-    def run_synchronously(self, text, voice=None, exaggeration=0.5, cfg_weight=0.5):
-        filename = f"{uuid.uuid4().hex}.wav"
-        output_path = OUTPUT_DIR / filename
+    @staticmethod
+    def available() -> bool:
+        return importlib.util.find_spec("chatterbox") is not None
 
+    @staticmethod
+    def device() -> str:
+        if CHATTER_DEVICE != "auto":
+            return CHATTER_DEVICE
+        torch = _torch()
+        return "cuda" if torch is not None and torch.cuda.is_available() else "cpu"
+
+    def load_model(self):
+        if self.model is None:
+            with self._model_lock:
+                if self.model is None:
+                    if not Chatter.available():
+                        raise RuntimeError("chatterbox-tts is not installed")
+                    device = Chatter.device()
+                    if device == "cpu" and CHATTER_CPU_THREADS > 0:
+                        _torch().set_num_threads(CHATTER_CPU_THREADS)
+                    logger.info("Loading the Chatterbox model on %s", device)
+                    ChatterboxTTS, _ = _chatterbox()
+                    model = ChatterboxTTS.from_pretrained(device=device)
+                    self._builtin_conds = model.conds
+                    self.model = model
+        return self.model
+
+    def _inference(self):
+        # No autograd bookkeeping: less memory and faster generation, on CPU especially
+        torch = _torch()
+        return torch.inference_mode() if torch is not None else nullcontext()
+
+    def _compute_conditionals(self, voice_path: str):
+        model = self.load_model()
+        with self._model_lock, self._inference():
+            model.prepare_conditionals(voice_path)
+            return model.conds
+
+    def _load_conditionals(self, path: Path):
+        _, Conditionals = _chatterbox()
+        return Conditionals.load(path, map_location=self.load_model().device)
+
+    def _use_voice(self, voice_path: Optional[str]):
+        """
+        Points the model at a voice, from the cache instead of re-embedding the reference file.
+        Must be called with the model lock held.
+        """
+        if voice_path is None:
+            self.model.conds = self._builtin_conds
+        else:
+            self.model.conds = self.conditionals.get(voice_path)
+
+    def prewarm(self, voices: Iterable[str]):
+        """
+        Computes (or loads from disk) the conditionals of the given voices ahead of the first request.
+        """
+        self.load_model()
+        for voice in voices:
+            self.conditionals.get(ChatterWrapper.find_voice(voice))
+
+    @staticmethod
+    def _to_audio(wav) -> np.ndarray:
+        # (1, samples) float tensor in [-1, 1]
+        return wav.squeeze(0).detach().cpu().numpy().astype(np.float32) * 32767
+
+    def generate_audio(self, text, voice=None, exaggeration=0.5, cfg_weight=0.5):
+        """
+        Generates speech in memory.
+
+        Returns:
+            Tuple[np.ndarray, int]: float32 mono samples in the 16-bit PCM range, and the sample rate.
+        """
         if voice is not None:
             voice = ChatterWrapper.find_voice(voice)
 
-        if self.model is None:
-            self.model = ChatterboxTTS.from_pretrained(device="cuda")
+        model = self.load_model()
+        with self._model_lock, self._inference():
+            self._use_voice(voice)
+            wav = model.generate(text, exaggeration=exaggeration, cfg_weight=cfg_weight)
 
-        wav = self.model.generate(text, audio_prompt_path=voice, exaggeration=exaggeration, cfg_weight=cfg_weight)
-        ta.save(output_path, wav, self.model.sr)
+        return self._to_audio(wav), model.sr
+
+    def run_synchronously(self, text, voice=None, exaggeration=0.5, cfg_weight=0.5):
+        filename = f"{uuid.uuid4().hex}.wav"
+        output_path = OUTPUT_DIR / filename
+
+        audio, framerate = self.generate_audio(text, voice, exaggeration, cfg_weight)
+        AudioFileUtils.audio_to_wav(audio, framerate, output_path)
 
         return output_path
 
-    def add_message(self, text, voice=None, exaggeration=0.5, cfg_weight=0.5):
+    def add_message(self, text, voice=None, exaggeration=0.5, cfg_weight=0.5, output_file=True) -> Future:
+        """
+        Queues a message for batched generation.
+
+        Returns:
+            Future: Resolved with the output Path, or with (audio, sample rate) when `output_file` is False.
+        """
         message = {
             'text': text,
             'voice': voice,
             'exaggeration': exaggeration,
-            'cfg_weight': cfg_weight
+            'cfg_weight': cfg_weight,
+            'output_file': output_file
         }
-        file_queue.put(message)
-        self.is_running = True
+        return self.scheduler.submit(message)
 
-    def process_loop(self):
-        while self.is_running:
-            if file_queue.empty():
-                time.sleep(1)
-                continue
+    def process_batch(self, messages: List[Dict[str, Any]]) -> List[Any]:
+        """
+        Generates a batch of queued messages sharing the same voice & settings, one after the
+        other with the model loaded and the voice switched once. Errors are returned per message.
+
+        ChatterboxTTS has no batched generation: a batch only saves the voice switches, the model
+        still runs the messages one at a time.
+        """
+        first = messages[0]
+        try:
+            voice = ChatterWrapper.find_voice(first['voice']) if first['voice'] is not None else None
+            model = self.load_model()
+        except Exception as e:
+            return [e] * len(messages)
+
+        settings = {
+            'exaggeration': first['exaggeration'],
+            'cfg_weight': first['cfg_weight'],
+        }
+        with self._model_lock, self._inference():
+            try:
+                self._use_voice(voice)
+            except Exception as e:
+                return [e] * len(messages)
 
-            message = file_queue.get()
-            if message is None:
+            wavs = []
+            for message in messages:
+                try:
+                    wavs.append(model.generate(message['text'], **settings))
+                except Exception as e:
+                    wavs.append(e)
+
+        results = []
+        for message, wav in zip(messages, wavs):
+            if isinstance(wav, Exception):
+                results.append(wav)
+                continue
+            audio = self._to_audio(wav)
+            if not message['output_file']:
+                results.append((audio, model.sr))
                 continue
+            output_path = OUTPUT_DIR / f"{uuid.uuid4().hex}.wav"
+            AudioFileUtils.audio_to_wav(audio, model.sr, output_path)
+            results.append(output_path)
+
+        return results
 
-            filename = f"{uuid.uuid4().hex}.wav"
-            output_path = OUTPUT_DIR / filename
+    def stats(self) -> Dict:
+        if self.model is not None:
+            device = str(getattr(self.model, "device", None))
+        else:
+            device = CHATTER_DEVICE if Chatter.available() else None  # resolving "auto" would import torch
+        return {
+            "available": Chatter.available(),
+            "loaded": self.model is not None,
+            "device": device,
+        }
 
-            if self.model is None:
-                self.model = ChatterboxTTS.from_pretrained(device="cuda")
-            if message.voice is None:
-                wav = self.model.generate(message.text)
-                ta.save(output_path, wav, self.model.sr)
-            pass
+    def stop(self):
+        self.scheduler.stop()
 
 
 class ChatterWrapper:
-    def __init__(self):
-        self.thread = None
-        self.chatter = Chatter()
-        # Start the processing thread
-        self.thread = threading.Thread(target=self.chatter.process_loop, daemon=True).start()
+    def __init__(self, chatter: Chatter = None, prewarm_voices: str = CHATTER_PREWARM_VOICES):
+        self.chatter = chatter or Chatter()
+        if prewarm_voices:
+            self.prewarm(self.list_voices() if prewarm_voices.strip() == "*" else prewarm_voices.split(","))
+
+    @staticmethod
+    def list_voices() -> List[str]:
+        return sorted(path.stem for path in VOICES_DIR.glob("*.wav"))
+
+    def prewarm(self, voices: Iterable[str]):
+        self.chatter.prewarm(voice.strip() for voice in voices if voice.strip())
 
     @staticmethod
     def find_voice(voice_name):
@@ -83,8 +269,58 @@ class ChatterWrapper:
             raise FileNotFoundError(f"Voice file '{voice_name}' not found in {VOICES_DIR}")
         return str(voice_path)
 
-    def add_message(self, text, voice=None, exaggeration=0.5, cfg_weight=0.5):
-        self.chatter.add_message(text, voice, exaggeration, cfg_weight)
+    def add_message(self, text, voice=None, exaggeration=0.5, cfg_weight=0.5, output_file=True) -> Future:
+        return self.chatter.add_message(text, voice, exaggeration, cfg_weight, output_file)
+
+    def generate_audio(self, text, voice=None, exaggeration=0.5, cfg_weight=0.5):
+        return self.chatter.generate_audio(text, voice, exaggeration, cfg_weight)
 
     def run_synchronously(self, text, voice=None, exaggeration=0.5, cfg_weight=0.5):
-        return self.chatter.run_synchronously(text, voice, exaggeration, cfg_weight)
\ No newline at end of file
+        return self.chatter.run_synchronously(text, voice, exaggeration, cfg_weight)
+
+    def stats(self) -> Dict:
+        return self.chatter.stats()
+
+
+_wrapper: Optional[ChatterWrapper] = None
+_wrapper_lock = threading.Lock()
+
+
+def get_chatter() -> ChatterWrapper:
+    """
+    Returns the process-wide wrapper, so the model is loaded once and shared by every request.
+    """
+    global _wrapper
+
+    if _wrapper is None:
+        with _wrapper_lock:
+            if _wrapper is None:
+                _wrapper = ChatterWrapper()
+
+    return _wrapper
+
+
+def preload_chatter() -> None:
+    """
+    Loads the model (and prepares the CHATTER_PREWARM_VOICES) ahead of the first request.
+    Failures are logged, not raised: the server still serves piper.
+    """
+    if not Chatter.available():
+        logger.info("chatterbox-tts not installed, the chatterbox model is unavailable")
+        return
+    start = time.perf_counter()
+    try:
+        get_chatter().chatter.load_model()
+    except Exception:
+        logger.exception("Loading the Chatterbox model failed")
+        return
+    logger.info("Chatterbox model loaded in %.1f s", time.perf_counter() - start)
+
+
+def chatter_stats() -> Dict:
+    """
+    Stats of the process-wide wrapper, without creating it (which would load the prewarm voices).
+    """
+    if _wrapper is not None:
+        return _wrapper.stats()
+    return {"available": Chatter.available(), "loaded": False, "device": None}
@@ -1,16 +1,44 @@
 import argparse
-import time
-
-from chatter import ChatterWrapper
-from tts import synthesize_text
-from audio_utils import to_portable_file
-from audio_file_utils import AudioFileUtils
-from effects.chain_processor import EffectChainProcessor
 import json
+import logging
+import uuid
+
+# The synthesis backends are imported in `render`, only for the model asked for: chatterbox
+# pulls in torch, which takes seconds to import
+
+def render(options: dict) -> str:
+    """
+    Synthesizes the text of the CLI options (`vars()` of the parsed arguments) and returns the
+    path of the WAV file written.
+    """
+    from synthesis import generate_audio, process_audio, lite_settings
+    from audio_file_utils import AudioFileUtils
+    from tts import OUTPUT_DIR
+
+    effects_data = None
+    if options["effects"]:
+        # Parse effects JSON
+        effects_data = json.loads(options["effects"])
+        if not isinstance(effects_data, list):
+            raise ValueError("Effects should be a JSON array of effect steps")
+
+    lite_rate, lite_sample_width = lite_settings({"lite_rate": options["lite_rate"], "lite_sample_width": options["lite_sample_width"]})
+    sampwidth = lite_sample_width if options["lite_file"] else 2
+
+    # Chatterbox runs on the process-wide model, loaded once per process (or once per daemon)
+    audio, framerate = generate_audio(options)
+
+    # Effects and portable conversion run in memory, the file is written once
+    audio, framerate = process_audio(audio, framerate, effects_data, options["lite_file"], lite_rate)
+
+    # generate random file name
+    output_file = OUTPUT_DIR / f"{uuid.uuid4().hex}.wav"
+    AudioFileUtils.audio_to_wav(audio, framerate, output_file, sampwidth)
+    return str(output_file)
 
 def main():
     parser = argparse.ArgumentParser(description="Test TTS Synthesis with Piper")
-    parser.add_argument("text", help="Text to synthesize")
+    parser.add_argument("text", nargs="?", help="Text to synthesize")
 
     parser.add_argument("--model", default="piper", help="Model used to generate audio (default: Piper) - options: piper, chatterbox")
 
@@ -20,6 +48,7 @@ def main():
     parser.add_argument("--silence", type=int, default=1, help="Silence length (default: 1)")
     parser.add_argument("--speed", type=float, default=1.0, help="Speech speed (default: 1.0)")
     parser.add_argument("--noise_w", type=float, default=0.8, help="Noise weight (default: 0.8)")
+    parser.add_argument("--parallel-sentences", action='store_true', help="Synthesize the sentences concurrently")
 
 
     # parameters for Chatterbox exaggeration float 0-1 (default: 0.5), cfg_weight float 0-1 (default: 0.5), prompt string (default: None)
@@ -29,53 +58,47 @@ def main():
 
     # add a param --lite-file without value
     parser.add_argument("--lite-file", action='store_true', help="Convert to portable file format")
+    parser.add_argument("--lite-rate", type=int, default=48000, help="Sample rate of the portable file (default: 48000)")
+    parser.add_argument("--lite-sample-width", type=int, default=2, help="Sample width of the portable file in bytes: 1, 2 or 3 (default: 2)")
     # optionnal param of json data called --effects
     parser.add_argument("--effects", type=str, default=None, help="Effects to apply to the audio")
 
+    # daemon mode: the models stay loaded in a background process between calls
+    parser.add_argument("--daemon", action='store_true', help="Run through the background daemon, started on first use")
+    parser.add_argument("--stop-daemon", action='store_true', help="Stop the background daemon")
+    parser.add_argument("--serve-daemon", action='store_true', help=argparse.SUPPRESS)
 
     args = parser.parse_args()
 
+    if args.serve_daemon:
+        import cli_daemon
+        logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(name)s: %(message)s")
+        cli_daemon.serve(render)
+        return
+
+    if args.stop_daemon:
+        import cli_daemon
+        try:
+            cli_daemon.request({"command": "stop"})
+            print("Daemon stopped")
+        except OSError:
+            print("No daemon running")
+        return
+
+    if args.text is None:
+        parser.error("the following arguments are required: text")
+
+    options = vars(args)
     try:
-        if args.model == "chatterbox":
-            # generate random file name
-            chatter_wrapper = ChatterWrapper()
-            output_file = chatter_wrapper.run_synchronously(
-                text=args.text,
-                exaggeration=args.exaggeration,
-                cfg_weight=args.cfg_weight,
-                voice=args.prompt
-            )
+        if args.daemon:
+            import cli_daemon
+            cli_daemon.ensure_daemon()
+            answer = cli_daemon.request({"command": "render", "args": options, "environment": cli_daemon.environment()})
+            if not answer["ok"]:
+                raise RuntimeError(answer["error"])
+            output_file = answer["output"]
         else:
-            output_file = synthesize_text(
-                text=args.text,
-                local=args.local,
-                voice=args.voice,
-                silence=args.silence,
-                speed=args.speed,
-                noise_w=args.noise_w
-            )
-
-        if args.effects:
-            # Parse effects JSON
-            effects_data = json.loads(args.effects)
-            if not isinstance(effects_data, list):
-                raise ValueError("Effects should be a JSON array of effect steps")
-
-            # Load audio
-            audio, framerate = AudioFileUtils.wav_to_audio(output_file)
-
-            # Process chain
-            processor = EffectChainProcessor()
-            audio = processor.apply_chain(audio, framerate, effects_data)
-
-            # Save result
-            AudioFileUtils.audio_to_wav(audio, framerate, output_file)
-
-        if args.lite_file:
-            to_portable_file(output_file, output_file)
-
-
-
+            output_file = render(options)
 
         print(f"Audio file generated: {output_file}")
     except Exception as e:
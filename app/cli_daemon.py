@@ -0,0 +1,210 @@
+import os
+import sys
+import json
+import time
+import fcntl
+import socket
+import logging
+import subprocess
+import socketserver
+import threading
+from pathlib import Path
+from typing import Any, Callable, Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+CLI_DAEMON_SOCKET = Path(os.getenv(
+    "CLI_DAEMON_SOCKET",
+    Path(os.getenv("XDG_RUNTIME_DIR") or "/tmp") / f"webpiper-cli-{os.getuid()}.sock"
+))
+CLI_DAEMON_IDLE_SECONDS = float(os.getenv("CLI_DAEMON_IDLE_SECONDS", 900))  # exits after this long without requests
+CLI_DAEMON_START_TIMEOUT = float(os.getenv("CLI_DAEMON_START_TIMEOUT", 30))
+
+# One JSON document per line each way
+_MAX_LINE = 16 * 1024 * 1024
+
+# Settings the app modules read from the environment when imported: a daemon started with other
+# values would keep rendering with its own
+_ENV_PREFIXES = ("OUTPUT_PATH", "VOICE_", "CHATTER_", "PIPER_", "SENTENCE_", "WAV_")
+
+
+class DaemonError(Exception):
+    pass
+
+
+def _send(stream, message: Dict[str, Any]) -> None:
+    stream.write(json.dumps(message).encode("utf-8") + b"\n")
+    stream.flush()
+
+
+def _receive(stream) -> Dict[str, Any]:
+    line = stream.readline(_MAX_LINE)
+    if not line:
+        raise DaemonError("Connection closed by the daemon")
+    return json.loads(line)
+
+
+def request(message: Dict[str, Any], socket_path: Path = CLI_DAEMON_SOCKET) -> Dict[str, Any]:
+    """
+    Sends one request to a running daemon and returns its answer.
+
+    Raises:
+        OSError: No daemon listening on the socket.
+    """
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+        sock.connect(str(socket_path))
+        with sock.makefile("rwb") as stream:
+            _send(stream, message)
+            return _receive(stream)
+
+
+def environment() -> Dict[str, Any]:
+    """
+    What a render depends on besides its options: the app settings of the environment, and the
+    working directory relative paths are resolved against.
+    """
+    return {
+        "cwd": os.getcwd(),
+        "env": {name: value for name, value in sorted(os.environ.items()) if name.startswith(_ENV_PREFIXES)},
+    }
+
+
+def status(socket_path: Path = CLI_DAEMON_SOCKET) -> Optional[Dict[str, Any]]:
+    """
+    Answer of the daemon to a ping (its pid and environment), None when none is running.
+    """
+    try:
+        answer = request({"command": "ping"}, socket_path)
+    except (OSError, ValueError, DaemonError):
+        return None
+    return answer if answer.get("ok") else None
+
+
+def ping(socket_path: Path = CLI_DAEMON_SOCKET) -> bool:
+    return status(socket_path) is not None
+
+
+def ensure_daemon(socket_path: Path = CLI_DAEMON_SOCKET, timeout: float = CLI_DAEMON_START_TIMEOUT) -> None:
+    """
+    Starts the daemon in the background unless one with the environment of this call already
+    answers on the socket, and waits until it does. A daemon started from another environment
+    (other OUTPUT_PATH, VOICE_PATH, CHATTER_* settings or working directory) is stopped and
+    replaced. A lock file keeps concurrent CLI calls from starting several daemons.
+    """
+    expected = environment()
+    running = status(socket_path)
+    if running is not None and running.get("environment") == expected:
+        return
+
+    with open(f"{socket_path}.lock", "w") as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        running = status(socket_path)
+        if running is not None:
+            if running.get("environment") == expected:
+                return
+            logger.info("Restarting the CLI daemon %s, started from another environment", running.get("pid"))
+            _stop(socket_path, timeout)
+
+        with open(f"{socket_path}.log", "ab") as log:
+            subprocess.Popen(
+                [sys.executable, str(Path(__file__).with_name("cli.py")), "--serve-daemon"],
+                stdin=subprocess.DEVNULL,
+                stdout=log,
+                stderr=log,
+                env=dict(os.environ, CLI_DAEMON_SOCKET=str(socket_path)),
+                start_new_session=True  # outlives this CLI call and its terminal
+            )
+
+        deadline = time.monotonic() + timeout
+        while not ping(socket_path):
+            if time.monotonic() > deadline:
+                raise DaemonError(f"The daemon did not start within {timeout:.0f}s, see {socket_path}.log")
+            time.sleep(0.05)
+
+
+def _stop(socket_path: Path, timeout: float) -> None:
+    try:
+        request({"command": "stop"}, socket_path)
+    except (OSError, ValueError, DaemonError):
+        return
+    deadline = time.monotonic() + timeout
+    while ping(socket_path):
+        if time.monotonic() > deadline:
+            raise DaemonError(f"The daemon on {socket_path} did not stop within {timeout:.0f}s")
+        time.sleep(0.05)
+
+
+class _Handler(socketserver.StreamRequestHandler):
+    def handle(self):
+        try:
+            message = _receive(self.rfile)
+        except (ValueError, DaemonError):
+            return
+        self.server.last_request = time.monotonic()
+
+        command = message.get("command")
+        if command == "ping":
+            _send(self.wfile, {"ok": True, "pid": os.getpid(), "environment": self.server.environment})
+        elif command == "stop":
+            _send(self.wfile, {"ok": True})
+            self.server.stopping = True
+        elif command == "render" and message.get("environment") != self.server.environment:
+            # Replaced by another caller between its ensure_daemon and this request
+            _send(self.wfile, {"ok": False, "error": "The daemon runs with another environment, try again"})
+        elif command == "render":
+            with self.server.lock:
+                self.server.rendering += 1
+            try:
+                output = self.server.render(message["args"])
+            except Exception as e:
+                _send(self.wfile, {"ok": False, "error": str(e)})
+            else:
+                _send(self.wfile, {"ok": True, "output": str(output)})
+            finally:
+                with self.server.lock:
+                    self.server.rendering -= 1
+        else:
+            _send(self.wfile, {"ok": False, "error": f"Unknown command: {command}"})
+        self.server.last_request = time.monotonic()
+
+
+class _Server(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+
+def serve(render: Callable[[Dict[str, Any]], Any], socket_path: Path = CLI_DAEMON_SOCKET,
+          idle_seconds: float = CLI_DAEMON_IDLE_SECONDS) -> None:
+    """
+    Answers CLI requests on a Unix socket until stopped or idle for `idle_seconds`. The models
+    loaded by `render` stay in memory from one request to the next.
+    """
+    if ping(socket_path):
+        logger.info("A daemon already listens on %s", socket_path)
+        return
+    socket_path.unlink(missing_ok=True)  # left by a daemon that did not exit cleanly
+
+    previous_umask = os.umask(0o177)  # the socket is for this user only
+    try:
+        server = _Server(str(socket_path), _Handler)
+    finally:
+        os.umask(previous_umask)
+
+    server.render = render
+    server.environment = environment()
+    server.stopping = False
+    server.last_request = time.monotonic()
+    server.rendering = 0  # requests in progress, the daemon is not idle while there are some
+    server.lock = threading.Lock()
+    server.timeout = 1.0
+    logger.info("CLI daemon %d listening on %s", os.getpid(), socket_path)
+    try:
+        while not server.stopping and (server.rendering or time.monotonic() - server.last_request < idle_seconds):
+            server.handle_request()
+    finally:
+        # Unlinked before closing, so a daemon started right away can't lose its socket to this one
+        socket_path.unlink(missing_ok=True)
+        server.server_close()
+        # Renders already accepted finish, new calls go to the next daemon
+        while server.rendering:
+            time.sleep(0.05)
+        logger.info("CLI daemon %d stopped", os.getpid())
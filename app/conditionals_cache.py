@@ -0,0 +1,123 @@
+import hashlib
+import logging
+import os
+import threading
+from collections import OrderedDict
+from pathlib import Path
+from typing import Any, Callable, Dict, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+
+class ConditionalsCache:
+    """
+    Caches what a voice-cloning model computes from a reference recording (speaker embedding,
+    prompt tokens...), so a voice file is loaded, resampled and embedded once instead of on
+    every request.
+
+    Entries are keyed on the file path plus its mtime and size, so replacing a voice file
+    invalidates its entry. At most `max_entries` are kept in memory (least recently used goes
+    first); with a `directory` and `load`/`save` functions they are also persisted there and
+    survive restarts.
+    """
+
+    def __init__(
+        self,
+        compute: Callable[[str], Any],
+        max_entries: int = 32,
+        directory: Optional[Path] = None,
+        load: Optional[Callable[[Path], Any]] = None,
+        save: Optional[Callable[[Any, Path], None]] = None
+    ):
+        self.compute = compute
+        self.max_entries = max(1, max_entries)
+        self.directory = Path(directory) if directory and load and save else None
+        self.load = load
+        self.save = save
+
+        self._entries: "OrderedDict[Tuple, Any]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._hits = 0
+        self._misses = 0
+        self._disk_hits = 0
+
+        if self.directory is not None:
+            self.directory.mkdir(parents=True, exist_ok=True)
+
+    @staticmethod
+    def key(voice_path: str) -> Tuple[str, int, int]:
+        path = Path(voice_path).resolve()
+        stat = path.stat()
+        return str(path), stat.st_mtime_ns, stat.st_size
+
+    def _disk_path(self, key: Tuple) -> Path:
+        digest = hashlib.sha256(repr(key).encode("utf-8")).hexdigest()
+        return self.directory / f"{digest}.pt"
+
+    def get(self, voice_path: str) -> Any:
+        """
+        Returns the conditionals for a voice file, computing them on a miss.
+        """
+        key = self.key(voice_path)
+
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                self._hits += 1
+                return self._entries[key]
+            self._misses += 1
+
+        conditionals = self._load_from_disk(key)
+        if conditionals is None:
+            conditionals = self.compute(key[0])
+            self._save_to_disk(key, conditionals)
+
+        with self._lock:
+            self._entries[key] = conditionals
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+        return conditionals
+
+    def _load_from_disk(self, key: Tuple) -> Any:
+        if self.directory is None:
+            return None
+        path = self._disk_path(key)
+        if not path.exists():
+            return None
+        try:
+            conditionals = self.load(path)
+        except Exception as e:
+            logger.warning("Ignoring unreadable conditionals %s: %s", path, e)
+            return None
+        with self._lock:
+            self._disk_hits += 1
+        return conditionals
+
+    def _save_to_disk(self, key: Tuple, conditionals: Any):
+        if self.directory is None:
+            return
+        path = self._disk_path(key)
+        tmp_path = path.with_name(f"{path.name}.tmp")
+        try:
+            self.save(conditionals, tmp_path)
+            os.replace(tmp_path, path)
+        except Exception as e:
+            logger.warning("Could not persist conditionals %s: %s", path, e)
+            tmp_path.unlink(missing_ok=True)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "hits": self._hits,
+                "misses": self._misses,
+                "disk_hits": self._disk_hits,
+                "persistent": self.directory is not None,
+            }
@@ -0,0 +1,50 @@
+from itertools import cycle
+from typing import Sequence
+
+import numpy as np
+
+
+class BlockProcessor:
+    """
+    Stateful, block by block version of an effect: `process` takes the next block of audio and
+    returns the output that is ready so far, `flush` ends the stream and returns the rest.
+    Delay lines, oscillator phases and resampler positions are carried from one block to the
+    next, so the concatenated output matches the whole-array function, whatever the block sizes.
+
+    A processor is built for one stream: create a new one for the next clip.
+    """
+
+    def process(self, block: np.ndarray) -> np.ndarray:
+        raise NotImplementedError
+
+    def flush(self) -> np.ndarray:
+        return np.zeros(0, dtype=np.float32)
+
+    def run(self, audio: np.ndarray, block_sizes: Sequence[int] = ()) -> np.ndarray:
+        """
+        Whole clip in one block, then flush. With `block_sizes`, the clip is fed in blocks of
+        those sizes, repeated until it is consumed (e.g. (1024,), or uneven (37, 4410, 1)).
+        """
+        if not block_sizes:
+            head = self.process(audio)
+            tail = self.flush()
+            return np.concatenate((head, tail)) if len(tail) else head
+
+        output = []
+        start = 0
+        for size in cycle(block_sizes):
+            if start >= len(audio):
+                break
+            output.append(self.process(audio[start:start + size]))
+            start += size
+        output.append(self.flush())
+        return np.concatenate(output)
+
+
+class Passthrough(BlockProcessor):
+    """
+    Copies its input (the block version of a no-op effect).
+    """
+
+    def process(self, block: np.ndarray) -> np.ndarray:
+        return np.array(block, dtype=np.float32)
@@ -1,22 +1,224 @@
+import json
+import time
+import inspect
+import logging
 import numpy as np
-from typing import List, Dict, Any
-from .flanger import apply_flanger
-from .normalize import apply_normalize
-from .pitch_shift import apply_pitch_shift
-from .random_semitone_sawtooth_wave import apply_effect
-from .speed_change import apply_speed_change
+from dataclasses import dataclass
+from functools import lru_cache
+from typing import List, Dict, Any, Callable, Tuple
+from .block_processor import BlockProcessor
+from .flanger import FlangerProcessor, apply_flanger
+from .normalize import NormalizeProcessor, apply_normalize, apply_normalize_inplace
+from .pitch_shift import PitchShiftProcessor, apply_pitch_shift
+from .random_semitone_sawtooth_wave import RandomSemitoneSawtoothWaveProcessor, apply_effect, apply_effect_inplace
+from .speed_change import SpeedChangeProcessor, apply_speed_change
+from metrics import record_effect
+
+logger = logging.getLogger(__name__)
+
+# Mapping from effect name to its corresponding module & function
+EFFECT_MAP: Dict[str, Callable] = {
+    "flanger": apply_flanger,
+    "normalize": apply_normalize,
+    "pitch_shift": apply_pitch_shift,
+    "random_semitone_sawtooth_wave": apply_effect,
+    "speed_change": apply_speed_change,
+}
+
+# Point-wise effects that can overwrite the work buffer instead of allocating a new one
+INPLACE_EFFECT_MAP: Dict[str, Callable] = {
+    "normalize": apply_normalize_inplace,
+    "random_semitone_sawtooth_wave": apply_effect_inplace,
+}
+
+# Block versions of the effects, built with (framerate, **params)
+BLOCK_PROCESSOR_MAP: Dict[str, Callable[..., BlockProcessor]] = {
+    "flanger": FlangerProcessor,
+    "normalize": NormalizeProcessor,
+    "pitch_shift": PitchShiftProcessor,
+    "random_semitone_sawtooth_wave": RandomSemitoneSawtoothWaveProcessor,
+    "speed_change": SpeedChangeProcessor,
+}
+
+
+@dataclass(frozen=True)
+class PlanStep:
+    name: str
+    func: Callable
+    params: Dict[str, Any]
+    inplace: bool = False
+
+
+def _bind_params(name: str, params: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Validates effect params against the effect signature and fills in the defaults.
+    """
+    signature = inspect.signature(EFFECT_MAP[name])
+    try:
+        bound = signature.bind(None, None, **params)
+    except TypeError as e:
+        raise ValueError(f"Invalid params for effect {name}: {e}") from e
+    bound.apply_defaults()
+    params = {key: value for key, value in list(bound.arguments.items())[2:]}
+    # Checked per step: once merged, two invalid speeds can multiply to a valid factor
+    if name == "speed_change" and not 1.0 + params["speed"] > 0:
+        raise ValueError(f"Invalid params for effect {name}: speed factor must be > 0")
+    return params
+
+
+def _is_noop(name: str, params: Dict[str, Any]) -> bool:
+    if name == "pitch_shift":
+        return params["pitch_change"] == 0
+    if name == "speed_change":
+        return params["speed"] == 0
+    if name == "random_semitone_sawtooth_wave":
+        return params["wet"] == 0
+    if name == "flanger":
+        return params["wet"] == 0 and params["dry"] == 1
+    return False
+
+
+def _merge(previous: Tuple[str, Dict[str, Any]], current: Tuple[str, Dict[str, Any]]):
+    """
+    Fuses two consecutive steps when a single one does the same job, or returns None.
+    """
+    name, params = current
+    if previous[0] != name:
+        return None
+    if name == "speed_change":
+        # Two resamplings by (1 + a) then (1 + b) are one resampling by (1 + a) * (1 + b)
+        factor = (1.0 + previous[1]["speed"]) * (1.0 + params["speed"])
+        return name, {"speed": factor - 1.0}
+    if name == "pitch_shift":
+        # Pitch changes are in hundredths of an octave, they add up
+        return name, {"pitch_change": previous[1]["pitch_change"] + params["pitch_change"]}
+    return None
+
+
+@lru_cache(maxsize=256)
+def _build_plan(chain_json: str) -> Tuple[PlanStep, ...]:
+    steps: List[Tuple[str, Dict[str, Any]]] = []
+
+    for effect_conf in json.loads(chain_json):
+        effect_name = effect_conf.get("name")
+        if effect_name not in EFFECT_MAP:
+            raise ValueError(f"Unknown effect: {effect_name}")
+
+        step = (effect_name, _bind_params(effect_name, effect_conf.get("params") or {}))
+        merged = _merge(steps[-1], step) if steps else None
+        if merged is not None:
+            steps[-1] = merged
+        else:
+            steps.append(step)
+
+    return tuple(
+        PlanStep(
+            name=name,
+            func=INPLACE_EFFECT_MAP.get(name, EFFECT_MAP[name]),
+            params=params,
+            inplace=name in INPLACE_EFFECT_MAP
+        )
+        for name, params in steps
+        if not _is_noop(name, params)
+    )
+
+
+def _log_step(name: str, params: Dict[str, Any], samples: int, elapsed: float) -> None:
+    record_effect(name, elapsed)
+    logger.info(
+        "Applied effect %s",
+        name,
+        extra={
+            "effect": name,
+            "params": params,
+            "samples": samples,
+            "duration_ms": round(elapsed * 1000, 3),
+        }
+    )
+
+
+class ChainBlockProcessor(BlockProcessor):
+    """
+    Runs a compiled plan block by block, through the block processor of each step. The output
+    of a step's `flush` goes through the `process` and `flush` of the following steps.
+    The time spent in each step is recorded once, on flush.
+    """
+
+    def __init__(self, plan: Tuple[PlanStep, ...], framerate: int):
+        self.plan = plan
+        self.processors = [BLOCK_PROCESSOR_MAP[step.name](framerate, **step.params) for step in plan]
+        self._seconds = [0.0] * len(plan)
+        self._samples = [0] * len(plan)
+
+    def process(self, block: np.ndarray) -> np.ndarray:
+        work = np.asarray(block, dtype=np.float32)
+        for i, processor in enumerate(self.processors):
+            if not len(work):
+                break
+            self._samples[i] += len(work)
+            start = time.perf_counter()
+            work = processor.process(work)
+            self._seconds[i] += time.perf_counter() - start
+        return work
+
+    def flush(self) -> np.ndarray:
+        work = np.zeros(0, dtype=np.float32)
+        for i, (step, processor) in enumerate(zip(self.plan, self.processors)):
+            self._samples[i] += len(work)
+            start = time.perf_counter()
+            head = processor.process(work) if len(work) else work
+            tail = processor.flush()
+            work = np.concatenate((head, tail)) if len(tail) else head
+            self._seconds[i] += time.perf_counter() - start
+            _log_step(step.name, step.params, self._samples[i], self._seconds[i])
+        return work
 
 
 class EffectChainProcessor:
     def __init__(self):
         # Mapping from effect name to its corresponding module & function
-        self.effect_map = {
-            "flanger": apply_flanger,
-            "normalize": apply_normalize,
-            "pitch_shift": apply_pitch_shift,
-            "random_semitone_sawtooth_wave": apply_effect,
-            "speed_change": apply_speed_change,
-        }
+        self.effect_map = EFFECT_MAP
+        self.block_processor_map = BLOCK_PROCESSOR_MAP
+        # Effects whose block processor returns its output as the blocks come (normalize
+        # needs the whole clip), so a stream can be processed as it is produced
+        self.streamable_effects = set(EFFECT_MAP) - {"normalize"}
+        # Effects drawing from a random generator, reproducible only with a `seed`
+        self.random_effects = {"random_semitone_sawtooth_wave"}
+
+    def plan(self, chain: List[Dict[str, Any]]) -> Tuple[PlanStep, ...]:
+        """
+        Validates a chain and compiles it to a list of steps: params are bound once,
+        no-op steps are dropped and consecutive resamplings are merged.
+        Plans are cached by the chain JSON.
+
+        Raises:
+            ValueError: Unknown effect or invalid params.
+        """
+        return _build_plan(json.dumps(chain, sort_keys=True))
+
+    def can_stream(self, chain: List[Dict[str, Any]]) -> bool:
+        """
+        Tells whether the chain's block processor returns output before the end of the stream.
+        """
+        return all(step.name in self.streamable_effects for step in self.plan(chain))
+
+    def is_deterministic(self, chain: List[Dict[str, Any]]) -> bool:
+        """
+        Tells whether the chain always gives the same output for the same input, i.e. has no
+        random effect without a seed.
+        """
+        return not any(step.name in self.random_effects and step.params["seed"] is None for step in self.plan(chain))
+
+    def block_processor(self, chain: List[Dict[str, Any]], framerate: int) -> ChainBlockProcessor:
+        """
+        Block by block version of `apply_chain`, for audio that arrives in pieces: feed it with
+        `process(block)` and end with `flush()`. The concatenated output matches `apply_chain`
+        on the whole clip, up to float rounding.
+
+        Raises:
+            ValueError: Unknown effect or invalid params.
+        """
+        return ChainBlockProcessor(self.plan(chain), framerate)
 
     def apply_chain(self, audio: np.ndarray, framerate: int, chain: List[Dict[str, Any]]) -> np.ndarray:
         """
@@ -30,16 +232,22 @@ class EffectChainProcessor:
         Returns:
             np.ndarray: Processed audio.
         """
-        for effect_conf in chain:
-            effect_name = effect_conf.get("name")
-            params = effect_conf.get("params", {})
+        return self.run_plan(self.plan(chain), audio, framerate)
 
-            if effect_name not in self.effect_map:
-                raise ValueError(f"Unknown effect: {effect_name}")
+    def run_plan(self, plan: Tuple[PlanStep, ...], audio: np.ndarray, framerate: int) -> np.ndarray:
+        """
+        Runs a compiled plan. The input is copied once into a float32 work buffer, which
+        point-wise steps then modify in place.
+        """
+        work = np.array(audio, dtype=np.float32)
 
-            effect_func = self.effect_map[effect_name]
+        for step in plan:
+            start = time.perf_counter()
+            if step.inplace:
+                step.func(work, framerate, **step.params)
+            else:
+                work = np.asarray(step.func(work, framerate, **step.params), dtype=np.float32)
 
-            print(f"Applying effect: {effect_name} with params {params}")
-            audio = effect_func(audio, framerate, **params)
+            _log_step(step.name, step.params, len(work), time.perf_counter() - start)
 
-        return audio
+        return work
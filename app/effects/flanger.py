@@ -1,6 +1,6 @@
 import numpy as np
-import math
 import time
+from .block_processor import BlockProcessor
 
 def apply_flanger(
     audio: np.ndarray,
@@ -12,35 +12,119 @@ def apply_flanger(
     t_offset: float = 0,
     t_offset_func=None,
     dry: float = 0.5,
-    wet: float = 0.5
+    wet: float = 0.5,
+    wall_clock: bool = False
 ) -> np.ndarray:
-    num_samples = len(audio)
-    delay_buffer_size = int(max_delay * framerate) + 2
-    delay_buffer = np.zeros(delay_buffer_size, dtype=np.float32)
+    """
+    Applies a feedback flanger: a delay line swept by a sine LFO between `min_delay` and `max_delay`.
 
-    output = np.zeros(num_samples, dtype=np.float32)
+    The LFO is computed for the whole block at once, and the feedback recursion runs in steps
+    no longer than the shortest upcoming delay, so every sample read from the delay line within
+    a step was written by a previous step.
 
-    if t_offset_func is None:
-        t_offset_func = lambda: time.time()
+    Args:
+        audio (np.ndarray): Mono audio samples.
+        framerate (int): Sample rate (Hz).
+        rate (float): LFO rate in Hz.
+        min_delay (float): Minimum delay in seconds.
+        max_delay (float): Maximum delay in seconds.
+        feedback (float): Amount of delayed signal fed back into the delay line.
+        t_offset (float): Static time offset of the LFO phase, in seconds.
+        t_offset_func (callable): Optional extra offset, evaluated once per call.
+        dry (float): Dry signal level.
+        wet (float): Wet signal level.
+        wall_clock (bool): Add the current time to the LFO phase, so successive calls
+            start at different points of the sweep. Off by default to keep the output deterministic.
 
-    for n in range(num_samples):
-        lfo_phase = 2 * math.pi * rate * (n / framerate + t_offset + t_offset_func())
-        delay_time = min_delay + (max_delay - min_delay) * (0.5 * (1 + math.sin(lfo_phase)))
+    Returns:
+        np.ndarray: Flanged audio (float32, same length).
+    """
+    return FlangerProcessor(
+        framerate, rate, min_delay, max_delay, feedback, t_offset, t_offset_func, dry, wet, wall_clock
+    ).process(audio)
 
-        delay_samples = int(delay_time * framerate)
 
-        # Circular buffer indices
-        read_index = (n - delay_samples) % delay_buffer_size
-        write_index = n % delay_buffer_size
+class FlangerProcessor(BlockProcessor):
+    """
+    Block version of `apply_flanger` (which runs it on the whole clip): the delay line and the
+    LFO phase carry over from one block to the next. The time offset is evaluated once, when
+    the processor is created.
+    """
 
-        delayed_sample = delay_buffer[read_index]
+    def __init__(
+        self,
+        framerate: int,
+        rate: float = 0.15,
+        min_delay: float = 0.0025,
+        max_delay: float = 0.0035,
+        feedback: float = 0.9,
+        t_offset: float = 0,
+        t_offset_func=None,
+        dry: float = 0.5,
+        wet: float = 0.5,
+        wall_clock: bool = False
+    ):
+        self.framerate = framerate
+        self.min_delay = min_delay
+        self.max_delay = max_delay
+        self.feedback = feedback
+        self.dry = dry
+        self.wet = wet
+        self.delay_buffer_size = int(max_delay * framerate) + 2
 
-        # Write current sample to buffer (with feedback)
-        delay_buffer[write_index] = audio[n] + feedback * delayed_sample
+        if t_offset_func is None:
+            t_offset_func = (lambda: time.time()) if wall_clock else (lambda: 0.0)
+        self._t_offset = t_offset
+        self._extra_offset = t_offset_func()
+        self._rate = rate
+        # Samples processed so far: the LFO is an exact sine of the position in the clip. A table
+        # lookup (effects/oscillators.py) moves the integer delay at rounding boundaries, and the
+        # feedback then amplifies the difference.
+        self._position = 0
 
-        # Mix dry and wet signals
-        output[n] = dry * audio[n] + wet * delayed_sample
+        # Last delay_buffer_size samples written to the delay line, silence at first
+        self._tail = np.zeros(self.delay_buffer_size, dtype=np.float32)
+
+    def process(self, block: np.ndarray) -> np.ndarray:
+        audio = np.asarray(block, dtype=np.float32)
+        num_samples = len(audio)
+        delay_buffer_size = self.delay_buffer_size
+        feedback = self.feedback
+
+        n = np.arange(num_samples)
+        lfo_phase = 2 * np.pi * self._rate * ((self._position + n) / self.framerate + self._t_offset + self._extra_offset)
+        self._position += num_samples
+        delay_time = self.min_delay + (self.max_delay - self.min_delay) * (0.5 * (1 + np.sin(lfo_phase)))
+        delay_samples = (delay_time * self.framerate).astype(np.int64)
+
+        # A zero delay reads the slot about to be overwritten in the circular buffer,
+        # i.e. the sample written a whole buffer length ago
+        delay_samples[delay_samples <= 0] = delay_buffer_size
 
-    return output
+        # Delay line history, prefixed with the last buffer length of the previous blocks
+        history = np.empty(delay_buffer_size + num_samples, dtype=np.float32)
+        history[:delay_buffer_size] = self._tail
+        read_positions = n + delay_buffer_size - delay_samples
 
+        if feedback == 0:
+            history[delay_buffer_size:] = audio
+            delayed = history[read_positions]
+        else:
+            delayed = np.empty(num_samples, dtype=np.float32)
+            start = 0
+            while start < num_samples:
+                # Delays never exceed the buffer size, so the shortest delay over the next buffer
+                # length is a safe block size
+                block_size = int(delay_samples[start:start + delay_buffer_size].min())
+                end = min(start + block_size, num_samples)
+                delayed[start:end] = history[read_positions[start:end]]
+                history[delay_buffer_size + start:delay_buffer_size + end] = audio[start:end] + feedback * delayed[start:end]
+                start = end
+
+        self._tail = history[num_samples:].copy()
+
+        # Mix dry and wet signals
+        output = np.empty(num_samples, dtype=np.float32)
+        output[:] = self.dry * audio + self.wet * delayed
 
+        return output
@@ -1,5 +1,7 @@
 import numpy as np
 
+from .block_processor import BlockProcessor
+
 
 def apply_normalize(
         audio: np.ndarray,
@@ -17,17 +19,50 @@ def apply_normalize(
     Returns:
         np.ndarray: Normalized audio signal.
     """
+    return apply_normalize_inplace(audio.astype(np.float32), framerate, max_amplitude)
+
+
+def apply_normalize_inplace(
+        audio: np.ndarray,
+        framerate: int,
+        max_amplitude: float = 32767.0
+) -> np.ndarray:
+    """
+    Same as apply_normalize, but overwrites `audio` (a float array) instead of allocating a new one.
+
+    Returns:
+        np.ndarray: `audio`, normalized.
+    """
     # Remove DC offset
-    mean_value = np.mean(audio)
-    audio_centered = audio - mean_value
+    audio -= np.mean(audio)
 
     # Avoid divide-by-zero for silent signals
-    current_peak = np.max(np.abs(audio_centered))
+    current_peak = max(float(np.max(audio, initial=0.0)), -float(np.min(audio, initial=0.0)))
     if current_peak < 1e-9:
-        return audio_centered  # Already silence
+        return audio  # Already silence
 
     # Scale to desired peak amplitude
-    scaling_factor = max_amplitude / current_peak
-    normalized_audio = audio_centered * scaling_factor
+    audio *= max_amplitude / current_peak
+
+    return audio
+
+
+class NormalizeProcessor(BlockProcessor):
+    """
+    Block version of `apply_normalize`. The DC offset and the peak are those of the whole clip,
+    so the blocks are held until `flush`, which returns all of the output.
+    """
+
+    def __init__(self, framerate: int, max_amplitude: float = 32767.0):
+        self.framerate = framerate
+        self.max_amplitude = max_amplitude
+        self._blocks = []
+
+    def process(self, block: np.ndarray) -> np.ndarray:
+        self._blocks.append(np.array(block, dtype=np.float32))
+        return np.zeros(0, dtype=np.float32)
 
-    return normalized_audio
+    def flush(self) -> np.ndarray:
+        audio = np.concatenate(self._blocks) if self._blocks else np.zeros(0, dtype=np.float32)
+        self._blocks = []
+        return apply_normalize_inplace(audio, self.framerate, self.max_amplitude)
@@ -0,0 +1,189 @@
+import numpy as np
+from functools import lru_cache
+from typing import Optional, Union
+
+# Phases are 32-bit fixed point fractions of a cycle, so they wrap around by themselves
+PHASE_BITS = 32
+# 2^16 samples per cycle: reading the nearest sample keeps the sine within 5e-5 of the exact value
+TABLE_BITS = 16
+WAVETABLE_SIZE = 1 << TABLE_BITS
+WAVEFORMS = ("sine", "saw", "triangle", "square")
+
+
+@lru_cache(maxsize=None)
+def wavetable(shape: str) -> np.ndarray:
+    """
+    One cycle of a waveform in [-1, 1], starting at phase 0. Built once per shape.
+
+    `saw` rises from 0 to 1 at half a cycle, jumps to -1 and rises back to 0 (same as
+    scipy.signal.sawtooth); `triangle` and `square` start at 0 and 1 and peak / flip at a quarter
+    and half cycle.
+    """
+    p = np.arange(WAVETABLE_SIZE, dtype=np.float64) / WAVETABLE_SIZE
+    if shape == "sine":
+        table = np.sin(2 * np.pi * p)
+    elif shape == "saw":
+        table = 2 * (p - np.floor(0.5 + p))
+    elif shape == "triangle":
+        table = 1 - 4 * np.abs(((p + 0.25) % 1.0) - 0.5)
+    elif shape == "square":
+        table = np.where(p < 0.5, 1.0, -1.0)
+    else:
+        raise ValueError(f"Unknown waveform: {shape} ({', '.join(WAVEFORMS)})")
+    table = table.astype(np.float32)
+    table.flags.writeable = False
+    return table
+
+
+def phase_increment(frequency: Union[float, np.ndarray], framerate: int) -> np.ndarray:
+    """
+    Phase advance per sample of a frequency (Hz), in fixed point.
+    """
+    cycles = np.asarray(frequency, dtype=np.float64) / framerate
+    return (np.round(cycles * (1 << PHASE_BITS)).astype(np.int64) & 0xFFFFFFFF).astype(np.uint32)
+
+
+def to_phase(cycles: float) -> np.uint32:
+    return np.uint32(int(round((cycles % 1.0) * (1 << PHASE_BITS))) & 0xFFFFFFFF)
+
+
+def lookup(shape: str, phases: np.ndarray) -> np.ndarray:
+    """
+    Wavetable value at each fixed point phase.
+    """
+    return np.take(wavetable(shape), phases >> np.uint32(PHASE_BITS - TABLE_BITS))
+
+
+class Oscillator:
+    """
+    Phase accumulator reading a wavetable. `generate` returns the next samples and carries the
+    phase over to the next call, so a signal produced in blocks equals the one produced at once.
+    """
+
+    def __init__(self, shape: str, framerate: int, phase: float = 0.0):
+        wavetable(shape)  # validates the shape
+        self.shape = shape
+        self.framerate = framerate
+        self._phase = to_phase(phase)
+
+    @property
+    def phase(self) -> float:
+        """Current phase, in cycles."""
+        return int(self._phase) / (1 << PHASE_BITS)
+
+    def phases(self, frequency: Union[float, np.ndarray], length: int) -> np.ndarray:
+        """
+        Fixed point phase of the next `length` samples, for a constant or per-sample frequency.
+        """
+        return self.advance(phase_increment(frequency, self.framerate), length)
+
+    def advance(self, increments: np.ndarray, length: int) -> np.ndarray:
+        """
+        Same as `phases`, from precomputed `phase_increment`s (e.g. of a few step frequencies,
+        repeated over their steps).
+        """
+        increments = np.asarray(increments, dtype=np.uint32)
+        if increments.ndim == 0:
+            phases = np.arange(length, dtype=np.uint32)
+            phases *= increments
+            phases += self._phase
+            self._phase = np.uint32((int(self._phase) + length * int(increments)) & 0xFFFFFFFF)
+        elif length:
+            # Exclusive running sum from the current phase, wrapping modulo 2^32
+            phases = np.empty(length, dtype=np.uint32)
+            phases[0] = self._phase
+            phases[1:] = increments[:length - 1]
+            np.cumsum(phases, dtype=np.uint32, out=phases)
+            self._phase = np.uint32((int(phases[-1]) + int(increments[length - 1])) & 0xFFFFFFFF)
+        else:
+            phases = np.zeros(0, dtype=np.uint32)
+        return phases
+
+    def advance_steps(self, increments: np.ndarray, step_length: int, length: int, skip: int = 0) -> np.ndarray:
+        """
+        Same as `advance` for a frequency held over steps of `step_length` samples: one increment
+        per step, `skip` samples of the first step already produced. Each step is a multiply-add
+        over a (steps, step_length) grid rather than a running sum over every sample.
+        """
+        increments = np.asarray(increments, dtype=np.uint32)
+        if not length:
+            return np.zeros(0, dtype=np.uint32)
+
+        # Phase at the start of each step, as if the first step started `skip` samples ago
+        totals = increments.astype(np.int64) * step_length
+        starts = np.empty(len(increments), dtype=np.int64)
+        starts[0] = int(self._phase) - skip * int(increments[0])
+        np.cumsum(totals[:-1], out=starts[1:])
+        starts[1:] += starts[0]
+        starts = (starts & 0xFFFFFFFF).astype(np.uint32)
+
+        grid = np.arange(step_length, dtype=np.uint32)[None, :] * increments[:, None]
+        grid += starts[:, None]
+        phases = grid.reshape(-1)[skip:skip + length]
+
+        end = skip + length
+        step, index = divmod(end, step_length)
+        if step < len(increments):
+            self._phase = np.uint32((int(starts[step]) + index * int(increments[step])) & 0xFFFFFFFF)
+        else:
+            self._phase = np.uint32((int(phases[-1]) + int(increments[-1])) & 0xFFFFFFFF)
+        return phases
+
+    def generate(self, frequency: Union[float, np.ndarray], length: int) -> np.ndarray:
+        """
+        Next `length` samples in [-1, 1] (float32), in one vectorized pass.
+        """
+        return lookup(self.shape, self.phases(frequency, length))
+
+
+def oscillate(
+    shape: str,
+    frequency: Union[float, np.ndarray],
+    framerate: int,
+    length: int,
+    phase: float = 0.0
+) -> np.ndarray:
+    """
+    `length` samples of a `shape` oscillator in [-1, 1] (float32).
+
+    Args:
+        shape (str): One of WAVEFORMS.
+        frequency (float | np.ndarray): Frequency in Hz, constant or per sample.
+        framerate (int): Sample rate (Hz).
+        length (int): Number of samples.
+        phase (float): Starting phase, in cycles.
+    """
+    return Oscillator(shape, framerate, phase).generate(frequency, length)
+
+
+def random_step_values(first: int, count: int, choices: int, seed: Optional[int] = None) -> np.ndarray:
+    """
+    Values of steps `first` to `first + count - 1` of a random-step sequence: a random integer
+    in [0, choices) per step. The same `seed` always gives the same sequence.
+    """
+    # Every step is drawn from the start, so the values don't depend on how the sequence is cut
+    return np.random.default_rng(seed).integers(0, max(1, choices), size=first + count)[first:]
+
+
+def random_steps(
+    length: int,
+    step_length: int,
+    choices: int,
+    seed: Optional[int] = None,
+    offset: int = 0
+) -> np.ndarray:
+    """
+    Random-step (sample and hold) sequence: a random integer in [0, choices) per step of
+    `step_length` samples, repeated over the step. `offset` (in samples) starts the sequence
+    further along, so a long sequence can be produced in blocks.
+
+    Returns:
+        np.ndarray: int64 values, one per sample.
+    """
+    step_length = max(1, int(step_length))
+    if length <= 0:
+        return np.zeros(0, dtype=np.int64)
+    first = offset // step_length
+    count = (offset + length - 1) // step_length + 1 - first
+    skip = offset - first * step_length
+    return np.repeat(random_step_values(first, count, choices, seed), step_length)[skip:skip + length]
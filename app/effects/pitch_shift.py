@@ -1,4 +1,31 @@
 import numpy as np
+from functools import lru_cache
+from numpy.lib.stride_tricks import sliding_window_view
+
+from .block_processor import BlockProcessor
+from .speed_change import LinearResampler, resample_linear
+
+
+@lru_cache(maxsize=16)
+def _wsola_setup(framerate: int, window_size: int):
+    """
+    Per (framerate, window_size) constants, computed once: the Hann window, the inverse of its
+    overlap sum (the normalization applied after overlap-add), and the decimation used for the
+    alignment search.
+    """
+    hop_size = window_size // 2
+    window = np.hanning(window_size + 1)[:-1].astype(np.float32)  # periodic Hann
+    overlap_sum = window[:hop_size] + window[hop_size:]
+    normalization = (1.0 / np.maximum(overlap_sum, 1e-3)).astype(np.float32)
+    # The alignment only needs to be sample accurate at ~11kHz
+    decimation = max(1, int(round(framerate / 11025)))
+    return window, normalization, decimation
+
+
+def _window_size(framerate: int) -> int:
+    # ~46ms frames: 1024 samples at 22.05kHz, 2048 at 48kHz
+    return int(2 ** round(np.log2(framerate * 0.046)))
+
 
 def apply_pitch_shift(
     audio: np.ndarray,
@@ -7,7 +34,11 @@ def apply_pitch_shift(
 ) -> np.ndarray:
     """
     Applies a pitch shift to audio by resampling & time-stretching.
-    Pure Python / numpy approximation.
+
+    The audio is resampled by the pitch factor (which changes both pitch and duration), then
+    stretched back to its original length with WSOLA: Hann windowed frames at 50% overlap, each
+    one taken from the position around its nominal position that best continues the previous
+    frame, so the overlapping periods add up in phase.
 
     Args:
         audio (np.ndarray): Mono audio samples (float32).
@@ -20,36 +51,180 @@ def apply_pitch_shift(
     if pitch_change == 0:
         return audio.copy()
 
+    input_len = len(audio)
+    if input_len == 0:
+        return np.zeros(0, dtype=np.float32)
+
     # Calculate pitch shift factor
     pitch_factor = 2 ** (pitch_change / 100.0)
 
+    window_size = _window_size(framerate)
+    hop_size = window_size // 2
+    tolerance = window_size // 8
+    window, normalization, decimation = _wsola_setup(framerate, window_size)
+
     # Step 1: Resample to change pitch (and duration)
-    input_len = len(audio)
-    new_len = int(input_len / pitch_factor)
+    resampled = resample_linear(audio, pitch_factor)
+
+    # Step 2: Time-stretch back to original length using WSOLA.
+    # Output frame m covers [m * hop_size, m * hop_size + window_size) and is read around
+    # m * hop_size / pitch_factor in the resampled audio. Half a frame of silence is prepended
+    # so the first kept output sample is covered by two frames.
+    num_frames = input_len // hop_size + 2
+    analysis_hop = hop_size / pitch_factor
+    lead = tolerance + hop_size
+    padded = np.zeros(lead + len(resampled) + int((num_frames + 1) * analysis_hop) + window_size + tolerance,
+                      dtype=np.float32)
+    padded[lead:lead + len(resampled)] = resampled
+
+    nominal = (np.arange(num_frames) * analysis_hop).astype(np.intp) + tolerance
+
+    # Alignment search on a decimated copy, over the overlapping half of the frames.
+    # The target of a frame is the continuation of the frame chosen before it, so the searches
+    # can't be batched as they are: an rfft table of every candidate target of every frame
+    # (sliding_window_view + np.fft) is exact but ~100x slower than these small correlations,
+    # whose loop is a fraction of the whole effect (see benchmarks/bench_pitch_shift.py).
+    decimated = padded[::decimation].copy()
+    overlap_len = (window_size - hop_size) // decimation
+    search = tolerance // decimation
+
+    starts = np.empty(num_frames, dtype=np.intp)
+    starts[0] = previous = nominal[0]
+    for m in range(1, num_frames):
+        # Natural continuation of the previous frame, matched against the candidates around the nominal position
+        target = (previous + hop_size) // decimation
+        first = nominal[m] // decimation - search
+        scores = np.correlate(
+            decimated[first:first + 2 * search + overlap_len],
+            decimated[target:target + overlap_len],
+            "valid"
+        )
+        previous = starts[m] = (first + int(scores.argmax())) * decimation
+
+    # Step 3: all frames at once (strided windows), windowed and overlap-added half by half:
+    # output block m is the second half of frame m - 1 plus the first half of frame m
+    frames = sliding_window_view(padded, window_size)
+    blocks = np.zeros((num_frames + 1, hop_size), dtype=np.float32)
+    np.multiply(frames[starts, :hop_size], window[:hop_size], out=blocks[:num_frames])
+    blocks[1:] += frames[starts, hop_size:] * window[hop_size:]
+    blocks *= normalization
+
+    return blocks.reshape(-1)[hop_size:hop_size + input_len]
+
+
+class PitchShiftProcessor(BlockProcessor):
+    """
+    Block version of `apply_pitch_shift`. The resampled audio is stretched frame by frame as it
+    arrives, with the same alignment search; a frame is placed once the audio it could be read
+    from is there, so the output lags the input by about a frame plus the search tolerance.
+    """
+
+    def __init__(self, framerate: int, pitch_change: int = 0):
+        self.pitch_change = pitch_change
+        pitch_factor = 2 ** (pitch_change / 100.0)
+
+        self.window_size = window_size = _window_size(framerate)
+        self.hop_size = hop_size = window_size // 2
+        self.tolerance = window_size // 8
+        self.window, self.normalization, self.decimation = _wsola_setup(framerate, window_size)
+        self.overlap_len = (window_size - hop_size) // self.decimation
+        self.search = self.tolerance // self.decimation
+        self.analysis_hop = hop_size / pitch_factor
+
+        self._resampler = LinearResampler(pitch_factor)
+        # Resampled audio with its lead of silence (`padded` of apply_pitch_shift), from index _offset on
+        self._lead = self.tolerance + hop_size
+        self._buffer = np.zeros(self._lead, dtype=np.float32)
+        self._offset = 0
+        self._received = 0
+        self._resampled = 0
+        self._frame = 0  # next frame to place
+        self._previous = 0  # start of the last placed frame
+        self._tail = None  # windowed second half of the last placed frame
+        self._ready = []  # output blocks not returned yet
+        self._emitted = 0
+
+    def process(self, block: np.ndarray) -> np.ndarray:
+        block = np.asarray(block, dtype=np.float32)
+        if self.pitch_change == 0:
+            return block.copy()
+        self._received += len(block)
+        self._append(self._resampler.process(block))
+        self._place_frames(None)
+        # Every output block placed so far ends before the input received so far
+        return self._take(self._received)
+
+    def flush(self) -> np.ndarray:
+        if self.pitch_change == 0 or self._received == 0:
+            return np.zeros(0, dtype=np.float32)
+        input_len = self._received
+        self._append(self._resampler.flush())
 
-    # Simple linear interpolation resampling
-    resampled_indices = np.linspace(0, input_len - 1, new_len)
-    pitch_shifted_audio = np.interp(resampled_indices, np.arange(input_len), audio)
+        num_frames = input_len // self.hop_size + 2
+        padded_len = (self._lead + self._resampled + int((num_frames + 1) * self.analysis_hop)
+                      + self.window_size + self.tolerance)
+        self._append(np.zeros(padded_len - self._offset - len(self._buffer), dtype=np.float32))
+        self._place_frames(num_frames)
 
-    # Step 2: Time-stretch back to original length using Overlap-Add (OLA)
-    window_size = 2048
-    hop_size = window_size // 4
+        # Second half of the last frame
+        self._ready.append(self._tail * self.normalization)
+        return self._take(input_len)
 
-    output_audio = np.zeros(input_len, dtype=np.float32)
+    def _append(self, resampled: np.ndarray) -> None:
+        if len(resampled):
+            self._buffer = np.concatenate((self._buffer, resampled))
+            self._resampled += len(resampled)
 
-    for i in range(0, input_len - window_size, hop_size):
-        # Map output window to pitch-shifted audio window
-        pos = int(i * new_len / input_len)
+    def _take(self, end: int) -> np.ndarray:
+        output = np.concatenate(self._ready) if self._ready else np.zeros(0, dtype=np.float32)
+        count = max(0, min(len(output), end - self._emitted))
+        self._ready = [output[count:]] if count < len(output) else []
+        self._emitted += count
+        return output[:count]
 
-        if pos + window_size > len(pitch_shifted_audio):
-            break
+    def _place_frames(self, num_frames) -> None:
+        """
+        Places the next frames, up to `num_frames` once the input has ended, or as long as the
+        audio they can be read from has arrived.
+        """
+        hop_size, window_size, decimation, search = self.hop_size, self.window_size, self.decimation, self.search
+        available = self._offset + len(self._buffer)
+        buffer, offset = self._buffer, self._offset
 
-        # Simple windowing (optional: apply hanning window for smoothing)
-        output_audio[i:i + window_size] += pitch_shifted_audio[pos:pos + window_size]
+        while num_frames is None or self._frame < num_frames:
+            m = self._frame
+            nominal = int(m * self.analysis_hop) + self.tolerance
+            if m == 0:
+                start = nominal
+            else:
+                target = (self._previous + hop_size) // decimation
+                first = nominal // decimation - search
+                if num_frames is None:
+                    last = max(first + 2 * search + self.overlap_len, target + self.overlap_len) - 1
+                    if last * decimation >= available or (first + 2 * search) * decimation + window_size > available:
+                        break
+                scores = np.correlate(
+                    buffer[first * decimation - offset:(first + 2 * search + self.overlap_len) * decimation - offset:decimation],
+                    buffer[target * decimation - offset:(target + self.overlap_len) * decimation - offset:decimation],
+                    "valid"
+                )
+                start = (first + int(scores.argmax())) * decimation
+            if num_frames is None and start + window_size > available:
+                break
 
-    # Normalize after OLA to avoid amplitude blow-up
-    max_amp = np.max(np.abs(output_audio))
-    if max_amp > 0:
-        output_audio = output_audio * (np.max(np.abs(audio)) / max_amp)
+            frame = buffer[start - offset:start - offset + window_size]
+            if m > 0:
+                output = frame[:hop_size] * self.window[:hop_size]
+                output += self._tail
+                output *= self.normalization
+                self._ready.append(output)
+            self._tail = frame[hop_size:] * self.window[hop_size:]
+            self._previous = start
+            self._frame += 1
 
-    return output_audio
+        # Keep what the next frame can read: its search range and the continuation of this one
+        next_first = (int(self._frame * self.analysis_hop) + self.tolerance) // decimation - search
+        keep = min(next_first, (self._previous + hop_size) // decimation) * decimation
+        if self._frame and keep > self._offset:
+            self._buffer = self._buffer[keep - self._offset:]
+            self._offset = keep
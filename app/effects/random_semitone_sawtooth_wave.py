@@ -1,12 +1,8 @@
 import numpy as np
-from dataclasses import dataclass, field
-from random import Random
-
-def sawtooth_wave(radians: np.ndarray) -> np.ndarray:
-    """
-    Pure numpy sawtooth wave equivalent to scipy.signal.sawtooth.
-    """
-    return 2 * (radians / (2 * np.pi) - np.floor(0.5 + radians / (2 * np.pi)))
+from dataclasses import dataclass
+from typing import Optional
+from .block_processor import BlockProcessor
+from .oscillators import Oscillator, lookup, phase_increment, random_step_values
 
 @dataclass
 class RandomSemitoneSawtoothWave:
@@ -14,33 +10,89 @@ class RandomSemitoneSawtoothWave:
     max_semitones: int
     pitch_duration: float
     wet: float = 0.5  # Wet mix level (0 to 1)
-    rng: Random = field(default_factory=Random)
+    seed: Optional[int] = None  # same seed, same modulation; None draws a new one every time (never cached)
+
+    def step_length(self, framerate: int) -> int:
+        return max(1, round(self.pitch_duration * framerate))
+
+    def step_increments(self, first: int, count: int, framerate: int) -> np.ndarray:
+        """
+        Phase increments of the sawtooth over steps `first` to `first + count - 1`: min_freq
+        raised by a random number of semitones (0 to max_semitones).
+        """
+        semitones = random_step_values(first, count, self.max_semitones + 1, self.seed)
+        frequencies = self.min_freq * 2 ** (np.arange(self.max_semitones + 1) / 12)
+        return phase_increment(frequencies, framerate)[semitones]
 
     def generate_modulation(self, length: int, framerate: int) -> np.ndarray:
-        times = np.arange(length) / framerate
-        dt = times[1] - times[0]
-        chunk_size = round(self.pitch_duration / dt)
+        """
+        Sawtooth in [-1, 1] stepping through random semitones every pitch_duration, in one
+        vectorized pass. The phase runs on across the steps, so frequency changes don't click.
+        """
+        step_length = self.step_length(framerate)
+        increments = self.step_increments(0, -(-length // step_length), framerate)
+        phases = Oscillator("saw", framerate).advance_steps(increments, step_length, length)
+        return lookup("saw", phases)
 
-        modulation = np.zeros_like(times, dtype=np.float32)
+    def apply(self, audio: np.ndarray, framerate: int) -> np.ndarray:
+        # Ensure float32 type to avoid overflow errors
+        return self.apply_inplace(audio.astype(np.float32), framerate)
 
-        for i in range(0, len(times), chunk_size):
-            semitones = self.rng.randint(0, self.max_semitones)
-            freq = self.min_freq * 2 ** (semitones / 12)
+    def apply_inplace(self, audio: np.ndarray, framerate: int) -> np.ndarray:
+        """
+        Applies the modulation to `audio` (a float array) in place.
+        """
+        modulation = self.generate_modulation(len(audio), framerate)
 
-            time_chunk = times[i:i + chunk_size]
-            radians = 2 * np.pi * freq * time_chunk
-            modulation[i:i + chunk_size] = sawtooth_wave(radians)
+        # Apply as amplitude modulation, scaled by wet:
+        # audio * modulation * wet + audio * (1 - wet) == audio * (modulation * wet + 1 - wet)
+        modulation *= self.wet
+        modulation += 1 - self.wet
+        audio *= modulation
 
-        return modulation
+        return audio
 
-    def apply(self, audio: np.ndarray, framerate: int) -> np.ndarray:
-        modulation = self.generate_modulation(len(audio), framerate)
 
-        # Apply as amplitude modulation, scaled by wet
-        modulated_audio = (audio * modulation * self.wet) + (audio * (1 - self.wet))
+class RandomSemitoneSawtoothWaveProcessor(BlockProcessor):
+    """
+    Block version of `apply_effect`: the sawtooth phase, the position in the current step and
+    the random sequence carry over from one block to the next.
+    """
+
+    def __init__(self, framerate: int, min_freq: float, max_semitones: int, pitch_duration: float,
+                 wet: float = 0.5, seed: Optional[int] = None):
+        self.effect = RandomSemitoneSawtoothWave(min_freq, max_semitones, pitch_duration, wet, seed)
+        self.framerate = framerate
+        self.step_length = self.effect.step_length(framerate)
+        self._oscillator = Oscillator("saw", framerate)
+        # Drawn one step at a time, the same values as random_step_values from the start
+        self._rng = np.random.default_rng(seed)
+        frequencies = min_freq * 2 ** (np.arange(max_semitones + 1) / 12)
+        self._increments = phase_increment(frequencies, framerate)
+        self._current = None  # increment of the step in progress
+        self._position = 0  # samples of that step already produced
+
+    def process(self, block: np.ndarray) -> np.ndarray:
+        audio = np.array(block, dtype=np.float32)
+        length = len(audio)
+        if not length:
+            return audio
+
+        skip = self._position
+        new_steps = -(-(skip + length) // self.step_length) - (1 if self._current is not None else 0)
+        drawn = self._increments[self._rng.integers(0, len(self._increments), size=max(new_steps, 0))]
+        increments = drawn if self._current is None else np.concatenate(([self._current], drawn))
+
+        modulation = lookup("saw", self._oscillator.advance_steps(increments, self.step_length, length, skip))
+        self._position = (skip + length) % self.step_length
+        # A step just completed is done with: the next block starts a new one
+        self._current = increments[-1] if self._position else None
+
+        modulation *= self.effect.wet
+        modulation += 1 - self.effect.wet
+        audio *= modulation
+        return audio
 
-        # Ensure float32 type to avoid overflow errors
-        return modulated_audio.astype(np.float32)
 
 def apply_effect(
     audio: np.ndarray,
@@ -48,7 +100,8 @@ def apply_effect(
     min_freq: float,
     max_semitones: int,
     pitch_duration: float,
-    wet: float = 0.5
+    wet: float = 0.5,
+    seed: Optional[int] = None
 ) -> np.ndarray:
     """
     Apply RandomSemitoneSawtoothWave modulation with dry/wet mix.
@@ -60,6 +113,7 @@ def apply_effect(
         max_semitones (int): Random semitone range.
         pitch_duration (float): Duration of each pitch step.
         wet (float): Wet mix level (0-1).
+        seed (int): Seed of the random semitones, for a reproducible output.
 
     Returns:
         np.ndarray: Modulated audio.
@@ -68,6 +122,29 @@ def apply_effect(
         min_freq=min_freq,
         max_semitones=max_semitones,
         pitch_duration=pitch_duration,
-        wet=wet
+        wet=wet,
+        seed=seed
     )
     return effect.apply(audio, framerate)
+
+
+def apply_effect_inplace(
+    audio: np.ndarray,
+    framerate: int,
+    min_freq: float,
+    max_semitones: int,
+    pitch_duration: float,
+    wet: float = 0.5,
+    seed: Optional[int] = None
+) -> np.ndarray:
+    """
+    Same as apply_effect, but overwrites `audio` (a float array).
+    """
+    effect = RandomSemitoneSawtoothWave(
+        min_freq=min_freq,
+        max_semitones=max_semitones,
+        pitch_duration=pitch_duration,
+        wet=wet,
+        seed=seed
+    )
+    return effect.apply_inplace(audio, framerate)
@@ -1,5 +1,124 @@
 import numpy as np
 
+from .block_processor import BlockProcessor
+
+
+def _interpolate(
+    audio: np.ndarray,
+    offset: int,
+    start: int,
+    end: int,
+    ramp: np.ndarray,
+    factor: float,
+    last: int,
+    out: np.ndarray
+) -> None:
+    """
+    Writes output samples [start, end) of a resampling by `factor` to `out`, reading `audio`,
+    which holds the input from index `offset` on. Positions are computed per block of len(ramp)
+    output samples, the same way whatever range is asked for, so a resampling done in pieces
+    equals the one done at once. Positions past `last` read the last input sample.
+    """
+    block_size = len(ramp)
+    k = start
+    while k < end:
+        block_start = k - k % block_size
+        stop = min(end, block_start + block_size)
+        positions = ramp[k - block_start:stop - block_start] + block_start * factor
+        np.minimum(positions, last, out=positions)
+        index = positions.astype(np.intp)
+        frac = (positions - index).astype(np.float32)
+        index -= offset
+
+        # a[i] + frac * (a[i + 1] - a[i])
+        block = out[k - start:stop - start]
+        np.take(audio, np.minimum(index + 1, last - offset), out=block)
+        current = audio[index]
+        block -= current
+        block *= frac
+        block += current
+        k = stop
+
+
+def resample_linear(audio: np.ndarray, factor: float, length: int = None, block_size: int = 16384) -> np.ndarray:
+    """
+    Linear interpolation resampling in float32: output sample k is read at input position k * factor.
+    Unlike np.interp, nothing is promoted to float64 except the positions, and the work is done in
+    cache-sized blocks so the temporaries never grow with the clip length.
+
+    Args:
+        audio (np.ndarray): Mono audio samples.
+        factor (float): Input samples consumed per output sample (> 1 shortens the audio).
+        length (int): Number of output samples, default int(len(audio) / factor).
+        block_size (int): Output samples computed per block.
+
+    Returns:
+        np.ndarray: Resampled audio (float32).
+    """
+    audio = np.asarray(audio, dtype=np.float32)
+    if length is None:
+        length = int(len(audio) / factor)
+    if length <= 0 or len(audio) == 0:
+        return np.zeros(max(length, 0), dtype=np.float32)
+
+    output = np.empty(length, dtype=np.float32)
+    ramp = np.arange(block_size, dtype=np.float64) * factor
+    _interpolate(audio, 0, 0, length, ramp, factor, len(audio) - 1, output)
+    return output
+
+
+class LinearResampler(BlockProcessor):
+    """
+    Block version of `resample_linear` (with the default length). Only the input from the
+    next output position on is kept between blocks.
+    """
+
+    def __init__(self, factor: float, block_size: int = 16384):
+        self.factor = factor
+        self._ramp = np.arange(block_size, dtype=np.float64) * factor
+        self._buffer = np.zeros(0, dtype=np.float32)
+        self._offset = 0  # input index of _buffer[0]
+        self._received = 0
+        self._produced = 0
+
+    def process(self, block: np.ndarray) -> np.ndarray:
+        self._buffer = np.concatenate((self._buffer, np.asarray(block, dtype=np.float32)))
+        self._received += len(block)
+        if self._received < 2:
+            return np.zeros(0, dtype=np.float32)
+        # Output samples whose two input neighbours have arrived, within the final length
+        ready = min(int((self._received - 2) / self.factor) + 1, int(self._received / self.factor))
+        return self._read(ready)
+
+    def flush(self) -> np.ndarray:
+        return self._read(int(self._received / self.factor))
+
+    def _read(self, end: int) -> np.ndarray:
+        if end <= self._produced:
+            return np.zeros(0, dtype=np.float32)
+        output = np.empty(end - self._produced, dtype=np.float32)
+        _interpolate(self._buffer, self._offset, self._produced, end, self._ramp, self.factor,
+                     self._received - 1, output)
+        self._produced = end
+
+        drop = int(end * self.factor) - 1 - self._offset
+        if drop > 0:
+            self._buffer = self._buffer[drop:]
+            self._offset += drop
+        return output
+
+
+class SpeedChangeProcessor(LinearResampler):
+    """
+    Block version of `apply_speed_change`.
+    """
+
+    def __init__(self, framerate: int, speed: float = 0.0):
+        speed_factor = 1.0 + speed
+        if speed_factor <= 0:
+            raise ValueError("Speed factor must be > 0")
+        super().__init__(speed_factor)
+
 def apply_speed_change(
     audio: np.ndarray,
     framerate: int,
@@ -27,11 +146,4 @@ def apply_speed_change(
     if speed_factor <= 0:
         raise ValueError("Speed factor must be > 0")
 
-    original_indices = np.arange(len(audio))
-    new_length = int(len(audio) / speed_factor)
-    new_indices = np.linspace(0, len(audio) - 1, new_length)
-
-    # Interpolate to get new audio
-    stretched_audio = np.interp(new_indices, original_indices, audio)
-
-    return stretched_audio.astype(np.float32)
+    return resample_linear(audio, speed_factor)
@@ -0,0 +1,255 @@
+import os
+import asyncio
+import hashlib
+import secrets
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass
+from pathlib import Path
+from typing import AsyncIterator, Dict, List, Optional, Tuple
+
+from fastapi import Request
+from fastapi.responses import FileResponse, Response, StreamingResponse
+
+OUTPUT_DIR = Path(os.getenv("OUTPUT_PATH", "/output")).resolve()
+FILE_MEMORY_CACHE_MB = int(os.getenv("FILE_MEMORY_CACHE_MB", 64))  # 0 disables the in-memory copies
+FILE_MEMORY_CACHE_MAX_FILE_MB = int(os.getenv("FILE_MEMORY_CACHE_MAX_FILE_MB", 8))
+FILE_CACHE_MAX_AGE = int(os.getenv("FILE_CACHE_MAX_AGE", 3600))  # seconds, for Cache-Control
+
+# More ranges than this in one request get the whole file instead
+MAX_RANGES = 16
+READ_CHUNK = 64 * 1024
+
+
+class RangeNotSatisfiable(Exception):
+    pass
+
+
+@dataclass
+class ServedFile:
+    name: str
+    path: Path
+    size: int
+    etag: str
+    data: Optional[bytes] = None  # set when held in memory
+
+
+def parse_range(header: Optional[str], size: int) -> Optional[List[Tuple[int, int]]]:
+    """
+    Parses a `Range: bytes=...` header into sorted, merged (start, end) pairs, end included.
+    Returns None when the header should be ignored (absent, malformed, not bytes, too many
+    ranges) and raises RangeNotSatisfiable when no range overlaps the file.
+    """
+    if not header:
+        return None
+    unit, _, specs = header.partition("=")
+    if unit.strip().lower() != "bytes" or not specs:
+        return None
+
+    ranges = []
+    for spec in specs.split(","):
+        first, dash, last = spec.strip().partition("-")
+        if not dash:
+            return None
+        try:
+            if not first:
+                # Suffix range: the last N bytes
+                length = int(last)
+                if length <= 0:
+                    continue
+                ranges.append((max(0, size - length), size - 1))
+                continue
+            start = int(first)
+            end = int(last) if last else None
+        except ValueError:
+            return None
+        if start < 0 or (end is not None and end < start):
+            return None
+        if start < size:
+            ranges.append((start, size - 1 if end is None else min(end, size - 1)))
+
+    if not ranges:
+        raise RangeNotSatisfiable()
+    if len(ranges) > MAX_RANGES:
+        return None
+
+    merged = []
+    for start, end in sorted(ranges):
+        if merged and start <= merged[-1][1] + 1:
+            merged[-1] = (merged[-1][0], max(merged[-1][1], end))
+        else:
+            merged.append((start, end))
+    return merged
+
+
+def _etag_matches(header: str, etag: str) -> bool:
+    # If-None-Match uses the weak comparison
+    tags = [tag.strip() for tag in header.split(",")]
+    return "*" in tags or any(tag.removeprefix("W/") == etag for tag in tags)
+
+
+class FileServer:
+    """
+    Serves generated files with validators and partial content: strong ETags (files are written
+    once under a unique name and never modified), `If-None-Match` -> 304, `Cache-Control`, and
+    single or multiple `Range`s (206, multipart/byteranges for several). The hottest files are
+    kept in a byte-bounded in-memory LRU, so repeated downloads do not touch the filesystem.
+    """
+
+    def __init__(
+        self,
+        directory: Path = OUTPUT_DIR,
+        max_bytes: int = FILE_MEMORY_CACHE_MB * 1024 * 1024,
+        max_file_bytes: int = FILE_MEMORY_CACHE_MAX_FILE_MB * 1024 * 1024,
+        max_age: int = FILE_CACHE_MAX_AGE
+    ):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.max_file_bytes = min(max_file_bytes, max_bytes)
+        self.max_age = max_age
+
+        self._files: "OrderedDict[str, ServedFile]" = OrderedDict()
+        self._total_bytes = 0
+        self._lock = threading.Lock()
+        self._hits = 0
+        self._misses = 0
+
+    def _cached(self, name: str) -> Optional[ServedFile]:
+        with self._lock:
+            served = self._files.get(name)
+            if served is not None:
+                self._files.move_to_end(name)
+                self._hits += 1
+            else:
+                self._misses += 1
+            return served
+
+    def _load(self, name: str) -> ServedFile:
+        path = self.directory / name
+        stat = path.stat()
+        etag = '"' + hashlib.sha1(f"{name}:{stat.st_size}:{stat.st_mtime_ns}".encode()).hexdigest() + '"'
+        served = ServedFile(name=name, path=path, size=stat.st_size, etag=etag)
+
+        if stat.st_size <= self.max_file_bytes:
+            served.data = path.read_bytes()
+            with self._lock:
+                previous = self._files.pop(name, None)
+                if previous is not None:
+                    self._total_bytes -= previous.size
+                self._files[name] = served
+                self._total_bytes += served.size
+                while self._total_bytes > self.max_bytes:
+                    _, evicted = self._files.popitem(last=False)
+                    self._total_bytes -= evicted.size
+        return served
+
+    def invalidate(self, name: str) -> None:
+        """
+        Drops the in-memory copy of a file that was removed or replaced.
+        """
+        with self._lock:
+            served = self._files.pop(name, None)
+            if served is not None:
+                self._total_bytes -= served.size
+
+    def _headers(self, served: ServedFile, extra: Optional[Dict[str, str]]) -> Dict[str, str]:
+        headers = {
+            "ETag": served.etag,
+            "Cache-Control": f"private, max-age={self.max_age}, immutable",
+            "Accept-Ranges": "bytes",
+        }
+        if extra:
+            headers.update(extra)
+        return headers
+
+    async def _read(self, served: ServedFile, start: int, end: int) -> AsyncIterator[bytes]:
+        # Bytes start..end (included), from memory or read off the event loop
+        if served.data is not None:
+            yield served.data[start:end + 1]
+            return
+        fd = await asyncio.to_thread(os.open, served.path, os.O_RDONLY)
+        try:
+            position = start
+            while position <= end:
+                chunk = await asyncio.to_thread(os.pread, fd, min(READ_CHUNK, end + 1 - position), position)
+                if not chunk:
+                    break
+                position += len(chunk)
+                yield chunk
+        finally:
+            os.close(fd)
+
+    async def serve(self, request: Request, name: str, media_type: str,
+                    headers: Optional[Dict[str, str]] = None) -> Response:
+        """
+        Response for a file of the directory, honouring the conditional and range headers.
+
+        Raises:
+            FileNotFoundError: The file is gone.
+        """
+        served = self._cached(name)
+        if served is None:
+            served = await asyncio.to_thread(self._load, name)
+        headers = self._headers(served, headers)
+
+        if_none_match = request.headers.get("if-none-match")
+        if if_none_match and _etag_matches(if_none_match, served.etag):
+            return Response(status_code=304, headers=headers)
+
+        range_header = request.headers.get("range")
+        if_range = request.headers.get("if-range")
+        if if_range and if_range.strip() != served.etag:
+            # The client's copy is outdated, it gets the whole file
+            range_header = None
+
+        try:
+            ranges = parse_range(range_header, served.size)
+        except RangeNotSatisfiable:
+            return Response(status_code=416, headers={**headers, "Content-Range": f"bytes */{served.size}"})
+
+        if ranges is None:
+            if served.data is not None:
+                return Response(served.data, media_type=media_type, headers=headers)
+            return FileResponse(served.path, media_type=media_type, headers=headers)
+
+        if len(ranges) == 1:
+            start, end = ranges[0]
+            headers.update({
+                "Content-Range": f"bytes {start}-{end}/{served.size}",
+                "Content-Length": str(end - start + 1),
+            })
+            return StreamingResponse(self._read(served, start, end), status_code=206,
+                                     media_type=media_type, headers=headers)
+
+        boundary = secrets.token_hex(16)
+        parts = [
+            (
+                f"--{boundary}\r\nContent-Type: {media_type}\r\n"
+                f"Content-Range: bytes {start}-{end}/{served.size}\r\n\r\n"
+            ).encode("latin-1")
+            for start, end in ranges
+        ]
+        closing = f"\r\n--{boundary}--\r\n".encode("latin-1")
+        length = sum(len(part) for part in parts) + sum(end - start + 1 for start, end in ranges) \
+            + 2 * (len(ranges) - 1) + len(closing)
+
+        async def body():
+            for index, ((start, end), part) in enumerate(zip(ranges, parts)):
+                yield (b"\r\n" if index else b"") + part
+                async for chunk in self._read(served, start, end):
+                    yield chunk
+            yield closing
+
+        headers["Content-Length"] = str(length)
+        return StreamingResponse(body(), status_code=206,
+                                 media_type=f"multipart/byteranges; boundary={boundary}", headers=headers)
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return {
+                "files": len(self._files),
+                "bytes": self._total_bytes,
+                "max_bytes": self.max_bytes,
+                "hits": self._hits,
+                "misses": self._misses,
+            }
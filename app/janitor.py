@@ -0,0 +1,247 @@
+import os
+import heapq
+import asyncio
+import logging
+import threading
+import time
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Callable, Dict, List, Optional, Tuple
+
+OUTPUT_DIR = Path(os.getenv("OUTPUT_PATH", "/output")).resolve()
+OUTPUT_TTL_HOURS = float(os.getenv("OUTPUT_TTL_HOURS", 1))  # 0 disables the TTL
+OUTPUT_MAX_MB = int(os.getenv("OUTPUT_MAX_MB", 2048))  # 0 disables the quota
+# "lru" (least recently downloaded or served from the result cache) or "oldest" (by creation)
+OUTPUT_EVICTION = os.getenv("OUTPUT_EVICTION", "lru").lower()
+JANITOR_INTERVAL = float(os.getenv("JANITOR_INTERVAL", 60))  # seconds between sweeps
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class OutputRecord:
+    size: int
+    created: float
+    last_access: float
+    version: int = 0  # heap entry currently in force, older ones are stale
+    retain_until: float = 0.0  # not expired by the TTL before this time (e.g. a job result)
+
+
+class OutputJanitor:
+    """
+    Keeps the output directory within a TTL and a total size.
+
+    Files are indexed in memory with a heap ordered by eviction priority: creation time
+    (`oldest`) or last download (`lru`). The directory is scanned once at startup, then every
+    new file, download and eviction costs O(log n); a sweep pops expired files off the top of
+    the heap, then keeps popping while the total is over quota. Touching a file pushes a new
+    heap entry and leaves the old one behind as stale, skipped when popped and compacted away
+    when they pile up.
+    """
+
+    def __init__(
+        self,
+        directory: Path = OUTPUT_DIR,
+        ttl_seconds: float = OUTPUT_TTL_HOURS * 3600,
+        max_bytes: int = OUTPUT_MAX_MB * 1024 * 1024,
+        policy: str = OUTPUT_EVICTION,
+        on_evict: Optional[Callable[[str], None]] = None
+    ):
+        if policy not in ("oldest", "lru"):
+            raise ValueError(f"Unknown eviction policy: {policy}")
+
+        self.directory = directory
+        self.ttl_seconds = ttl_seconds
+        self.max_bytes = max_bytes
+        self.policy = policy
+        # Called with the name of every file removed, e.g. to keep the result cache in sync
+        self.on_evict = on_evict
+
+        self._records: Dict[str, OutputRecord] = {}
+        self._heap: List[Tuple[float, int, str]] = []  # (priority time, version, name)
+        self._total_bytes = 0
+        self._versions = 0
+        self._lock = threading.Lock()
+        self._evicted = {"ttl": 0, "quota": 0}
+        self._evicted_bytes = 0
+        self._sweeps = 0
+        self._last_sweep_ms = 0.0
+
+        self._load_index()
+
+    def _load_index(self):
+        if not self.directory.exists():
+            return
+        with os.scandir(self.directory) as it:
+            for entry in it:
+                # Dot files are temporary files still being written
+                if entry.is_file() and not entry.name.startswith("."):
+                    stat = entry.stat()
+                    self._insert(entry.name, stat.st_size, stat.st_mtime)
+
+    def _priority(self, record: OutputRecord) -> float:
+        priority = record.last_access if self.policy == "lru" else record.created
+        if self.ttl_seconds > 0:
+            # Expires at retain_until at the earliest
+            priority = max(priority, record.retain_until - self.ttl_seconds)
+        return priority
+
+    def _insert(self, name: str, size: int, now: float):
+        # Called with self._lock held (or from __init__)
+        previous = self._records.pop(name, None)
+        if previous is not None:
+            self._total_bytes -= previous.size
+        self._versions += 1
+        record = OutputRecord(size=size, created=now, last_access=now, version=self._versions)
+        self._records[name] = record
+        self._total_bytes += size
+        heapq.heappush(self._heap, (self._priority(record), record.version, name))
+
+    def add(self, name: str, now: Optional[float] = None) -> None:
+        """
+        Registers a file just written to the directory.
+        """
+        try:
+            size = (self.directory / name).stat().st_size
+        except FileNotFoundError:
+            return
+        with self._lock:
+            self._insert(name, size, time.time() if now is None else now)
+
+    def touch(self, name: str, now: Optional[float] = None) -> bool:
+        """
+        Records a download. Returns whether the file is known.
+        """
+        with self._lock:
+            record = self._records.get(name)
+            if record is None:
+                return False
+            record.last_access = time.time() if now is None else now
+            if self.policy == "lru":
+                self._push(name, record)
+            return True
+
+    def retain(self, name: str, until: float) -> bool:
+        """
+        Keeps a file past the TTL until `until` (a time.time()); the quota can still evict it.
+        Returns whether the file is known.
+        """
+        with self._lock:
+            record = self._records.get(name)
+            if record is None:
+                return False
+            if until > record.retain_until:
+                record.retain_until = until
+                self._push(name, record)
+            return True
+
+    def _push(self, name: str, record: OutputRecord):
+        # Called with self._lock held: new heap entry for a record whose priority changed
+        self._versions += 1
+        record.version = self._versions
+        heapq.heappush(self._heap, (self._priority(record), record.version, name))
+        self._compact()
+
+    def forget(self, name: str) -> None:
+        """
+        Drops a file removed by someone else (its heap entry goes stale).
+        """
+        with self._lock:
+            record = self._records.pop(name, None)
+            if record is not None:
+                self._total_bytes -= record.size
+
+    def __contains__(self, name: str) -> bool:
+        with self._lock:
+            return name in self._records
+
+    def _compact(self):
+        # Called with self._lock held: rebuilds the heap once stale entries outnumber live ones
+        if len(self._heap) > 2 * len(self._records) + 64:
+            self._heap = [
+                (self._priority(record), record.version, name)
+                for name, record in self._records.items()
+            ]
+            heapq.heapify(self._heap)
+
+    def _pop_live(self) -> Optional[Tuple[str, OutputRecord]]:
+        # Called with self._lock held: top of the heap, skipping stale entries
+        while self._heap:
+            _, version, name = self._heap[0]
+            record = self._records.get(name)
+            if record is None or record.version != version:
+                heapq.heappop(self._heap)
+                continue
+            return name, record
+        return None
+
+    def sweep(self, now: Optional[float] = None) -> List[str]:
+        """
+        Removes expired files, then the first ones in eviction order while over quota.
+
+        Returns:
+            List[str]: Names of the removed files.
+        """
+        start = time.perf_counter()
+        now = time.time() if now is None else now
+        removed = []
+
+        with self._lock:
+            while True:
+                top = self._pop_live()
+                if top is None:
+                    break
+                name, record = top
+                if self.ttl_seconds > 0 and self._priority(record) + self.ttl_seconds <= now:
+                    reason = "ttl"
+                elif self.max_bytes > 0 and self._total_bytes > self.max_bytes:
+                    reason = "quota"
+                else:
+                    break
+
+                heapq.heappop(self._heap)
+                del self._records[name]
+                self._total_bytes -= record.size
+                self._evicted[reason] += 1
+                self._evicted_bytes += record.size
+                removed.append(name)
+            self._compact()
+
+        for name in removed:
+            try:
+                (self.directory / name).unlink(missing_ok=True)
+            except OSError as e:
+                logger.warning("Could not remove %s: %s", name, e)
+            if self.on_evict is not None:
+                self.on_evict(name)
+
+        with self._lock:
+            self._sweeps += 1
+            self._last_sweep_ms = round((time.perf_counter() - start) * 1000, 3)
+        return removed
+
+    async def run(self, interval: float = JANITOR_INTERVAL):
+        """
+        Sweeps every `interval` seconds until cancelled.
+        """
+        while True:
+            try:
+                await asyncio.to_thread(self.sweep)
+            except Exception as e:
+                logger.exception("Output sweep failed: %s", e)
+            await asyncio.sleep(interval)
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return {
+                "files": len(self._records),
+                "bytes": self._total_bytes,
+                "max_bytes": self.max_bytes,
+                "ttl_seconds": self.ttl_seconds,
+                "policy": self.policy,
+                "evicted_ttl": self._evicted["ttl"],
+                "evicted_quota": self._evicted["quota"],
+                "evicted_bytes": self._evicted_bytes,
+                "sweeps": self._sweeps,
+                "last_sweep_ms": self._last_sweep_ms,
+            }
@@ -0,0 +1,372 @@
+import os
+import json
+import time
+import uuid
+import asyncio
+import logging
+import sqlite3
+import threading
+from collections import OrderedDict, deque
+from pathlib import Path
+from typing import Any, Awaitable, Callable, Deque, Dict, List, Optional
+
+from worker_pool import PoolSaturatedError, WORKER_COUNT, WORKER_RETRY_AFTER
+
+logger = logging.getLogger(__name__)
+
+OUTPUT_DIR = Path(os.getenv("OUTPUT_PATH", "/output")).resolve()
+# Not a plain file of OUTPUT_DIR, so neither the janitor nor the downloads ever see it
+JOBS_DB_PATH = Path(os.getenv("JOBS_DB_PATH", str(OUTPUT_DIR / ".jobs" / "jobs.sqlite3")))
+JOBS_CONCURRENCY = int(os.getenv("JOBS_CONCURRENCY", WORKER_COUNT))
+# Bulk jobs never take every worker, the rest stays free for interactive jobs and direct requests
+JOBS_BULK_CONCURRENCY = int(os.getenv("JOBS_BULK_CONCURRENCY", max(1, WORKER_COUNT // 2)))
+# Interactive jobs started in a row while bulk jobs wait, before one bulk job goes first
+JOBS_INTERACTIVE_WEIGHT = int(os.getenv("JOBS_INTERACTIVE_WEIGHT", 4))
+JOBS_INTERACTIVE_MAX_CHARS = int(os.getenv("JOBS_INTERACTIVE_MAX_CHARS", 500))  # default lane by text length
+JOBS_MAX_QUEUED = int(os.getenv("JOBS_MAX_QUEUED", 10000))
+JOBS_RETENTION_HOURS = float(os.getenv("JOBS_RETENTION_HOURS", 24))
+
+LANES = ("interactive", "bulk")
+FINISHED = ("succeeded", "failed", "cancelled")
+
+
+class JobQueueFullError(Exception):
+    pass
+
+
+class JobStore:
+    """
+    SQLite table of the jobs, so queued jobs survive a restart. Every call is short and runs
+    under one lock; the connection is shared by the threads calling it.
+    """
+
+    def __init__(self, path: Path = JOBS_DB_PATH):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._db = sqlite3.connect(str(self.path), check_same_thread=False, isolation_level=None)
+        self._db.row_factory = sqlite3.Row
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.execute("""
+            CREATE TABLE IF NOT EXISTS jobs (
+                seq INTEGER PRIMARY KEY AUTOINCREMENT,
+                id TEXT UNIQUE NOT NULL,
+                owner TEXT NOT NULL,
+                lane TEXT NOT NULL,
+                status TEXT NOT NULL,
+                params TEXT NOT NULL,
+                result TEXT,
+                error TEXT,
+                created_at REAL NOT NULL,
+                started_at REAL,
+                finished_at REAL
+            )
+        """)
+        self._db.execute("CREATE INDEX IF NOT EXISTS jobs_status ON jobs (status, seq)")
+        self._lock = threading.Lock()
+
+    def insert(self, job_id: str, owner: str, lane: str, params: Dict[str, Any]) -> Dict[str, Any]:
+        with self._lock:
+            self._db.execute(
+                "INSERT INTO jobs (id, owner, lane, status, params, created_at) VALUES (?, ?, ?, 'queued', ?, ?)",
+                (job_id, owner, lane, json.dumps(params), time.time())
+            )
+        return self.get(job_id)
+
+    def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            row = self._db.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        return dict(row) if row is not None else None
+
+    def update(self, job_id: str, **fields) -> None:
+        columns = ", ".join(f"{name} = ?" for name in fields)
+        with self._lock:
+            self._db.execute(f"UPDATE jobs SET {columns} WHERE id = ?", (*fields.values(), job_id))
+
+    def cancel(self, job_id: str) -> bool:
+        """
+        Cancels a job that has not started. Returns False when it already has.
+        """
+        with self._lock:
+            cursor = self._db.execute(
+                "UPDATE jobs SET status = 'cancelled', finished_at = ? WHERE id = ? AND status = 'queued'",
+                (time.time(), job_id)
+            )
+        return cursor.rowcount > 0
+
+    def unfinished(self) -> List[Dict[str, Any]]:
+        """
+        Queued and interrupted jobs, oldest first. Jobs left running by a previous process go
+        back to the queue.
+        """
+        with self._lock:
+            self._db.execute("UPDATE jobs SET status = 'queued', started_at = NULL WHERE status = 'running'")
+            rows = self._db.execute("SELECT id, owner, lane FROM jobs WHERE status = 'queued' ORDER BY seq").fetchall()
+        return [dict(row) for row in rows]
+
+    def succeeded(self) -> List[Dict[str, Any]]:
+        """
+        Results and finish times of the succeeded jobs still kept.
+        """
+        with self._lock:
+            rows = self._db.execute("SELECT result, finished_at FROM jobs WHERE status = 'succeeded'").fetchall()
+        return [{"result": json.loads(row["result"]), "finished_at": row["finished_at"]} for row in rows]
+
+    def purge(self, older_than: float) -> int:
+        """
+        Deletes the finished jobs older than `older_than` (a time.time()).
+        """
+        with self._lock:
+            cursor = self._db.execute(
+                f"DELETE FROM jobs WHERE status IN ({', '.join('?' * len(FINISHED))}) AND finished_at < ?",
+                (*FINISHED, older_than)
+            )
+        return cursor.rowcount
+
+    def close(self) -> None:
+        with self._lock:
+            self._db.close()
+
+
+class JobScheduler:
+    """
+    Runs the queued jobs with `run_job(params)`, which returns their result (a JSON-able dict).
+
+    Jobs wait in two lanes, `interactive` and `bulk`. Interactive jobs go first, but after
+    `interactive_weight` of them in a row a waiting bulk job is started, so neither lane starves;
+    at most `bulk_concurrency` bulk jobs run at once, which keeps workers free for short prompts
+    however much bulk work is queued. Within a lane, the owners (API credentials) take turns,
+    one job each, so a client queuing thousands of jobs doesn't delay the others' next one.
+    """
+
+    def __init__(
+        self,
+        store: JobStore,
+        run_job: Callable[[Dict[str, Any]], Awaitable[Dict[str, Any]]],
+        concurrency: int = JOBS_CONCURRENCY,
+        bulk_concurrency: int = JOBS_BULK_CONCURRENCY,
+        interactive_weight: int = JOBS_INTERACTIVE_WEIGHT,
+        max_queued: int = JOBS_MAX_QUEUED,
+        retention_hours: float = JOBS_RETENTION_HOURS
+    ):
+        self.store = store
+        self.run_job = run_job
+        self.concurrency = max(1, concurrency)
+        self.bulk_concurrency = max(1, min(bulk_concurrency, self.concurrency))
+        self.interactive_weight = max(1, interactive_weight)
+        self.max_queued = max_queued
+        self.retention_hours = retention_hours
+
+        # lane -> owner -> job ids, owners in turn order
+        self._lanes: Dict[str, "OrderedDict[str, Deque[str]]"] = {lane: OrderedDict() for lane in LANES}
+        self._queued = {lane: 0 for lane in LANES}
+        self._running = {lane: 0 for lane in LANES}
+        self._interactive_streak = 0
+        self._wakeup = asyncio.Event()
+        # job id -> event set on its next status change
+        self._changes: Dict[str, asyncio.Event] = {}
+        self._waiters: Dict[str, int] = {}  # job id -> requests waiting on its event
+        self._submitting = 0
+        self._tasks = set()
+        self._completed = 0
+        self._failed = 0
+
+    def _push(self, job_id: str, owner: str, lane: str, front: bool = False) -> None:
+        jobs = self._lanes[lane].setdefault(owner, deque())
+        if front:
+            jobs.appendleft(job_id)
+            self._lanes[lane].move_to_end(owner, last=False)
+        else:
+            jobs.append(job_id)
+        self._queued[lane] += 1
+        self._wakeup.set()
+
+    def _pop(self, lane: str) -> Optional[tuple]:
+        owners = self._lanes[lane]
+        if not owners:
+            return None
+        owner, jobs = next(iter(owners.items()))
+        job_id = jobs.popleft()
+        if jobs:
+            owners.move_to_end(owner)
+        else:
+            del owners[owner]
+        self._queued[lane] -= 1
+        return job_id, owner, lane
+
+    def _remove(self, job_id: str, owner: str, lane: str) -> None:
+        jobs = self._lanes[lane].get(owner)
+        if jobs is None or job_id not in jobs:
+            return  # already picked
+        jobs.remove(job_id)
+        if not jobs:
+            del self._lanes[lane][owner]
+        self._queued[lane] -= 1
+
+    def _next(self) -> Optional[tuple]:
+        if sum(self._running.values()) >= self.concurrency:
+            return None
+        bulk_ready = self._queued["bulk"] and self._running["bulk"] < self.bulk_concurrency
+        if self._queued["interactive"] and not (bulk_ready and self._interactive_streak >= self.interactive_weight):
+            self._interactive_streak += 1
+            return self._pop("interactive")
+        if bulk_ready:
+            self._interactive_streak = 0
+            return self._pop("bulk")
+        return None
+
+    def _notify(self, job_id: str) -> None:
+        event = self._changes.pop(job_id, None)
+        if event is not None:
+            event.set()
+
+    async def submit(self, owner: str, lane: str, params: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        Stores and queues a job, returns its row.
+
+        Raises:
+            JobQueueFullError: JOBS_MAX_QUEUED jobs are already waiting.
+        """
+        if lane not in LANES:
+            raise ValueError(f"Unknown priority: {lane} ({', '.join(LANES)})")
+        # Jobs being stored count as queued, so concurrent submissions can't overshoot the limit
+        if sum(self._queued.values()) + self._submitting >= self.max_queued:
+            raise JobQueueFullError("Too many queued jobs")
+        self._submitting += 1
+        try:
+            job = await asyncio.to_thread(self.store.insert, uuid.uuid4().hex, owner, lane, params)
+        finally:
+            self._submitting -= 1
+        self._push(job["id"], owner, lane)
+        return job
+
+    async def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        return await asyncio.to_thread(self.store.get, job_id)
+
+    async def cancel(self, job_id: str) -> bool:
+        """
+        Cancels a queued job and takes it out of its lane.
+        """
+        job = await asyncio.to_thread(self.store.get, job_id)
+        if job is None or not await asyncio.to_thread(self.store.cancel, job_id):
+            return False
+        self._remove(job_id, job["owner"], job["lane"])
+        self._notify(job_id)
+        return True
+
+    async def wait(self, job_id: str, timeout: float) -> None:
+        """
+        Returns on the next status change of the job, or after `timeout` seconds.
+        """
+        event = self._changes.setdefault(job_id, asyncio.Event())
+        self._waiters[job_id] = self._waiters.get(job_id, 0) + 1
+        try:
+            await asyncio.wait_for(event.wait(), timeout)
+        except asyncio.TimeoutError:
+            pass
+        finally:
+            self._waiters[job_id] -= 1
+            if not self._waiters[job_id]:
+                # Nobody waits anymore (timed out or gone): no event left behind for the job
+                del self._waiters[job_id]
+                self._changes.pop(job_id, None)
+
+    async def run(self) -> None:
+        """
+        Dispatches the jobs until cancelled. The jobs of a previous run are queued again first.
+        """
+        for job in await asyncio.to_thread(self.store.unfinished):
+            self._push(job["id"], job["owner"], job["lane"])
+        if sum(self._queued.values()):
+            logger.info("Resuming %d queued jobs", sum(self._queued.values()))
+
+        purged_at = 0.0
+        while True:
+            if time.monotonic() - purged_at > 60 and self.retention_hours > 0:
+                purged_at = time.monotonic()
+                await asyncio.to_thread(self.store.purge, time.time() - self.retention_hours * 3600)
+
+            self._wakeup.clear()
+            while True:
+                picked = self._next()
+                if picked is None:
+                    break
+                self._start(*picked)
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), 60)
+            except asyncio.TimeoutError:
+                pass
+
+    def _start(self, job_id: str, owner: str, lane: str) -> None:
+        self._running[lane] += 1
+        task = asyncio.create_task(self._execute(job_id, owner, lane))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _execute(self, job_id: str, owner: str, lane: str) -> None:
+        requeue = False
+        try:
+            job = await asyncio.to_thread(self.store.get, job_id)
+            if job is None or job["status"] != "queued":
+                return  # cancelled (or purged) while waiting
+            await asyncio.to_thread(self.store.update, job_id, status="running", started_at=time.time())
+            self._notify(job_id)
+
+            try:
+                result = await self.run_job(json.loads(job["params"]))
+            except PoolSaturatedError:
+                # Direct requests hold every worker: back to the head of the queue, try again later
+                await asyncio.to_thread(self.store.update, job_id, status="queued", started_at=None)
+                requeue = True
+                return
+            except Exception as e:
+                self._failed += 1
+                await asyncio.to_thread(self.store.update, job_id, status="failed", error=str(e),
+                                        finished_at=time.time())
+            else:
+                self._completed += 1
+                await asyncio.to_thread(self.store.update, job_id, status="succeeded", result=json.dumps(result),
+                                        finished_at=time.time())
+            self._notify(job_id)
+        finally:
+            self._running[lane] -= 1
+            if requeue:
+                await asyncio.sleep(WORKER_RETRY_AFTER)
+                self._push(job_id, owner, lane, front=True)
+            self._wakeup.set()
+
+    async def shutdown(self) -> None:
+        """
+        Stops the running jobs; they are queued again on the next start.
+        """
+        for task in list(self._tasks):
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+
+    def stats(self) -> Dict:
+        return {
+            "queued": dict(self._queued),
+            "running": dict(self._running),
+            "owners_waiting": {lane: len(owners) for lane, owners in self._lanes.items()},
+            "completed": self._completed,
+            "failed": self._failed,
+        }
+
+
+def job_view(job: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Public fields of a job row.
+    """
+    view = {
+        "id": job["id"],
+        "status": job["status"],
+        "priority": job["lane"],
+        "created_at": job["created_at"],
+        "started_at": job["started_at"],
+        "finished_at": job["finished_at"],
+    }
+    if job["result"]:
+        view.update(json.loads(job["result"]))
+    if job["error"]:
+        view["error"] = job["error"]
+    return view
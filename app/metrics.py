@@ -0,0 +1,290 @@
+import os
+import math
+import time
+import threading
+from bisect import bisect_left
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Callable, Dict, Iterator, List, Optional, Sequence, Tuple
+
+METRICS_SERVER_TIMING = os.getenv("METRICS_SERVER_TIMING", "0") == "1"  # adds a Server-Timing header
+
+# Prometheus defaults, extended for long synthesis
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+# Real-time factor: seconds of compute per second of audio
+RTF_BUCKETS = (0.01, 0.02, 0.05, 0.1, 0.2, 0.3, 0.5, 0.75, 1.0, 1.5, 2.0, 5.0)
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(str(value))}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _format_value(value: float) -> str:
+    if math.isinf(value):
+        return "+Inf" if value > 0 else "-Inf"
+    return repr(float(value)) if not float(value).is_integer() else str(int(value))
+
+
+class Counter:
+    def __init__(self, name: str, help: str, labels: Sequence[str] = ()):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self._values: Dict[Tuple[str, ...], float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, *label_values: str, amount: float = 1.0) -> None:
+        key = tuple(str(value) for value in label_values)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            for key, value in sorted(self._values.items()):
+                lines.append(f"{self.name}{_format_labels(self.labels, key)} {_format_value(value)}")
+        return lines
+
+
+class Histogram:
+    def __init__(self, name: str, help: str, labels: Sequence[str] = (), buckets: Sequence[float] = DURATION_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self.buckets = tuple(sorted(buckets))
+        # Per label set: count per bucket (the last one is +Inf), sum
+        self._values: Dict[Tuple[str, ...], Tuple[List[int], List[float]]] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, *label_values: str) -> None:
+        key = tuple(str(label) for label in label_values)
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            counts, total = self._values.setdefault(key, ([0] * (len(self.buckets) + 1), [0.0]))
+            counts[index] += 1
+            total[0] += value
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            for key, (counts, total) in sorted(self._values.items()):
+                cumulative = 0
+                for bound, count in zip(self.buckets + (math.inf,), counts):
+                    cumulative += count
+                    labels = _format_labels(self.labels, key, f'le="{_format_value(bound)}"')
+                    lines.append(f"{self.name}_bucket{labels} {cumulative}")
+                labels = _format_labels(self.labels, key)
+                lines.append(f"{self.name}_sum{labels} {_format_value(total[0])}")
+                lines.append(f"{self.name}_count{labels} {cumulative}")
+        return lines
+
+
+class Gauge:
+    """
+    Value read when scraped, e.g. from the `stats()` of a component.
+    """
+
+    type = "gauge"
+
+    def __init__(self, name: str, help: str, read: Callable[[], float]):
+        self.name = name
+        self.help = help
+        self.read = read
+
+    def render(self) -> List[str]:
+        return [
+            f"# HELP {self.name} {self.help}",
+            f"# TYPE {self.name} {self.type}",
+            f"{self.name} {_format_value(self.read())}",
+        ]
+
+
+class CounterGauge(Gauge):
+    """
+    Total kept by a component and read when scraped, exposed as a counter: the name ends
+    in `_total` and the value only grows while the process lives.
+    """
+
+    type = "counter"
+
+
+class Registry:
+    def __init__(self):
+        self._metrics: Dict[str, object] = {}
+        self._lock = threading.Lock()
+
+    def register(self, metric):
+        with self._lock:
+            # Re-registering replaces, so module reloads don't duplicate metrics
+            self._metrics[metric.name] = metric
+        return metric
+
+    def render(self) -> str:
+        """
+        Prometheus text exposition format (version 0.0.4).
+        """
+        with self._lock:
+            metrics = list(self._metrics.values())
+        lines = []
+        for metric in metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+HTTP_REQUESTS = REGISTRY.register(Counter(
+    "webpiper_http_requests_total", "HTTP requests by route and status.", ("method", "route", "status")))
+HTTP_ERRORS = REGISTRY.register(Counter(
+    "webpiper_http_errors_total", "HTTP requests answered with a 4xx or 5xx.", ("route", "status")))
+HTTP_DURATION = REGISTRY.register(Histogram(
+    "webpiper_http_request_duration_seconds", "Time to the response headers, by route.", ("method", "route")))
+STAGE_DURATION = REGISTRY.register(Histogram(
+    "webpiper_stage_duration_seconds", "Time spent in each pipeline stage.", ("stage",)))
+EFFECT_DURATION = REGISTRY.register(Histogram(
+    "webpiper_effect_duration_seconds", "Time spent in each effect.", ("effect",)))
+REAL_TIME_FACTOR = REGISTRY.register(Histogram(
+    "webpiper_real_time_factor", "Synthesis time divided by the duration of the audio, by voice.", ("voice",),
+    buckets=RTF_BUCKETS))
+INPUT_CHARACTERS = REGISTRY.register(Counter(
+    "webpiper_input_characters_total", "Characters of text synthesized, by voice.", ("voice",)))
+OUTPUT_SECONDS = REGISTRY.register(Counter(
+    "webpiper_output_audio_seconds_total", "Seconds of audio produced, by voice.", ("voice",)))
+
+
+class Timings:
+    """
+    Stage durations of one request. A recording instance (the request's own) feeds the metrics
+    as it goes; a non-recording one only collects, e.g. in a worker process, and is merged into
+    the request's when the work comes back.
+    """
+
+    def __init__(self, record: bool = False):
+        self.record = record
+        self.stages: Dict[str, float] = {}
+        self.effects: Dict[str, float] = {}
+        # (voice, characters, synthesis seconds, audio seconds) per synthesis
+        self.syntheses: List[Tuple[str, int, float, float]] = []
+        # (voice, seconds) of final audio
+        self.outputs: List[Tuple[str, float]] = []
+
+    def add_stage(self, name: str, seconds: float) -> None:
+        self.stages[name] = self.stages.get(name, 0.0) + seconds
+        if self.record:
+            STAGE_DURATION.observe(seconds, name)
+
+    def add_effect(self, name: str, seconds: float) -> None:
+        self.effects[name] = self.effects.get(name, 0.0) + seconds
+        if self.record:
+            EFFECT_DURATION.observe(seconds, name)
+
+    def add_synthesis(self, voice: str, characters: int, seconds: float, audio_seconds: float) -> None:
+        self.syntheses.append((voice, characters, seconds, audio_seconds))
+        if self.record:
+            INPUT_CHARACTERS.inc(voice, amount=characters)
+            if audio_seconds > 0:
+                REAL_TIME_FACTOR.observe(seconds / audio_seconds, voice)
+
+    def add_output(self, voice: str, seconds: float) -> None:
+        self.outputs.append((voice, seconds))
+        if self.record:
+            OUTPUT_SECONDS.inc(voice, amount=seconds)
+
+    def merge(self, other: "Timings") -> None:
+        for name, seconds in other.stages.items():
+            self.add_stage(name, seconds)
+        for name, seconds in other.effects.items():
+            self.add_effect(name, seconds)
+        for synthesis in other.syntheses:
+            self.add_synthesis(*synthesis)
+        for output in other.outputs:
+            self.add_output(*output)
+
+    def server_timing(self, total: Optional[float] = None) -> str:
+        """
+        `Server-Timing` header value, durations in milliseconds.
+        """
+        entries = [f"{name};dur={seconds * 1000:.1f}" for name, seconds in self.stages.items()]
+        entries += [f"effect-{name};dur={seconds * 1000:.1f}" for name, seconds in self.effects.items()]
+        if total is not None:
+            entries.append(f"total;dur={total * 1000:.1f}")
+        return ", ".join(entries)
+
+
+_current: ContextVar[Optional[Timings]] = ContextVar("timings", default=None)
+
+
+def current() -> Optional[Timings]:
+    return _current.get()
+
+
+def activate(timings: Optional[Timings]):
+    """
+    Makes `timings` the collector of the current context (copied into tasks and
+    `asyncio.to_thread` calls, not into executor jobs). Returns a token for `deactivate`.
+    """
+    return _current.set(timings)
+
+
+def deactivate(token) -> None:
+    _current.reset(token)
+
+
+@contextmanager
+def stage(name: str) -> Iterator[None]:
+    """
+    Times a block as a pipeline stage of the current request (nothing outside a request).
+    """
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        record_stage(name, time.perf_counter() - start)
+
+
+def record_stage(name: str, seconds: float) -> None:
+    timings = _current.get()
+    if timings is not None:
+        timings.add_stage(name, seconds)
+
+
+def record_effect(name: str, seconds: float) -> None:
+    timings = _current.get()
+    if timings is not None:
+        timings.add_effect(name, seconds)
+
+
+def record_synthesis(voice: str, characters: int, seconds: float, audio_seconds: float) -> None:
+    timings = _current.get()
+    if timings is not None:
+        timings.add_synthesis(voice, characters, seconds, audio_seconds)
+
+
+def record_output(voice: str, seconds: float) -> None:
+    timings = _current.get()
+    if timings is not None:
+        timings.add_output(voice, seconds)
+
+
+def timed(fn: Callable, submitted: float, *args):
+    """
+    Worker side of a job: runs `fn(*args)` with a fresh collector and returns the result with
+    the timings, so they survive a worker process. `submitted` (time.time()) gives the queue wait.
+
+    Returns:
+        Tuple[Any, Timings]
+    """
+    timings = Timings()
+    timings.add_stage("queue", max(0.0, time.time() - submitted))
+    token = _current.set(timings)
+    try:
+        return fn(*args), timings
+    finally:
+        _current.reset(token)
@@ -0,0 +1,197 @@
+import os
+import json
+import threading
+import logging
+from collections import OrderedDict
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Dict, Iterator, Optional
+
+try:
+    import onnxruntime
+    from piper.voice import PiperVoice
+    from piper.config import PiperConfig
+except ImportError:  # piper-tts / onnxruntime not installed, only the subprocess mode is usable
+    onnxruntime = None
+    PiperVoice = None
+    PiperConfig = None
+
+logger = logging.getLogger(__name__)
+
+# "onnx" runs the voices inside the server process, "subprocess" spawns the piper CLI per request
+PIPER_ENGINE = os.getenv("PIPER_ENGINE", "onnx").lower()
+PIPER_INTRA_OP_THREADS = int(os.getenv("PIPER_INTRA_OP_THREADS", 0))  # 0 = onnxruntime default
+PIPER_INTER_OP_THREADS = int(os.getenv("PIPER_INTER_OP_THREADS", 0))
+PIPER_MAX_VOICES = int(os.getenv("PIPER_MAX_VOICES", 4))
+PIPER_MAX_MEMORY_MB = int(os.getenv("PIPER_MAX_MEMORY_MB", 1024))
+PIPER_USE_CUDA = os.getenv("PIPER_USE_CUDA", "0") == "1"
+
+
+@dataclass
+class LoadedVoice:
+    voice: "PiperVoice"
+    config: Dict
+    size_bytes: int
+
+
+class PiperEngine:
+    """
+    In-process Piper synthesis.
+
+    Keeps an LRU of loaded onnxruntime sessions (and their parsed `.onnx.json` configs)
+    keyed by `local-voice`, bounded both by count and by an estimated memory footprint
+    (the size of the `.onnx` file).
+    """
+
+    def __init__(
+        self,
+        intra_op_threads: int = PIPER_INTRA_OP_THREADS,
+        inter_op_threads: int = PIPER_INTER_OP_THREADS,
+        max_voices: int = PIPER_MAX_VOICES,
+        max_memory_mb: int = PIPER_MAX_MEMORY_MB,
+        use_cuda: bool = PIPER_USE_CUDA
+    ):
+        if not PiperEngine.available():
+            raise RuntimeError("onnxruntime and piper-tts are required for the in-process engine")
+
+        self.intra_op_threads = intra_op_threads
+        self.inter_op_threads = inter_op_threads
+        self.max_voices = max(1, max_voices)
+        self.max_memory_bytes = max_memory_mb * 1024 * 1024
+        self.use_cuda = use_cuda
+
+        self._voices: "OrderedDict[str, LoadedVoice]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._load_locks: Dict[str, threading.Lock] = {}
+
+    @staticmethod
+    def available() -> bool:
+        return onnxruntime is not None and PiperVoice is not None
+
+    def _session_options(self):
+        options = onnxruntime.SessionOptions()
+        if self.intra_op_threads > 0:
+            options.intra_op_num_threads = self.intra_op_threads
+        if self.inter_op_threads > 0:
+            options.inter_op_num_threads = self.inter_op_threads
+        return options
+
+    def _load(self, model_path: Path, config: Optional[Dict] = None) -> LoadedVoice:
+        if config is None:
+            with open(Path(f"{model_path}.json"), "r", encoding="utf-8") as config_file:
+                config = json.load(config_file)
+
+        providers = ["CUDAExecutionProvider"] if self.use_cuda else ["CPUExecutionProvider"]
+        session = onnxruntime.InferenceSession(
+            str(model_path),
+            sess_options=self._session_options(),
+            providers=providers
+        )
+
+        return LoadedVoice(
+            voice=PiperVoice(session=session, config=PiperConfig.from_dict(config)),
+            config=config,
+            size_bytes=model_path.stat().st_size
+        )
+
+    def _evict_over_budget(self):
+        # Called with self._lock held. The most recently used voice is always kept.
+        total = sum(v.size_bytes for v in self._voices.values())
+        while len(self._voices) > 1 and (len(self._voices) > self.max_voices or total > self.max_memory_bytes):
+            key, evicted = self._voices.popitem(last=False)
+            total -= evicted.size_bytes
+            logger.info("Evicted piper voice %s (%d bytes)", key, evicted.size_bytes)
+
+    def get_voice(self, key: str, model_path: Path, config: Optional[Dict] = None) -> LoadedVoice:
+        """
+        Returns the loaded voice for `key`, loading `model_path` on a cache miss (with its
+        already parsed `config`, if given). Concurrent misses on the same voice only load it once.
+        """
+        with self._lock:
+            loaded = self._voices.get(key)
+            if loaded is not None:
+                self._voices.move_to_end(key)
+                return loaded
+            load_lock = self._load_locks.setdefault(key, threading.Lock())
+
+        with load_lock:
+            with self._lock:
+                loaded = self._voices.get(key)
+                if loaded is not None:
+                    self._voices.move_to_end(key)
+                    return loaded
+
+            loaded = self._load(model_path, config)
+
+            with self._lock:
+                self._voices[key] = loaded
+                self._evict_over_budget()
+                self._load_locks.pop(key, None)
+
+        return loaded
+
+    def synthesize_stream_raw(
+        self,
+        key: str,
+        model_path: Path,
+        text: str,
+        silence: float = 1,
+        speed: float = 1.0,
+        noise_w: float = 0.8
+    ) -> Iterator[bytes]:
+        """
+        Yields 16-bit mono PCM, one sentence (followed by its silence) at a time.
+        """
+        loaded = self.get_voice(key, model_path)
+        yield from loaded.voice.synthesize_stream_raw(
+            text,
+            length_scale=speed,
+            noise_w=noise_w,
+            sentence_silence=silence
+        )
+
+    def evict(self, key: str) -> None:
+        with self._lock:
+            self._voices.pop(key, None)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._voices.clear()
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return {
+                "voices": list(self._voices.keys()),
+                "memory_bytes": sum(v.size_bytes for v in self._voices.values()),
+                "max_memory_bytes": self.max_memory_bytes,
+                "max_voices": self.max_voices,
+            }
+
+
+_engine: Optional[PiperEngine] = None
+_engine_lock = threading.Lock()
+_fallback_warned = False
+
+
+def get_engine() -> Optional[PiperEngine]:
+    """
+    Returns the process-wide engine, or None when the subprocess mode is configured
+    or the in-process dependencies are missing.
+    """
+    global _engine, _fallback_warned
+
+    if PIPER_ENGINE != "onnx":
+        return None
+
+    if not PiperEngine.available():
+        if not _fallback_warned:
+            logger.warning("onnxruntime/piper-tts not importable, falling back to the piper subprocess")
+            _fallback_warned = True
+        return None
+
+    if _engine is None:
+        with _engine_lock:
+            if _engine is None:
+                _engine = PiperEngine()
+
+    return _engine
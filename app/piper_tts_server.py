@@ -1,23 +1,92 @@
 import os
+import asyncio
+from contextlib import asynccontextmanager
 from pathlib import Path
 from fastapi import FastAPI, HTTPException, Request, Depends
-from fastapi.responses import FileResponse, JSONResponse
+from fastapi.responses import JSONResponse, PlainTextResponse, StreamingResponse
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.security import HTTPBasic, HTTPBasicCredentials
 from pydantic import BaseModel
 from typing import Optional, List, Dict, Any
 import secrets
+import hashlib
+import json
+import time
 
-from tts import synthesize_text
-from audio_utils import to_portable_file
+from synthesis import (synthesize_request, stream_request, output_sample_width, validate_request, model_name,
+                       submit_chatterbox, finish_request, voice_label, model_version, cacheable)
 from audio_file_utils import AudioFileUtils
-from effects.chain_processor import EffectChainProcessor
+from worker_pool import WorkerPool, PoolSaturatedError, WORKER_RETRY_AFTER
+from result_cache import ResultCache, request_key
+from audio_formats import ensure_variant, get_format, is_variant, negotiate, OUTPUT_FORMATS
+from janitor import OutputJanitor
+from file_serving import FileServer
+from metrics import (REGISTRY, HTTP_DURATION, HTTP_ERRORS, HTTP_REQUESTS, METRICS_SERVER_TIMING, CounterGauge, Gauge,
+                     Timings, activate, current, deactivate, record_synthesis, stage, timed)
+from sentence_synthesis import sentence_cache
+from batch_synthesis import BATCH_MAX_ITEMS, BATCH_PARALLELISM, deduplicate, fan_out, stream_zip
+from voice_registry import VOICE_PREWARM, voice_registry
+from tts import prewarm_voices
+from piper_engine import get_engine
+from chatter import CHATTER_PRELOAD, chatter_stats, preload_chatter
+from jobs import FINISHED, JOBS_INTERACTIVE_MAX_CHARS, JOBS_RETENTION_HOURS, JobQueueFullError, JobScheduler, JobStore, job_view
 
 SERVER_PORT = int(os.getenv("SERVER_PORT", 8000))
 OUTPUT_DIR = Path(os.getenv("OUTPUT_PATH", "/output")).resolve()
 API_KEY = os.getenv("API_KEY", None)
 
-app = FastAPI()
+# Synthesis and effects are blocking, they run on a bounded pool so the event loop stays free
+worker_pool = WorkerPool()
+# Identical requests are served from previously generated files
+result_cache = ResultCache(OUTPUT_DIR)
+# Keeps OUTPUT_DIR within its TTL and quota, both indexes forget what the other one removes
+janitor = OutputJanitor(OUTPUT_DIR)
+# Downloads, with the hottest files in memory
+file_server = FileServer(OUTPUT_DIR)
+
+def _removed_by_janitor(filename: str):
+    result_cache.discard(filename)
+    file_server.invalidate(filename)
+
+def _removed_by_cache(filename: str):
+    janitor.forget(filename)
+    file_server.invalidate(filename)
+
+janitor.on_evict = _removed_by_janitor
+result_cache.on_evict = _removed_by_cache
+
+# Set once the VOICE_PREWARM voices (and the Chatterbox model, with CHATTER_PRELOAD) are loaded,
+# the healthcheck reports ready from then on
+voices_ready = asyncio.Event()
+
+async def prewarm_piper():
+    voices = await asyncio.to_thread(voice_registry.resolve, VOICE_PREWARM)
+    await asyncio.to_thread(prewarm_voices, voices)
+
+async def prewarm():
+    try:
+        await asyncio.gather(
+            prewarm_piper(),
+            asyncio.to_thread(preload_chatter) if CHATTER_PRELOAD else asyncio.sleep(0)
+        )
+    finally:
+        voices_ready.set()
+
+@asynccontextmanager
+async def lifespan(_app: FastAPI):
+    await asyncio.to_thread(retain_job_outputs)
+    sweeper = asyncio.create_task(janitor.run())
+    warmup = asyncio.create_task(prewarm())
+    dispatcher = asyncio.create_task(job_scheduler.run())
+    try:
+        yield
+    finally:
+        sweeper.cancel()
+        warmup.cancel()
+        dispatcher.cancel()
+        await job_scheduler.shutdown()
+
+app = FastAPI(lifespan=lifespan)
 
 app.add_middleware(
     CORSMiddleware,
@@ -27,6 +96,54 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Gauges read from the components when /metrics is scraped
+for _name, _help, _read in [
+    ("webpiper_workers_in_flight", "Jobs running on the worker pool.", lambda: worker_pool.stats()["in_flight"]),
+    ("webpiper_workers_queue_depth", "Jobs waiting for a worker.", lambda: worker_pool.stats()["queue_depth"]),
+    ("webpiper_result_cache_bytes", "Size of the cached results.", lambda: result_cache.stats()["bytes"]),
+    ("webpiper_output_bytes", "Size of the output directory.", lambda: janitor.stats()["bytes"]),
+    ("webpiper_jobs_queued", "Jobs waiting to start.", lambda: sum(job_scheduler.stats()["queued"].values())),
+    ("webpiper_jobs_running", "Jobs running.", lambda: sum(job_scheduler.stats()["running"].values())),
+]:
+    REGISTRY.register(Gauge(_name, _help, _read))
+REGISTRY.register(CounterGauge(
+    "webpiper_workers_rejected_total", "Jobs rejected because the pool was saturated.",
+    lambda: worker_pool.stats()["rejected"]))
+
+@app.middleware("http")
+async def instrument(request: Request, call_next):
+    # Stages timed anywhere down the request (tasks and to_thread calls included) land here
+    timings = Timings(record=True)
+    token = activate(timings)
+    start = time.perf_counter()
+    status = 500
+    try:
+        response = await call_next(request)
+        status = response.status_code
+    finally:
+        deactivate(token)
+        elapsed = time.perf_counter() - start
+        route = request.scope.get("route")
+        # Route templates, not raw paths, keep the label set bounded
+        route = route.path if route is not None else "unmatched"
+        HTTP_REQUESTS.inc(request.method, route, status)
+        HTTP_DURATION.observe(elapsed, request.method, route)
+        if status >= 400:
+            HTTP_ERRORS.inc(route, status)
+
+    if METRICS_SERVER_TIMING:
+        response.headers["Server-Timing"] = timings.server_timing(elapsed)
+    return response
+
+async def run_timed(fn, *args):
+    """
+    Runs `fn(*args)` on the worker pool, adding its stage timings to the current request.
+    """
+    result, timings = await worker_pool.run(timed, fn, time.time(), *args)
+    if current() is not None:
+        current().merge(timings)
+    return result
+
 # Security
 security = HTTPBasic()
 
@@ -43,9 +160,16 @@ def verify_api_key(credentials: HTTPBasicCredentials = Depends(security)):
     if not (correct_username and correct_password):
         raise HTTPException(status_code=401, detail="Unauthorized")
 
+def client_key(credentials: HTTPBasicCredentials = Depends(security), _auth: None = Depends(verify_api_key)) -> str:
+    """
+    Identifies the client of a request by its credentials (without keeping them), for the job queue fairness.
+    """
+    return hashlib.sha256(f"{credentials.username}:{credentials.password}".encode()).hexdigest()[:16]
+
 # Request schema
 class SynthesizeRequest(BaseModel):
     text: str
+    model: Optional[str] = "piper"  # "piper" or "chatterbox"
     local: Optional[str] = "fr_FR"
     voice: Optional[str] = "siwis-medium"
     silence: Optional[int] = 1
@@ -53,51 +177,375 @@ class SynthesizeRequest(BaseModel):
     noise_w: Optional[float] = 0.8
     effects: Optional[List[Dict[str, Any]]] = None
     lite_file: Optional[bool] = False
+    lite_rate: Optional[int] = 48000  # Hz, used with lite_file (e.g. 8000 / 16000 / 24000 for telephony)
+    lite_sample_width: Optional[int] = 2  # bytes, used with lite_file: 1 (8-bit), 2 (16-bit) or 3 (24-bit)
+    output_format: Optional[str] = "wav"  # "wav", "flac", "opus", "mulaw" or "alaw"
+    parallel_sentences: Optional[bool] = None  # synthesize the sentences concurrently, SENTENCE_PARALLEL by default
+    # Chatterbox only
+    exaggeration: Optional[float] = 0.5
+    cfg_weight: Optional[float] = 0.5
+    prompt: Optional[str] = None  # reference voice, a WAV file name (without `.wav`) of CHATTER_VOICE_PATH
+
+class BatchSynthesizeRequest(BaseModel):
+    items: List[SynthesizeRequest]
+    response_format: Optional[str] = "manifest"  # "manifest" (JSON list of URLs) or "zip"
+    parallelism: Optional[int] = None  # items synthesized at once, capped by BATCH_PARALLELISM
+
+class SynthesizeStreamRequest(SynthesizeRequest):
+    stream_format: Optional[str] = "wav"  # "wav" or "raw" (headerless mono PCM)
+
+class JobRequest(SynthesizeRequest):
+    priority: Optional[str] = None  # "interactive" or "bulk", by default interactive up to JOBS_INTERACTIVE_MAX_CHARS characters
+
+def pool_saturated() -> HTTPException:
+    return HTTPException(
+        status_code=503,
+        detail="Server busy, retry later",
+        headers={"Retry-After": str(WORKER_RETRY_AFTER)}
+    )
+
+async def encoded_variant(filename: str, fmt) -> str:
+    """
+    Name of the `fmt` encoding of a WAV file in OUTPUT_DIR, encoded on first use and kept next to it.
+    """
+    if fmt.encode is None:
+        return filename
+    variant = await run_timed(ensure_variant, OUTPUT_DIR / filename, fmt)
+    result_cache.add_variant(variant.name)
+    register_output(variant.name)
+    return variant.name
+
+def register_output(filename: str):
+    # New files enter the janitor index, known ones count as accessed
+    if not janitor.touch(filename):
+        janitor.add(filename)
+
+async def render_to_file(params: Dict[str, Any]) -> str:
+    if model_name(params) != "chatterbox":
+        return await run_timed(synthesize_request, params)
+
+    # Generated by the Chatterbox batch scheduler, with the other requests of the same voice &
+    # settings, without holding a worker while waiting; the post-processing runs on the pool
+    await asyncio.to_thread(validate_request, params)
+    start = time.perf_counter()
+    with stage("chatterbox"):
+        # Submitted from a thread: the first call builds the wrapper, which may prewarm voices
+        future = await asyncio.to_thread(submit_chatterbox, params)
+        audio, framerate = await asyncio.wrap_future(future)
+    record_synthesis(voice_label(params), len(params["text"]), time.perf_counter() - start, len(audio) / framerate)
+    return await run_timed(finish_request, params, audio, framerate)
+
+async def synthesize_to_file(params: Dict[str, Any]) -> str:
+    """
+    Synthesizes one request (or finds it in the result cache) and returns its file name.
+    """
+    params = dict(params)
+    # Every format is encoded from the same cached WAV
+    fmt = get_format(params.pop("output_format"))
+    if cacheable(params):
+        filename = await result_cache.get_or_create(request_key(params, model_version(params)), lambda: render_to_file(params))
+    else:
+        # Drawn anew every time: neither served from the cache nor stored in it
+        filename = await render_to_file(params)
+    register_output(filename)
+    return await encoded_variant(filename, fmt)
 
 # Protected endpoint
 @app.post("/api/v1/synthesize")
 async def synthesize(req: SynthesizeRequest, _auth: None = Depends(verify_api_key)):
     try:
-        output_file = synthesize_text(
-            text=req.text,
-            local=req.local,
-            voice=req.voice,
-            silence=req.silence,
-            speed=req.speed,
-            noise_w=req.noise_w
-        )
+        filename = await synthesize_to_file(req.model_dump())
+    except PoolSaturatedError:
+        raise pool_saturated()
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    return JSONResponse(
+        status_code=200,
+        content={
+            "filename": filename,
+            "url": f"/api/v1/synthesize/{filename}"
+        }
+    )
+
+# Protected batch endpoint: identical items are synthesized once, the others in parallel
+@app.post("/api/v1/synthesize/batch")
+async def synthesize_batch(req: BatchSynthesizeRequest, _auth: None = Depends(verify_api_key)):
+    if req.response_format not in ("manifest", "zip"):
+        raise HTTPException(status_code=400, detail=f"Unknown response format: {req.response_format}")
+    if not req.items:
+        raise HTTPException(status_code=400, detail="Empty batch")
+    if len(req.items) > BATCH_MAX_ITEMS:
+        raise HTTPException(status_code=400, detail=f"Too many items: {len(req.items)} (max {BATCH_MAX_ITEMS})")
 
-        if req.effects:
-            audio, framerate = AudioFileUtils.wav_to_audio(output_file)
-            processor = EffectChainProcessor()
-            audio = processor.apply_chain(audio, framerate, req.effects)
-            AudioFileUtils.audio_to_wav(audio, framerate, output_file)
-
-        if req.lite_file:
-            to_portable_file(output_file, output_file)
-
-        filename = Path(output_file).name
-        return JSONResponse(
-            status_code=200,
-            content={
-                "filename": filename,
-                "url": f"/api/v1/synthesize/{filename}"
-            }
+    unique, mapping = deduplicate([item.model_dump() for item in req.items])
+    parallelism = min(req.parallelism or BATCH_PARALLELISM, BATCH_PARALLELISM)
+    results = fan_out(unique, synthesize_to_file, parallelism)
+
+    if req.response_format == "zip":
+        return StreamingResponse(
+            stream_zip(results, mapping, OUTPUT_DIR),
+            media_type="application/zip",
+            headers={"Content-Disposition": 'attachment; filename="batch.zip"'}
         )
+
+    outcomes = {}
+    async for position, filename, error in results:
+        outcomes[position] = (filename, error)
+
+    items = []
+    for index, position in enumerate(mapping):
+        filename, error = outcomes[position]
+        if filename is None:
+            items.append({"index": index, "error": error})
+        else:
+            items.append({"index": index, "filename": filename, "url": f"/api/v1/synthesize/{filename}"})
+
+    failed = sum(1 for item in items if "error" in item)
+    return JSONResponse(
+        status_code=200,
+        content={
+            "items": items,
+            "unique": len(unique),
+            "succeeded": len(items) - failed,
+            "failed": failed,
+        }
+    )
+
+async def run_job(params: Dict[str, Any]) -> Dict[str, Any]:
+    # Jobs run outside any request: collect their stages and syntheses into the metrics here
+    token = activate(Timings(record=True))
+    try:
+        filename = await synthesize_to_file(params)
+    finally:
+        deactivate(token)
+    # The file must outlive the job row that points at it
+    janitor.retain(filename, time.time() + JOBS_RETENTION_HOURS * 3600)
+    return {"filename": filename, "url": f"/api/v1/synthesize/{filename}"}
+
+def retain_job_outputs():
+    # The janitor index is rebuilt from the directory on start, without the job retention
+    for job in job_scheduler.store.succeeded():
+        janitor.retain(job["result"]["filename"], job["finished_at"] + JOBS_RETENTION_HOURS * 3600)
+
+# Queued jobs, stored in SQLite so they survive a restart
+job_scheduler = JobScheduler(JobStore(), run_job)
+
+# Longest wait of a long-polling job status request (seconds)
+JOB_MAX_WAIT = 60
+
+async def owned_job(job_id: str, owner: str) -> Dict[str, Any]:
+    job = await job_scheduler.get(job_id)
+    # Other clients' jobs don't exist for this one
+    if job is None or job["owner"] != owner:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job
+
+# Protected job submission: answers right away with the job id
+@app.post("/api/v1/jobs", status_code=202)
+async def submit_job(req: JobRequest, owner: str = Depends(client_key)):
+    params = req.model_dump()
+    lane = params.pop("priority") or ("interactive" if len(req.text) <= JOBS_INTERACTIVE_MAX_CHARS else "bulk")
+    try:
+        get_format(params["output_format"])
+        await asyncio.to_thread(validate_request, params)
+        job = await job_scheduler.submit(owner, lane, params)
+    except JobQueueFullError:
+        raise pool_saturated()
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return dict(job_view(job), url=f"/api/v1/jobs/{job['id']}")
+
+# Protected job status, `?wait=` seconds to long-poll until the job changes status
+@app.get("/api/v1/jobs/{job_id}")
+async def get_job(job_id: str, wait: float = 0, owner: str = Depends(client_key)):
+    job = await owned_job(job_id, owner)
+    if wait > 0 and job["status"] not in FINISHED:
+        await job_scheduler.wait(job_id, min(wait, JOB_MAX_WAIT))
+        job = await owned_job(job_id, owner)
+    return job_view(job)
+
+# Protected job events: Server-Sent Events, one `status` event per status change until the job is finished
+@app.get("/api/v1/jobs/{job_id}/events")
+async def job_events(job_id: str, owner: str = Depends(client_key)):
+    job = await owned_job(job_id, owner)
+
+    async def events():
+        current_job, sent = job, None
+        while True:
+            if current_job["status"] != sent:
+                sent = current_job["status"]
+                yield f"event: status\ndata: {json.dumps(job_view(current_job))}\n\n".encode()
+                if sent in FINISHED:
+                    return
+            else:
+                yield b": keep-alive\n\n"
+            await job_scheduler.wait(job_id, 15)
+            current_job = await job_scheduler.get(job_id)
+            if current_job is None:
+                return
+
+    return StreamingResponse(events(), media_type="text/event-stream", headers={"Cache-Control": "no-cache"})
+
+# Protected job cancellation, for jobs that have not started
+@app.delete("/api/v1/jobs/{job_id}")
+async def cancel_job(job_id: str, owner: str = Depends(client_key)):
+    await owned_job(job_id, owner)
+    if not await job_scheduler.cancel(job_id):
+        raise HTTPException(status_code=409, detail="Job already started")
+    return job_view(await owned_job(job_id, owner))
+
+class PooledStream:
+    """
+    Pulls the chunks of a blocking generator off the event loop, for a stream holding a worker
+    slot. `close` waits for a chunk still being produced, closes the generator and frees the
+    slot, once, whether the stream ended, failed, was cut by the client or never started.
+    """
+
+    def __init__(self, chunks, header: Optional[bytes] = None):
+        self.chunks = chunks
+        self.header = header
+        self._pending: Optional[asyncio.Task] = None
+        self._closed = False
+
+    async def iterate(self):
+        if self.header is not None:
+            yield self.header
+        while True:
+            # Shielded: a disconnect cancels the wait, not the thread running the generator
+            self._pending = asyncio.ensure_future(asyncio.to_thread(next, self.chunks, None))
+            chunk = await asyncio.shield(self._pending)
+            if chunk is None:
+                break
+            yield chunk
+
+    async def close(self):
+        if self._closed:
+            return
+        self._closed = True
+        try:
+            if self._pending is not None:
+                # A generator can't be closed while it is executing
+                await asyncio.wait([self._pending])
+                if not self._pending.cancelled():
+                    self._pending.exception()  # reported through the stream already, if at all
+            await asyncio.to_thread(self.chunks.close)
+        finally:
+            worker_pool.release()
+
+class PooledStreamingResponse(StreamingResponse):
+    def __init__(self, stream: PooledStream, **kwargs):
+        super().__init__(stream.iterate(), **kwargs)
+        self.stream = stream
+
+    async def __call__(self, scope, receive, send):
+        try:
+            await super().__call__(scope, receive, send)
+        finally:
+            # Shielded so a cancelled request still frees its slot
+            await asyncio.shield(self.stream.close())
+
+# Protected streaming endpoint: audio is sent sentence by sentence as it is synthesized
+@app.post("/api/v1/synthesize/stream")
+async def synthesize_stream(req: SynthesizeStreamRequest, _auth: None = Depends(verify_api_key)):
+    if req.stream_format not in ("wav", "raw"):
+        raise HTTPException(status_code=400, detail=f"Unknown stream format: {req.stream_format}")
+    if (req.output_format or "wav") != "wav":
+        raise HTTPException(status_code=400, detail="Streams are PCM only, use stream_format")
+
+    try:
+        worker_pool.acquire()
+    except PoolSaturatedError:
+        raise pool_saturated()
+
+    params = req.model_dump()
+    params.pop("output_format")
+    try:
+        framerate, chunks = await asyncio.to_thread(stream_request, params)
+        sampwidth = output_sample_width(params)
     except Exception as e:
+        worker_pool.release()
         raise HTTPException(status_code=400, detail=str(e))
 
-# Protected file download
+    stream = PooledStream(chunks, AudioFileUtils.wav_stream_header(framerate, sampwidth) if req.stream_format == "wav" else None)
+
+    if req.stream_format == "wav":
+        media_type = "audio/wav"
+    else:
+        media_type = "application/octet-stream"
+
+    return PooledStreamingResponse(
+        stream,
+        media_type=media_type,
+        headers={"X-Sample-Rate": str(framerate), "X-Sample-Width": str(sampwidth), "X-Channels": "1"}
+    )
+
+# Protected voice listing
+@app.get("/api/v1/voices")
+async def list_voices(local: Optional[str] = None, _auth: None = Depends(verify_api_key)):
+    voices = await asyncio.to_thread(voice_registry.list, local)
+    engine = get_engine()
+    loaded = set(engine.stats()["voices"]) if engine is not None else set()
+    return {
+        "voices": [dict(info.to_dict(), loaded=info.key in loaded) for info in sorted(voices, key=lambda v: v.key)],
+    }
+
+# Protected file download. WAV files are served in the format asked for by the Accept header,
+# with ETag / Range support.
 @app.get("/api/v1/synthesize/{filename}")
-async def get_audio_file(filename: str, _auth: None = Depends(verify_api_key)):
-    file_path = OUTPUT_DIR / filename
-    if not file_path.exists():
+async def get_audio_file(request: Request, filename: str, _auth: None = Depends(verify_api_key)):
+    # The janitor index knows every file of OUTPUT_DIR, unknown names never reach the disk
+    if not janitor.touch(filename):
+        raise HTTPException(status_code=404, detail="File not found")
+
+    headers = None
+    if is_variant(Path(filename)):
+        # Already encoded, served as is
+        fmt = max((f for f in OUTPUT_FORMATS.values() if filename.endswith(f.suffix)),
+                  key=lambda f: len(f.suffix), default=OUTPUT_FORMATS["wav"])
+    else:
+        fmt = negotiate(request.headers.get("accept"))
+        if fmt is None:
+            raise HTTPException(
+                status_code=406,
+                detail=f"Available types: {', '.join(sorted({f.media_type for f in OUTPUT_FORMATS.values()}))}"
+            )
+        headers = {"Vary": "Accept"}
+
+        try:
+            filename = await encoded_variant(filename, fmt)
+        except PoolSaturatedError:
+            raise pool_saturated()
+        except FileNotFoundError:
+            raise HTTPException(status_code=404, detail="File not found")
+        except Exception as e:
+            raise HTTPException(status_code=400, detail=str(e))
+
+    try:
+        return await file_server.serve(request, filename, fmt.media_type, headers)
+    except FileNotFoundError:
+        janitor.forget(filename)
         raise HTTPException(status_code=404, detail="File not found")
-    return FileResponse(file_path, media_type="audio/wav")
 
-# Unprotected healthcheck
+# Unprotected Prometheus metrics
+@app.get("/metrics")
+async def metrics():
+    return PlainTextResponse(REGISTRY.render(), media_type="text/plain; version=0.0.4")
+
+# Unprotected healthcheck, 503 until the VOICE_PREWARM voices (and the Chatterbox model) are loaded
 @app.get("/api/healthcheck")
 async def healthcheck():
-    return {"status": "ok"}
+    body = {
+        "status": "ok" if voices_ready.is_set() else "warming",
+        "workers": worker_pool.stats(),
+        "cache": result_cache.stats(),
+        "outputs": janitor.stats(),
+        "file_cache": file_server.stats(),
+        "sentences": sentence_cache.stats(),
+        "voices": voice_registry.stats(),
+        "jobs": job_scheduler.stats(),
+        "chatterbox": chatter_stats(),
+    }
+    return body if voices_ready.is_set() else JSONResponse(body, status_code=503)
 
 # Run in dev with: cd app && uvicorn piper_tts_server:app --host 0.0.0.0 --port $SERVER_PORT
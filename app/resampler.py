@@ -0,0 +1,178 @@
+import math
+from dataclasses import dataclass
+from functools import lru_cache
+
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+
+# Zero crossings of the windowed sinc on each side, at the lower of the two rates
+ZERO_CROSSINGS = 16
+# Cutoff as a fraction of the lower Nyquist frequency, leaves room for the transition band
+ROLLOFF = 0.945
+KAISER_BETA = 8.6
+# Largest (W, L) block matrix, rules out near-coprime rate pairs
+MAX_MATRIX_SIZE = 1 << 22
+# Outputs per block, at least
+MIN_BLOCK_OUTPUTS = 64
+# Blocks per GEMM, bounds the copy of the strided windows
+BLOCKS_PER_PRODUCT = 2048
+
+
+@dataclass(frozen=True)
+class FilterBank:
+    up: int  # L: dst_rate / gcd
+    down: int  # M: src_rate / gcd
+    taps: int  # K: taps per phase
+    delay: int  # D: prototype filter delay, in upsampled samples
+    phases: np.ndarray  # (L, K) float32, taps in input order
+    block_out: int  # outputs per block, a multiple of L
+    block_in: int  # inputs per block, the same multiple of M
+    width: int  # W: input samples read by one block
+    matrix: np.ndarray  # (W, block_out) float32: a block of outputs is window @ matrix
+
+
+def _design(src_rate: int, dst_rate: int):
+    g = math.gcd(src_rate, dst_rate)
+    up, down = dst_rate // g, src_rate // g
+    taps = int(math.ceil(2 * ZERO_CROSSINGS * max(1.0, down / up)))
+    delay = (taps * up - 1) // 2
+    repeat = -(-MIN_BLOCK_OUTPUTS // up)
+    width = ((up * repeat - 1) * down + delay) // up + taps
+    return up, down, taps, delay, repeat, width
+
+
+def check_ratio(src_rate: int, dst_rate: int) -> None:
+    """
+    Raises ValueError for a rate pair the resampler can't handle (near-coprime rates, whose
+    block matrix would be too large), without designing the filter.
+    """
+    if src_rate == dst_rate:
+        return
+    up, _, _, _, repeat, width = _design(src_rate, dst_rate)
+    if width * up * repeat > MAX_MATRIX_SIZE:
+        raise ValueError(f"Unsupported resampling ratio {src_rate} -> {dst_rate}")
+
+
+@lru_cache(maxsize=32)
+def filter_bank(src_rate: int, dst_rate: int) -> FilterBank:
+    """
+    Designs the polyphase decomposition of a Kaiser windowed sinc low-pass for src_rate -> dst_rate,
+    once per pair (e.g. 22050 -> 48000 is L/M = 320/147, 16000 -> 48000 is 3/1).
+    """
+    check_ratio(src_rate, dst_rate)
+    up, down, taps, delay, repeat, width = _design(src_rate, dst_rate)
+    length = taps * up
+
+    # Prototype at the upsampled rate, cutoff below the lower of the two Nyquist frequencies.
+    # Odd length 2D + 1, centered on tap D so output n lines up with input n * M / L; when
+    # K * L is even the last tap is a zero.
+    cutoff = ROLLOFF * 0.5 / max(up, down)
+    span = 2 * delay + 1
+    m = np.arange(span) - delay
+    prototype = np.zeros(length)
+    prototype[:span] = 2 * cutoff * np.sinc(2 * cutoff * m) * np.kaiser(span, KAISER_BETA) * up
+
+    # Output n reads input (n * M + D) // L - k with tap h[p + k * L], p = (n * M + D) % L.
+    # Phases are stored with k reversed so each one is a dot product with a forward window.
+    phases = np.ascontiguousarray(prototype.reshape(taps, up).T[:, ::-1], dtype=np.float32)
+
+    # Outputs b * L + j all read from b * M + (j * M + D) // L with phase (j * M + D) % L, so a
+    # whole block of L outputs is one product with a (W, L) matrix, i.e. one GEMM for the buffer.
+    # Small L (16000 -> 48000 is 3/1) are grouped r blocks at a time to give the GEMM wider rows.
+    j = np.arange(up * repeat)
+    offsets = (j * down + delay) // up
+    matrix = np.zeros((width, up * repeat), dtype=np.float32)
+    for column, (offset, phase) in enumerate(zip(offsets, (j * down + delay) % up)):
+        matrix[offset:offset + taps, column] = phases[phase]
+
+    return FilterBank(up, down, taps, delay, phases, up * repeat, down * repeat, width, matrix)
+
+
+class PolyphaseResampler:
+    """
+    Rational ratio resampler for float32 mono audio, usable on a whole buffer (`resample`) or on
+    a stream of chunks: `process` returns what can be computed so far, `flush` the tail once the
+    input is over. Chunked output matches whole-buffer output (up to float32 rounding).
+    """
+
+    def __init__(self, src_rate: int, dst_rate: int):
+        self.src_rate = src_rate
+        self.dst_rate = dst_rate
+        self.bank = filter_bank(src_rate, dst_rate)
+
+        # Input kept for the next outputs, preceded by taps - 1 zeros of history at the start
+        self._buffer = np.zeros(self.bank.taps - 1, dtype=np.float32)
+        self._buffer_start = 0  # position of _buffer[0] in the zero-padded input
+        self._consumed = 0  # input samples received
+        self._produced = 0  # output samples returned
+
+    def _compute(self, count: int) -> np.ndarray:
+        bank = self.bank
+        n0 = self._produced
+        if count <= 0:
+            return np.zeros(0, dtype=np.float32)
+
+        # Whole blocks covering [n0, n0 + count)
+        first_block = n0 // bank.block_out
+        blocks = (n0 + count - 1) // bank.block_out + 1 - first_block
+        start = first_block * bank.block_in - self._buffer_start
+        needed = start + (blocks - 1) * bank.block_in + bank.width
+
+        buffer = self._buffer
+        if needed > len(buffer):
+            # Only outputs past `count` read the zeros, and those are dropped
+            buffer = np.concatenate((buffer, np.zeros(needed - len(buffer), dtype=np.float32)))
+
+        windows = sliding_window_view(buffer, bank.width)[start:start + (blocks - 1) * bank.block_in + 1:bank.block_in]
+        products = np.empty((blocks, bank.block_out), dtype=np.float32)
+        for row in range(0, blocks, BLOCKS_PER_PRODUCT):
+            np.matmul(windows[row:row + BLOCKS_PER_PRODUCT], bank.matrix, out=products[row:row + BLOCKS_PER_PRODUCT])
+        skip = n0 - first_block * bank.block_out
+        output = products.reshape(-1)[skip:skip + count]
+
+        self._produced += count
+        # Drop the input no later block will read
+        keep_from = (self._produced // bank.block_out) * bank.block_in - self._buffer_start
+        if keep_from > 0:
+            self._buffer = self._buffer[keep_from:]
+            self._buffer_start += keep_from
+        return output
+
+    def _available(self, total_input: int) -> int:
+        # Outputs whose whole window lies within the padded input received so far
+        last_start = total_input - 1  # padded length (taps - 1 + total_input) - taps
+        if last_start < 0:
+            return 0
+        # Largest n with (n * M + D) // L <= last_start
+        limit = ((last_start + 1) * self.bank.up - self.bank.delay - 1) // self.bank.down
+        return max(0, limit + 1 - self._produced)
+
+    def process(self, audio: np.ndarray) -> np.ndarray:
+        audio = np.asarray(audio, dtype=np.float32)
+        if len(audio):
+            self._buffer = np.concatenate((self._buffer, audio))
+            self._consumed += len(audio)
+        return self._compute(self._available(self._consumed))
+
+    def flush(self) -> np.ndarray:
+        """
+        Returns the remaining output, as if the input were followed by silence, up to
+        ceil(input length * dst_rate / src_rate) samples in total.
+        """
+        total = -(-self._consumed * self.bank.up // self.bank.down)
+        return self._compute(total - self._produced)
+
+
+def resample(audio: np.ndarray, src_rate: int, dst_rate: int) -> np.ndarray:
+    """
+    Resamples float32 mono audio from src_rate to dst_rate (polyphase windowed sinc filter).
+
+    Returns:
+        np.ndarray: float32 samples, ceil(len(audio) * dst_rate / src_rate) of them.
+    """
+    if src_rate == dst_rate:
+        return np.asarray(audio, dtype=np.float32)
+    resampler = PolyphaseResampler(src_rate, dst_rate)
+    head = resampler.process(audio)
+    tail = resampler.flush()
+    return np.concatenate((head, tail)) if len(tail) else head
@@ -0,0 +1,260 @@
+import os
+import re
+import json
+import asyncio
+import hashlib
+import threading
+from collections import OrderedDict
+from concurrent.futures import Future
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Any, Awaitable, Callable, Dict, Optional, Tuple
+
+OUTPUT_DIR = Path(os.getenv("OUTPUT_PATH", "/output")).resolve()
+RESULT_CACHE_MAX_MB = int(os.getenv("RESULT_CACHE_MAX_MB", 512))
+RESULT_CACHE_POLICY = os.getenv("RESULT_CACHE_POLICY", "lru").lower()  # "lru" or "lfu"
+
+# Cached blobs are named after the full sha256 of the request, which sets them apart
+# from the 32 hex chars uuid4 names of uncached outputs
+_BLOB_NAME = re.compile(r"^[0-9a-f]{64}\.")
+
+
+def request_key(params: Dict[str, Any], model_version: Optional[Tuple] = None) -> str:
+    """
+    Canonical hash of a synthesis request: the same text, voice and settings always
+    give the same key, whatever the field order or the spelling of empty effect params.
+    `model_version` (the `VoiceInfo.signature` of the voice) changes the key when the
+    model is replaced on disk.
+    """
+    canonical = dict(params)
+    if model_version is not None:
+        canonical["model_version"] = list(model_version)
+    canonical["effects"] = [
+        {"name": step.get("name"), "params": step.get("params") or {}}
+        for step in (params.get("effects") or [])
+    ]
+    payload = json.dumps(canonical, sort_keys=True, separators=(",", ":"), ensure_ascii=False)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+@dataclass
+class CacheEntry:
+    filename: str
+    size: int  # the blob and its variants
+    hits: int = 0
+    variants: Dict[str, int] = field(default_factory=dict)  # other encodings of the blob, name -> size
+
+
+class ResultCache:
+    """
+    Content-addressed cache of synthesized files.
+
+    The index lives in memory and the blobs in `directory`, named `<key>.wav`, with their
+    other encodings next to them (`<key>.flac`...), accounted for and evicted together.
+    Total size is bounded by `max_bytes`, evicting the least recently used (or least
+    frequently used) blob first. Concurrent misses on the same key are collapsed into
+    a single synthesis.
+    """
+
+    def __init__(self, directory: Path = OUTPUT_DIR, max_bytes: int = RESULT_CACHE_MAX_MB * 1024 * 1024,
+                 policy: str = RESULT_CACHE_POLICY):
+        if policy not in ("lru", "lfu"):
+            raise ValueError(f"Unknown cache policy: {policy}")
+
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.policy = policy
+        # Called (with the cache lock held) with the name of every file the cache removes
+        self.on_evict: Optional[Callable[[str], None]] = None
+
+        self._entries: "OrderedDict[str, CacheEntry]" = OrderedDict()
+        self._inflight: Dict[str, Future] = {}
+        self._total_bytes = 0
+        self._hits = 0
+        self._misses = 0
+        self._lock = threading.Lock()
+
+        self._load_index()
+
+    def _load_index(self):
+        # One directory scan at startup picks up blobs written by a previous run
+        if not self.directory.exists():
+            return
+        blobs = []
+        variants = []
+        with os.scandir(self.directory) as it:
+            for entry in it:
+                if entry.is_file() and _BLOB_NAME.match(entry.name):
+                    stat = entry.stat()
+                    if entry.name[64:] == ".wav":
+                        blobs.append((stat.st_mtime, entry.name, stat.st_size))
+                    else:
+                        variants.append((entry.name, stat.st_size))
+        for _, name, size in sorted(blobs):
+            self._entries[name[:64]] = CacheEntry(filename=name, size=size)
+            self._total_bytes += size
+        for name, size in variants:
+            entry = self._entries.get(name[:64])
+            if entry is not None:
+                entry.variants[name] = size
+                entry.size += size
+                self._total_bytes += size
+        self._evict_over_budget()
+
+    def lookup(self, key: str) -> Optional[str]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self._misses += 1
+                return None
+            entry.hits += 1
+            self._hits += 1
+            self._entries.move_to_end(key)
+            return entry.filename
+
+    def _claim(self, key: str) -> Tuple[Future, bool]:
+        """
+        Returns the future for `key` and whether the caller is the one that must fill it.
+        """
+        with self._lock:
+            future = self._inflight.get(key)
+            if future is not None:
+                return future, False
+            future = Future()
+            entry = self._entries.get(key)
+            if entry is not None:
+                # Stored by another leader between lookup() and here
+                future.set_result(entry.filename)
+                return future, False
+            self._inflight[key] = future
+            return future, True
+
+    def _store(self, key: str, filename: str) -> str:
+        source = self.directory / filename
+        blob_name = f"{key}{''.join(Path(filename).suffixes)}"
+        os.replace(source, self.directory / blob_name)
+        size = (self.directory / blob_name).stat().st_size
+
+        with self._lock:
+            previous = self._entries.pop(key, None)
+            if previous is not None:
+                self._total_bytes -= previous.size
+            self._entries[key] = CacheEntry(filename=blob_name, size=size)
+            self._total_bytes += size
+            self._evict_over_budget(keep=key)
+        return blob_name
+
+    def _evict_over_budget(self, keep: Optional[str] = None):
+        # Called with self._lock held (or from __init__). `keep` is the blob just stored,
+        # which must survive so that its caller gets an existing file back.
+        while self._total_bytes > self.max_bytes:
+            candidates = (k for k in self._entries if k != keep)
+            if self.policy == "lfu":
+                key = min(candidates, key=lambda k: self._entries[k].hits, default=None)
+            else:
+                key = next(candidates, None)
+            if key is None:
+                break
+            entry = self._entries.pop(key)
+            self._total_bytes -= entry.size
+            for filename in (entry.filename, *entry.variants):
+                (self.directory / filename).unlink(missing_ok=True)
+                if self.on_evict is not None:
+                    self.on_evict(filename)
+
+    def add_variant(self, filename: str) -> None:
+        """
+        Records another encoding of a cached blob (same key, other suffix) so it counts
+        towards the budget and is evicted with the blob. Unknown keys are ignored.
+        """
+        key = filename[:64]
+        path = self.directory / filename
+        if not _BLOB_NAME.match(filename) or not path.exists():
+            return
+        size = path.stat().st_size
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or filename == entry.filename or filename in entry.variants:
+                return
+            entry.variants[filename] = size
+            entry.size += size
+            self._total_bytes += size
+            self._evict_over_budget(keep=key)
+
+    def discard(self, filename: str) -> None:
+        """
+        Forgets a blob (or one of its variants) that was removed from disk by someone else.
+        """
+        key = filename[:64]
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return
+            if entry.filename == filename:
+                del self._entries[key]
+                self._total_bytes -= entry.size
+            elif filename in entry.variants:
+                size = entry.variants.pop(filename)
+                entry.size -= size
+                self._total_bytes -= size
+
+    def get_or_create_sync(self, key: str, create: Callable[[], str]) -> str:
+        """
+        Returns the cached filename for `key`, calling `create()` (which returns the name of
+        a freshly written file in `directory`) only if no identical request is cached or in flight.
+        """
+        filename = self.lookup(key)
+        if filename is not None:
+            return filename
+
+        future, leader = self._claim(key)
+        if not leader:
+            return future.result()
+
+        try:
+            filename = self._store(key, create())
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        else:
+            future.set_result(filename)
+            return filename
+        finally:
+            with self._lock:
+                self._inflight.pop(key, None)
+
+    async def get_or_create(self, key: str, create: Callable[[], Awaitable[str]]) -> str:
+        """
+        Async version of `get_or_create_sync`, `create` is a coroutine function.
+        """
+        filename = self.lookup(key)
+        if filename is not None:
+            return filename
+
+        future, leader = self._claim(key)
+        if not leader:
+            return await asyncio.wrap_future(future)
+
+        try:
+            filename = self._store(key, await create())
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        else:
+            future.set_result(filename)
+            return filename
+        finally:
+            with self._lock:
+                self._inflight.pop(key, None)
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "bytes": self._total_bytes,
+                "max_bytes": self.max_bytes,
+                "policy": self.policy,
+                "hits": self._hits,
+                "misses": self._misses,
+                "in_flight": len(self._inflight),
+            }
@@ -0,0 +1,213 @@
+import os
+import re
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+
+import numpy as np
+
+SENTENCE_PARALLEL = os.getenv("SENTENCE_PARALLEL", "0") == "1"  # default of the parallel_sentences option
+SENTENCE_WORKERS = int(os.getenv("SENTENCE_WORKERS", os.cpu_count() or 1))
+SENTENCE_CACHE_MB = int(os.getenv("SENTENCE_CACHE_MB", 64))  # 0 disables the cache
+SENTENCE_CROSSFADE_MS = float(os.getenv("SENTENCE_CROSSFADE_MS", 10))
+
+# A sentence ends with . ! ? or … (and closing quotes / brackets) followed by a space or the end
+# of the text, or at a line break: "3.5" and "U.S.A" are not split. French closing guillemets
+# may be spaced: « Oui. »
+_SENTENCE_END = re.compile(r"[.!?…]+(?:[ \u00a0\u202f]*»)?[\"'»”’)\]]*(?=\s|$)|\n")
+# "M. Dupont", "Dr. Who", "St. Louis", "J. R. R. Tolkien", "e.g. this": titles, initials and a
+# few abbreviations before a period do not end a sentence. Initialisms ("U.S.") may, they split.
+_ABBREVIATION = re.compile(
+    r"(?:^|[\s(])(?:[A-Z]|M|MM|Mme|Mmes|Mlle|Mlles|Me|Mgr|Pr|Dr|Mr|Mrs|Ms|Prof|St|Ste|Jr|Sr|e\.g|i\.e|cf|vs)\.$"
+)
+
+
+def split_sentences(text: str) -> List[str]:
+    """
+    Splits text into sentences, keeping their punctuation. Fragments without letters or digits
+    (stray punctuation) stay with the previous sentence. Sentences are slices of `text`, so the
+    text spoken is the same whether it is split or not.
+    """
+    spans: List[List[int]] = []
+    glue = False
+    start = 0
+    ends = [match.end() for match in _SENTENCE_END.finditer(text)]
+    for end in ends + [len(text)]:
+        piece = text[start:end].strip()
+        if piece:
+            if spans and (glue or not any(c.isalnum() for c in piece)):
+                spans[-1][1] = end
+            else:
+                spans.append([start, end])
+            glue = bool(_ABBREVIATION.search(piece))
+        start = end
+    return [text[start:end].strip() for start, end in spans]
+
+
+class SentenceCache:
+    """
+    Byte-bounded LRU of synthesized sentences, keyed on the sentence and the settings that
+    change its audio (voice and the signature of its model files, speed, noise). Boilerplate
+    shared by many documents (greetings, legal notices) is synthesized once. Cached arrays are
+    read-only.
+    """
+
+    def __init__(self, max_bytes: int = SENTENCE_CACHE_MB * 1024 * 1024):
+        self.max_bytes = max_bytes
+        self._entries: "OrderedDict[Tuple, Tuple[np.ndarray, int]]" = OrderedDict()
+        self._total_bytes = 0
+        self._lock = threading.Lock()
+        self._hits = 0
+        self._misses = 0
+
+    def get(self, key: Tuple) -> Optional[Tuple[np.ndarray, int]]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self._misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self._hits += 1
+            return entry
+
+    def put(self, key: Tuple, audio: np.ndarray, framerate: int) -> Tuple[np.ndarray, int]:
+        audio = np.array(audio, dtype=np.float32)
+        audio.flags.writeable = False
+        entry = (audio, framerate)
+        if audio.nbytes > self.max_bytes:
+            return entry
+        with self._lock:
+            previous = self._entries.pop(key, None)
+            if previous is not None:
+                self._total_bytes -= previous[0].nbytes
+            self._entries[key] = entry
+            self._total_bytes += audio.nbytes
+            while self._total_bytes > self.max_bytes:
+                _, (evicted, _) = self._entries.popitem(last=False)
+                self._total_bytes -= evicted.nbytes
+        return entry
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._total_bytes = 0
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "bytes": self._total_bytes,
+                "max_bytes": self.max_bytes,
+                "hits": self._hits,
+                "misses": self._misses,
+            }
+
+
+def _fade(length: int) -> np.ndarray:
+    # Raised cosine, 0 -> 1
+    return (0.5 - 0.5 * np.cos(np.pi * (np.arange(length) + 0.5) / length)).astype(np.float32)
+
+
+def iter_joined(
+    clips: Iterable[np.ndarray],
+    framerate: int,
+    silence: float,
+    crossfade_ms: float = SENTENCE_CROSSFADE_MS
+) -> Iterator[np.ndarray]:
+    """
+    Joins sentence clips as they come, one output array per clip.
+
+    With a silence gap, each clip fades in and out over `crossfade_ms` and is followed by
+    `silence` seconds of silence (after the last one too, like piper). Without a gap,
+    consecutive clips overlap by `crossfade_ms` with complementary fades.
+    """
+    fade_length = int(framerate * crossfade_ms / 1000)
+    gap = np.zeros(int(silence * framerate), dtype=np.float32)
+    held: Optional[np.ndarray] = None  # end of the previous clip, waiting for the next one
+
+    for clip in clips:
+        clip = np.array(clip, dtype=np.float32)
+        n = min(fade_length, len(clip) // 2)
+
+        if len(gap):
+            if n:
+                clip[:n] *= _fade(n)
+                clip[-n:] *= _fade(n)[::-1]
+            yield np.concatenate((clip, gap))
+            continue
+
+        if held is not None:
+            m = min(len(held), n)
+            if m:
+                clip[:m] = clip[:m] * _fade(m) + held[len(held) - m:] * _fade(m)[::-1]
+            if len(held) > m:
+                clip = np.concatenate((held[:len(held) - m], clip))
+        held = clip[len(clip) - n:] if n else None
+        yield clip[:len(clip) - n] if n else clip
+
+    if held is not None:
+        yield held
+
+
+_executor: Optional[ThreadPoolExecutor] = None
+_executor_lock = threading.Lock()
+sentence_cache = SentenceCache()
+
+
+def _get_executor() -> ThreadPoolExecutor:
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=max(1, SENTENCE_WORKERS), thread_name_prefix="sentence")
+        return _executor
+
+
+def iter_sentence_clips(
+    sentences: List[str],
+    synthesize: Callable[[str], Tuple[np.ndarray, int]],
+    cache_key: Tuple,
+    cache: Optional[SentenceCache] = None
+) -> Tuple[int, Iterator[np.ndarray]]:
+    """
+    Synthesizes sentences concurrently (each distinct one once, cached ones not at all) and
+    returns the sample rate with the clips in order. The first clip is waited for, so a bad
+    voice raises here rather than while iterating.
+
+    Args:
+        sentences (List[str]): Output of `split_sentences`, not empty.
+        synthesize (Callable): sentence -> (float32 audio, sample rate), without trailing silence.
+        cache_key (Tuple): Settings the audio depends on (voice, speed, noise...).
+    """
+    cache = sentence_cache if cache is None else cache
+    executor = _get_executor()
+
+    def run(sentence: str) -> Tuple[np.ndarray, int]:
+        if cache.max_bytes <= 0:
+            return synthesize(sentence)
+        key = cache_key + (sentence,)
+        entry = cache.get(key)
+        if entry is None:
+            entry = cache.put(key, *synthesize(sentence))
+        return entry
+
+    futures = {}
+    for sentence in sentences:
+        if sentence not in futures:
+            futures[sentence] = executor.submit(run, sentence)
+
+    def clips() -> Iterator[np.ndarray]:
+        try:
+            for sentence in sentences:
+                yield futures[sentence].result()[0]
+        finally:
+            for future in futures.values():
+                future.cancel()
+
+    try:
+        _, framerate = futures[sentences[0]].result()
+    except BaseException:
+        for future in futures.values():
+            future.cancel()
+        raise
+    return framerate, clips()
@@ -0,0 +1,364 @@
+import time
+import uuid
+from concurrent.futures import Future
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+import numpy as np
+
+from tts import synthesize_audio, synthesize_stream, OUTPUT_DIR
+from audio_utils import to_portable_audio, PortableStreamConverter, PORTABLE_RATE, PORTABLE_SAMPLE_WIDTH
+from audio_file_utils import AudioFileUtils
+from effects.chain_processor import EffectChainProcessor
+from sentence_synthesis import SENTENCE_PARALLEL
+from metrics import stage, record_stage, record_synthesis, record_output
+from voice_registry import voice_registry
+from resampler import check_ratio
+
+# Output rate of ChatterboxTTS (its `sr`), known before the model is loaded
+CHATTER_SAMPLE_RATE = 24000
+
+# Backends of the `model` request field
+MODELS = ("piper", "chatterbox")
+
+
+def process_audio(
+    audio: np.ndarray,
+    framerate: int,
+    effects: Optional[List[Dict[str, Any]]] = None,
+    lite_file: bool = False,
+    lite_rate: int = PORTABLE_RATE
+) -> Tuple[np.ndarray, int]:
+    """
+    Post-processing shared by every backend: the effect chain, then the optional
+    portable conversion (to `lite_rate`), all in memory.
+    """
+    if effects:
+        processor = EffectChainProcessor()
+        with stage("effects"):
+            audio = processor.apply_chain(audio, framerate, effects)
+
+    if lite_file:
+        with stage("convert"):
+            audio, framerate = to_portable_audio(audio, framerate, lite_rate)
+
+    return audio, framerate
+
+
+def lite_settings(params: Dict[str, Any]) -> Tuple[int, int]:
+    """
+    Validated portable conversion settings of a request.
+
+    Returns:
+        Tuple[int, int]: Output sample rate (Hz) and sample width (bytes).
+    """
+    rate = params.get("lite_rate") or PORTABLE_RATE
+    sampwidth = params.get("lite_sample_width") or PORTABLE_SAMPLE_WIDTH
+    if not 8000 <= rate <= 192000:
+        raise ValueError(f"Unsupported lite_rate: {rate} (8000 to 192000)")
+    if sampwidth not in (1, 2, 3):
+        raise ValueError(f"Unsupported lite_sample_width: {sampwidth} (1, 2 or 3 bytes)")
+    return rate, sampwidth
+
+
+def output_sample_width(params: Dict[str, Any]) -> int:
+    """
+    Sample width (bytes) of the audio produced for a request.
+    """
+    return lite_settings(params)[1] if params.get("lite_file") else 2
+
+
+def parallel_sentences(params: Dict[str, Any]) -> bool:
+    """
+    Whether the sentences of a request are synthesized concurrently (SENTENCE_PARALLEL by default).
+    """
+    value = params.get("parallel_sentences")
+    return SENTENCE_PARALLEL if value is None else bool(value)
+
+
+def model_name(params: Dict[str, Any]) -> str:
+    model = params.get("model") or "piper"
+    if model not in MODELS:
+        raise ValueError(f"Unknown model: {model} ({', '.join(MODELS)})")
+    return model
+
+
+def _chatterbox():
+    # Imported on first use: torch takes seconds to import and piper requests don't need it
+    from chatter import Chatter, ChatterWrapper, get_chatter
+    return Chatter, ChatterWrapper, get_chatter
+
+
+def validate_request(params: Dict[str, Any]) -> None:
+    """
+    Checks what can be checked before synthesizing: the model and voice, the effect chain and
+    the portable conversion settings.
+
+    Raises:
+        ValueError: Unknown model, voice or effect, invalid params.
+    """
+    if model_name(params) == "chatterbox":
+        Chatter, ChatterWrapper, _ = _chatterbox()
+        if not Chatter.available():
+            raise ValueError("Chatterbox is not installed on this server")
+        if params.get("prompt"):
+            try:
+                ChatterWrapper.find_voice(params["prompt"])
+            except FileNotFoundError:
+                raise ValueError(f"Unknown voice: {voice_label(params)}")
+        source_rate = CHATTER_SAMPLE_RATE
+    else:
+        info = voice_registry.get(params["local"], params["voice"])
+        if info is None:
+            raise ValueError(f"Unknown voice: {voice_label(params)}")
+        source_rate = info.sample_rate
+    EffectChainProcessor().plan(params.get("effects") or [])
+    lite_rate, _ = lite_settings(params)
+    if params.get("lite_file"):
+        # Near-coprime rate pairs (e.g. 22050 -> 44101) can't be resampled
+        check_ratio(source_rate, lite_rate)
+
+
+def voice_label(params: Dict[str, Any]) -> str:
+    if model_name(params) == "chatterbox":
+        return f"chatterbox-{params.get('prompt') or 'default'}"
+    return f"{params['local']}-{params['voice']}"
+
+
+def cacheable(params: Dict[str, Any]) -> bool:
+    """
+    Whether identical requests give identical audio, so a result can be cached and shared:
+    not with an unseeded random effect, whose modulation is drawn anew for each request.
+    Invalid chains count as cacheable, their error is raised by the synthesis.
+    """
+    try:
+        return EffectChainProcessor().is_deterministic(params.get("effects") or [])
+    except ValueError:
+        return True
+
+
+def model_version(params: Dict[str, Any]) -> Optional[Tuple]:
+    """
+    Signature of the files of the piper voice of a request (None for chatterbox or an unknown
+    voice), part of the result cache key so a replaced model isn't served from old results.
+    """
+    if model_name(params) != "piper":
+        return None
+    info = voice_registry.get(params["local"], params["voice"])
+    return info.signature if info is not None else None
+
+
+def submit_chatterbox(params: Dict[str, Any]) -> Future:
+    """
+    Queues a Chatterbox request on the batch scheduler of the process-wide model, where it is
+    generated along with the other requests of the same voice & settings.
+
+    Returns:
+        Future: Resolved with (audio, sample rate).
+    """
+    _, _, get_chatter = _chatterbox()
+    return get_chatter().add_message(
+        text=params["text"],
+        voice=params.get("prompt"),
+        exaggeration=params.get("exaggeration", 0.5),
+        cfg_weight=params.get("cfg_weight", 0.5),
+        output_file=False
+    )
+
+
+def generate_audio(params: Dict[str, Any]) -> Tuple[np.ndarray, int]:
+    """
+    Synthesizes the text of a request with its model, in memory and before any post-processing.
+
+    Returns:
+        Tuple[np.ndarray, int]: float32 samples in the 16-bit PCM range, and the sample rate.
+    """
+    if model_name(params) == "chatterbox":
+        return submit_chatterbox(params).result()
+
+    return synthesize_audio(
+        text=params["text"],
+        local=params["local"],
+        voice=params["voice"],
+        silence=params["silence"],
+        speed=params["speed"],
+        noise_w=params["noise_w"],
+        parallel=parallel_sentences(params)
+    )
+
+
+def render_request(params: Dict[str, Any]) -> Tuple[np.ndarray, int]:
+    """
+    Runs the whole synthesis pipeline for one request in memory.
+
+    Returns:
+        Tuple[np.ndarray, int]: Final audio and its sample rate.
+    """
+    validate_request(params)
+    lite_rate, _ = lite_settings(params)
+    start = time.perf_counter()
+    with stage(model_name(params)):
+        audio, framerate = generate_audio(params)
+    record_synthesis(voice_label(params), len(params["text"]), time.perf_counter() - start, len(audio) / framerate)
+
+    return process_audio(audio, framerate, params.get("effects"), params.get("lite_file"), lite_rate)
+
+
+def synthesize_request(params: Dict[str, Any]) -> str:
+    """
+    Runs the whole synthesis pipeline for one request: the model, the effect chain, then the
+    optional portable conversion, with a single encode to disk at the end. Takes and returns
+    plain data so it can run in a worker process as well as a thread.
+
+    Args:
+        params (Dict): SynthesizeRequest fields.
+
+    Returns:
+        str: Name of the generated file in OUTPUT_DIR.
+    """
+    return write_output(params, *render_request(params))
+
+
+def finish_request(params: Dict[str, Any], audio: np.ndarray, framerate: int) -> str:
+    """
+    Second half of `synthesize_request`, for audio generated elsewhere (e.g. a Chatterbox batch):
+    the effect chain, the portable conversion and the encode to disk.
+
+    Returns:
+        str: Name of the generated file in OUTPUT_DIR.
+    """
+    lite_rate, _ = lite_settings(params)
+    audio, framerate = process_audio(audio, framerate, params.get("effects"), params.get("lite_file"), lite_rate)
+    return write_output(params, audio, framerate)
+
+
+def write_output(params: Dict[str, Any], audio: np.ndarray, framerate: int) -> str:
+    filename = f"{uuid.uuid4().hex}.wav"
+    with stage("write"):
+        AudioFileUtils.audio_to_wav(audio, framerate, OUTPUT_DIR / filename, output_sample_width(params))
+    record_output(voice_label(params), len(audio) / framerate)
+
+    return filename
+
+
+def stream_request(params: Dict[str, Any]) -> Tuple[int, Iterator[bytes]]:
+    """
+    Streaming version of `synthesize_request`: mono PCM chunks, one per sentence, 16-bit unless
+    `lite_sample_width` says otherwise (see `output_sample_width`).
+
+    Effects are applied block by block as the chunks come when every effect of the chain allows
+    it, otherwise the whole utterance is buffered and processed once. Invalid voices and effects are reported
+    before the first chunk. Chatterbox generates the whole utterance at once, its stream is a single chunk.
+
+    Returns:
+        Tuple[int, Iterator[bytes]]: Output sample rate and the PCM chunks.
+    """
+    effects = params.get("effects") or []
+    processor = EffectChainProcessor()
+    # Validates the voice, the chain and the conversion before anything is synthesized
+    validate_request(params)
+    lite_rate, lite_sample_width = lite_settings(params)
+
+    voice = voice_label(params)
+    if model_name(params) == "chatterbox":
+        start = time.perf_counter()
+        with stage("chatterbox"):
+            audio, framerate = generate_audio(params)
+        record_synthesis(voice, len(params["text"]), time.perf_counter() - start, len(audio) / framerate)
+        chunks = iter([AudioFileUtils.audio_to_pcm16(audio)])
+    else:
+        framerate, chunks = synthesize_stream(
+            text=params["text"],
+            local=params["local"],
+            voice=params["voice"],
+            silence=params["silence"],
+            speed=params["speed"],
+            noise_w=params["noise_w"],
+            parallel=parallel_sentences(params)
+        )
+        chunks = _timed_synthesis(chunks, framerate, voice, len(params["text"]))
+
+    if effects and processor.can_stream(effects):
+        chunks = _streamed_chain(chunks, framerate, effects, processor)
+    elif effects:
+        chunks = _buffered_chain(chunks, framerate, effects, processor)
+
+    sampwidth = 2
+    if params.get("lite_file"):
+        converter = PortableStreamConverter(framerate, lite_rate, lite_sample_width)
+        chunks = _converted(chunks, converter)
+        framerate, sampwidth = converter.target_rate, lite_sample_width
+
+    return framerate, _counted_output(chunks, voice, framerate * sampwidth)
+
+
+def _buffered_chain(chunks: Iterator[bytes], framerate: int, effects, processor: EffectChainProcessor) -> Iterator[bytes]:
+    audio = AudioFileUtils.pcm16_to_audio(b"".join(chunks))
+    with stage("effects"):
+        processed = processor.apply_chain(audio, framerate, effects)
+    yield AudioFileUtils.audio_to_pcm16(processed)
+
+
+# The stream stages below add up their time over the chunks and record it once, like the
+# whole-buffer pipeline does, when the stream ends or is closed.
+
+def _streamed_chain(chunks: Iterator[bytes], framerate: int, effects, processor: EffectChainProcessor) -> Iterator[bytes]:
+    seconds = 0.0
+    blocks = processor.block_processor(effects, framerate)
+    try:
+        for chunk in chunks:
+            start = time.perf_counter()
+            processed = blocks.process(AudioFileUtils.pcm16_to_audio(chunk))
+            seconds += time.perf_counter() - start
+            if len(processed):
+                yield AudioFileUtils.audio_to_pcm16(processed)
+        start = time.perf_counter()
+        processed = blocks.flush()
+        seconds += time.perf_counter() - start
+        if len(processed):
+            yield AudioFileUtils.audio_to_pcm16(processed)
+    finally:
+        record_stage("effects", seconds)
+
+
+def _timed_synthesis(chunks: Iterator[bytes], framerate: int, voice: str, characters: int) -> Iterator[bytes]:
+    seconds = 0.0
+    samples = 0
+    iterator = iter(chunks)
+    try:
+        while True:
+            start = time.perf_counter()
+            chunk = next(iterator, None)
+            seconds += time.perf_counter() - start
+            if chunk is None:
+                break
+            samples += len(chunk) // 2
+            yield chunk
+    finally:
+        record_stage("piper", seconds)
+    record_synthesis(voice, characters, seconds, samples / framerate)
+
+
+def _counted_output(chunks: Iterator[bytes], voice: str, bytes_per_second: int) -> Iterator[bytes]:
+    total = 0
+    try:
+        for chunk in chunks:
+            total += len(chunk)
+            yield chunk
+    finally:
+        record_output(voice, total / bytes_per_second)
+
+
+def _converted(chunks: Iterator[bytes], converter: PortableStreamConverter) -> Iterator[bytes]:
+    seconds = 0.0
+    try:
+        for chunk in chunks:
+            start = time.perf_counter()
+            converted = converter.convert(chunk)
+            seconds += time.perf_counter() - start
+            yield converted
+        start = time.perf_counter()
+        tail = converter.flush()
+        seconds += time.perf_counter() - start
+        yield tail
+    finally:
+        record_stage("convert", seconds)
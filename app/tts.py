@@ -1,18 +1,38 @@
 import os
+import time
 import uuid
+import logging
 import subprocess
 from datetime import datetime, timedelta
 from pathlib import Path
-from typing import Optional
+from typing import Iterator, List, Optional, Tuple
+
+import numpy as np
+
+from piper_engine import get_engine
+from audio_file_utils import AudioFileUtils
+from sentence_synthesis import iter_joined, iter_sentence_clips, split_sentences
+from voice_registry import VOICES_DIR, VOICE_WARMUP_TEXT, VoiceInfo, voice_registry
+from resampler import filter_bank
+from audio_utils import PORTABLE_RATE
+
+logger = logging.getLogger(__name__)
 
 OUTPUT_DIR = Path(os.getenv("OUTPUT_PATH", "/output")).resolve()
-VOICES_DIR = Path(os.getenv("VOICE_PATH", "/voice")).resolve()
 
 OUTPUT_DIR.mkdir(exist_ok=True)
 
 class TTSException(Exception):
     pass
 
+def _voice_changed(key: str):
+    # A model replaced or removed on disk must not be served from the loaded copy
+    engine = get_engine()
+    if engine is not None:
+        engine.evict(key)
+
+voice_registry.on_change = _voice_changed
+
 def cleanup_old_files(hours: int = 1):
     one_hour_ago = datetime.now() - timedelta(hours=hours)
     for file in OUTPUT_DIR.glob("*.wav"):
@@ -30,25 +50,162 @@ def synthesize_text(
     filename = f"{uuid.uuid4().hex}.wav"
     output_path = OUTPUT_DIR / filename
 
-    model_path = VOICES_DIR / f"{local}-{voice}.onnx"
+    audio, framerate = synthesize_audio(text, local, voice, silence, speed, noise_w)
+    AudioFileUtils.audio_to_wav(audio, framerate, output_path)
 
-    if not model_path.exists():
-        raise TTSException(f"Voice model not found: {model_path}")
+    return output_path
 
+def synthesize_audio(
+    text: str,
+    local: str = "fr_FR",
+    voice: str = "siwis-medium",
+    silence: int = 1,
+    speed: float = 1.0,
+    noise_w: float = 0.8,
+    parallel: bool = False
+) -> Tuple[np.ndarray, int]:
+    """
+    Synthesizes text in memory (see `synthesize_stream` for `parallel`).
+
+    Returns:
+        Tuple[np.ndarray, int]: float32 samples in the 16-bit PCM range, and the sample rate.
+    """
+    framerate, chunks = synthesize_stream(text, local, voice, silence, speed, noise_w, parallel)
     try:
-        subprocess.run(
-            [
-                "piper",
-                "--model", str(model_path),
-                "--output_file", str(output_path),
-                "--sentence-silence", str(silence),
-                "--length_scale", str(speed),
-                "--noise_w", str(noise_w),
-            ],
-            input=text.encode("utf-8"),
-            check=True
-        )
-    except subprocess.CalledProcessError as e:
+        frames = b"".join(chunks)
+    except TTSException:
+        raise
+    except Exception as e:
         raise TTSException("Synthesis failed") from e
 
-    return output_path
+    return AudioFileUtils.pcm16_to_audio(frames), framerate
+
+
+def _piper_raw_stream(model_path: Path, text: str, silence: int, speed: float, noise_w: float) -> Iterator[bytes]:
+    process = subprocess.Popen(
+        [
+            "piper",
+            "--model", str(model_path),
+            "--output-raw",
+            "--sentence-silence", str(silence),
+            "--length_scale", str(speed),
+            "--noise_w", str(noise_w),
+        ],
+        stdin=subprocess.PIPE,
+        stdout=subprocess.PIPE
+    )
+    try:
+        process.stdin.write(text.encode("utf-8"))
+        process.stdin.close()
+
+        pending = b""
+        while True:
+            data = process.stdout.read1(65536)
+            if not data:
+                break
+            data = pending + data
+            # Only yield whole 16-bit samples
+            cut = len(data) - len(data) % 2
+            pending = data[cut:]
+            if cut:
+                yield data[:cut]
+
+        if process.wait() != 0:
+            raise TTSException("Synthesis failed")
+    finally:
+        if process.poll() is None:
+            process.kill()
+            process.wait()
+
+
+def synthesize_stream(
+    text: str,
+    local: str = "fr_FR",
+    voice: str = "siwis-medium",
+    silence: int = 1,
+    speed: float = 1.0,
+    noise_w: float = 0.8,
+    parallel: bool = False
+) -> Tuple[int, Iterator[bytes]]:
+    """
+    Synthesizes text as a stream of raw 16-bit mono PCM chunks, produced sentence by sentence.
+    The voice is validated (and loaded) before returning.
+
+    With `parallel`, the sentences are synthesized concurrently instead of one after the other
+    (see `synthesize_sentences`).
+
+    Returns:
+        Tuple[int, Iterator[bytes]]: Sample rate and the PCM chunks.
+    """
+    if parallel:
+        sentences = split_sentences(text)
+        if len(sentences) > 1:
+            return synthesize_sentences(sentences, local, voice, silence, speed, noise_w)
+
+    info = voice_registry.get(local, voice)
+    if info is None:
+        raise TTSException(f"Voice model not found: {VOICES_DIR / f'{local}-{voice}.onnx'}")
+
+    engine = get_engine()
+    if engine is not None:
+        engine.get_voice(info.key, info.model_path, info.config)
+        return info.sample_rate, engine.synthesize_stream_raw(
+            info.key,
+            info.model_path,
+            text,
+            silence=silence,
+            speed=speed,
+            noise_w=noise_w
+        )
+
+    return info.sample_rate, _piper_raw_stream(info.model_path, text, silence, speed, noise_w)
+
+
+def prewarm_voices(voices: List[VoiceInfo], text: str = VOICE_WARMUP_TEXT) -> None:
+    """
+    Loads each voice (with the in-process engine) and synthesizes a short text with it, so the
+    first requests don't pay for the model load and the first inference. The resampling filter
+    from the voice rate to the portable rate is built too. Failures are logged, not raised.
+    """
+    engine = get_engine()
+    for info in voices:
+        start = time.perf_counter()
+        try:
+            if engine is not None:
+                engine.get_voice(info.key, info.model_path, info.config)
+                for _ in engine.synthesize_stream_raw(info.key, info.model_path, text, silence=0):
+                    pass
+            filter_bank(info.sample_rate, PORTABLE_RATE)
+        except Exception:
+            logger.exception("Warm-up of voice %s failed", info.key)
+            continue
+        logger.info("Voice %s warmed up in %.0f ms", info.key, (time.perf_counter() - start) * 1000)
+
+
+def synthesize_sentences(
+    sentences: List[str],
+    local: str,
+    voice: str,
+    silence: float,
+    speed: float,
+    noise_w: float
+) -> Tuple[int, Iterator[bytes]]:
+    """
+    Synthesizes each sentence on its own, concurrently, and joins them with `silence` seconds
+    of silence and short fades at the boundaries. Sentences already synthesized with the same
+    voice and settings come from the sentence cache.
+
+    Returns:
+        Tuple[int, Iterator[bytes]]: Sample rate and the PCM chunks, one per sentence.
+    """
+    info = voice_registry.get(local, voice)
+    if info is None:
+        raise TTSException(f"Voice model not found: {VOICES_DIR / f'{local}-{voice}.onnx'}")
+
+    # The signature keeps the sentences of a model replaced on disk out of the cache
+    framerate, clips = iter_sentence_clips(
+        sentences,
+        lambda sentence: synthesize_audio(sentence, local, voice, 0, speed, noise_w),
+        ("piper", local, voice, info.signature, speed, noise_w)
+    )
+    return framerate, (AudioFileUtils.audio_to_pcm16(chunk) for chunk in iter_joined(clips, framerate, silence))
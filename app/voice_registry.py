@@ -0,0 +1,181 @@
+import os
+import json
+import time
+import logging
+import threading
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+VOICES_DIR = Path(os.getenv("VOICE_PATH", "/voice")).resolve()
+VOICE_RESCAN_SECONDS = float(os.getenv("VOICE_RESCAN_SECONDS", 30))  # 0 rescans on every lookup
+# Voices loaded and run once before the healthcheck reports ready: comma-separated `local-voice` keys, or "*"
+VOICE_PREWARM = os.getenv("VOICE_PREWARM", "")
+VOICE_WARMUP_TEXT = os.getenv("VOICE_WARMUP_TEXT", "Bonjour.")
+
+# An unknown voice triggers a rescan (to find a model added since the last one), at most this often
+_MISS_RESCAN_SECONDS = 1.0
+
+
+@dataclass(frozen=True)
+class VoiceInfo:
+    key: str  # `local-voice`, the model file name without `.onnx`
+    local: str
+    voice: str
+    model_path: Path
+    sample_rate: int
+    quality: Optional[str]
+    language: Optional[str]
+    speakers: Tuple[str, ...]
+    size_bytes: int
+    # (mtime, size) of the model and its config, to tell when they changed
+    signature: Tuple = field(repr=False, compare=False)
+    config: Dict[str, Any] = field(repr=False, compare=False)
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "key": self.key,
+            "local": self.local,
+            "voice": self.voice,
+            "sample_rate": self.sample_rate,
+            "quality": self.quality,
+            "language": self.language,
+            "num_speakers": max(1, len(self.speakers)),
+            "speakers": list(self.speakers),
+            "size_bytes": self.size_bytes,
+        }
+
+
+def _signature(model_path: Path, config_path: Path) -> Tuple:
+    model, config = model_path.stat(), config_path.stat()
+    return model.st_mtime_ns, model.st_size, config.st_mtime_ns, config.st_size
+
+
+def _parse(model_path: Path, config_path: Path, signature: Tuple) -> VoiceInfo:
+    with open(config_path, "r", encoding="utf-8") as config_file:
+        config = json.load(config_file)
+    key = model_path.name[:-len(".onnx")]
+    local, voice = key.split("-", 1)
+    speaker_ids = config.get("speaker_id_map") or {}
+    return VoiceInfo(
+        key=key,
+        local=local,
+        voice=voice,
+        model_path=model_path,
+        sample_rate=int(config["audio"]["sample_rate"]),
+        quality=config["audio"].get("quality"),
+        language=(config.get("language") or {}).get("code") or (config.get("espeak") or {}).get("voice"),
+        speakers=tuple(sorted(speaker_ids, key=speaker_ids.get)),
+        size_bytes=signature[1],
+        signature=signature,
+        config=config,
+    )
+
+
+class VoiceRegistry:
+    """
+    In-memory index of the piper voices in a directory: every `<local>-<voice>.onnx` with its
+    `.onnx.json` config, parsed once. The directory is rescanned when the index is older than
+    `rescan_seconds` and when an unknown voice is asked for, so models added or removed are picked
+    up without a restart; unchanged configs are not parsed again.
+    """
+
+    def __init__(self, directory: Path = VOICES_DIR, rescan_seconds: float = VOICE_RESCAN_SECONDS):
+        self.directory = Path(directory)
+        self.rescan_seconds = rescan_seconds
+        self._voices: Dict[str, VoiceInfo] = {}
+        self._lock = threading.Lock()
+        self._scanned_at: Optional[float] = None  # time.monotonic() of the last scan
+        # Called with the key of every voice removed or changed on disk (e.g. to unload it)
+        self.on_change: Optional[Callable[[str], None]] = None
+
+    def scan(self) -> Dict[str, VoiceInfo]:
+        """
+        Rescans the directory now. Voices whose config can't be read are left out (and logged).
+        """
+        with self._lock:
+            previous = self._voices
+        voices: Dict[str, VoiceInfo] = {}
+
+        model_paths = sorted(self.directory.glob("*.onnx")) if self.directory.is_dir() else []
+        for model_path in model_paths:
+            config_path = Path(f"{model_path}.json")
+            key = model_path.name[:-len(".onnx")]
+            if "-" not in key:
+                continue
+            try:
+                signature = _signature(model_path, config_path)
+                known = previous.get(key)
+                voices[key] = known if known is not None and known.signature == signature else \
+                    _parse(model_path, config_path, signature)
+            except FileNotFoundError:
+                continue  # no config, or removed while scanning
+            except (OSError, ValueError, KeyError, TypeError) as e:
+                logger.warning("Skipping voice %s: unreadable config (%s)", key, e)
+
+        with self._lock:
+            self._voices = voices
+            self._scanned_at = time.monotonic()
+
+        for key in voices.keys() - previous.keys():
+            logger.info("Voice added: %s", key)
+        for key, known in previous.items():
+            if voices.get(key) is known:
+                continue
+            logger.info("Voice %s: %s", "changed" if key in voices else "removed", key)
+            if self.on_change is not None:
+                self.on_change(key)
+        return voices
+
+    def _index(self, rescan_after: float) -> Dict[str, VoiceInfo]:
+        with self._lock:
+            scanned_at, voices = self._scanned_at, self._voices
+        if scanned_at is None or time.monotonic() - scanned_at >= rescan_after:
+            voices = self.scan()
+        return voices
+
+    def get(self, local: str, voice: str) -> Optional[VoiceInfo]:
+        """
+        Returns the voice, or None when there is no such model in the directory.
+        """
+        return self.get_key(f"{local}-{voice}")
+
+    def get_key(self, key: str) -> Optional[VoiceInfo]:
+        info = self._index(self.rescan_seconds).get(key)
+        if info is None:
+            info = self._index(_MISS_RESCAN_SECONDS).get(key)
+        return info
+
+    def list(self, local: Optional[str] = None) -> List[VoiceInfo]:
+        voices = self._index(self.rescan_seconds).values()
+        return [info for info in voices if local is None or info.local == local]
+
+    def resolve(self, keys: str) -> List[VoiceInfo]:
+        """
+        Voices of a VOICE_PREWARM-like setting: comma-separated keys, or "*" for all of them.
+        Unknown keys are logged and skipped.
+        """
+        keys = keys.strip()
+        if keys == "*":
+            return self.list()
+        voices = []
+        for key in filter(None, (key.strip() for key in keys.split(","))):
+            info = self.get_key(key)
+            if info is None:
+                logger.warning("Voice to prewarm not found: %s", key)
+            else:
+                voices.append(info)
+        return voices
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return {
+                "voices": len(self._voices),
+                "directory": str(self.directory),
+                "scanned_seconds_ago": None if self._scanned_at is None else round(time.monotonic() - self._scanned_at, 3),
+            }
+
+
+voice_registry = VoiceRegistry()
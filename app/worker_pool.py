@@ -0,0 +1,102 @@
+import os
+import asyncio
+import threading
+from concurrent.futures import Executor, Future, ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Callable, Dict
+
+WORKER_MODE = os.getenv("WORKER_MODE", "thread").lower()  # "thread" or "process"
+WORKER_COUNT = int(os.getenv("WORKER_COUNT", os.cpu_count() or 1))
+WORKER_QUEUE_DEPTH = int(os.getenv("WORKER_QUEUE_DEPTH", 16))
+WORKER_RETRY_AFTER = int(os.getenv("WORKER_RETRY_AFTER", 1))  # seconds, sent back when saturated
+
+
+class PoolSaturatedError(Exception):
+    pass
+
+
+class WorkerPool:
+    """
+    Runs blocking work (synthesis, effects, file conversion) off the event loop.
+
+    At most `max_workers` jobs run at once and at most `max_queue` more wait for a worker;
+    anything beyond that is rejected right away with PoolSaturatedError instead of queueing
+    without bound.
+    """
+
+    def __init__(
+        self,
+        max_workers: int = WORKER_COUNT,
+        max_queue: int = WORKER_QUEUE_DEPTH,
+        mode: str = WORKER_MODE
+    ):
+        if mode not in ("thread", "process"):
+            raise ValueError(f"Unknown worker mode: {mode}")
+
+        self.max_workers = max(1, max_workers)
+        self.max_queue = max(0, max_queue)
+        self.mode = mode
+        self._executor: Executor = (
+            ProcessPoolExecutor(max_workers=self.max_workers)
+            if mode == "process"
+            else ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="synth")
+        )
+        self._lock = threading.Lock()
+        self._pending = 0
+        self._rejected = 0
+
+    def _admit(self):
+        with self._lock:
+            if self._pending >= self.max_workers + self.max_queue:
+                self._rejected += 1
+                raise PoolSaturatedError("Worker pool is saturated")
+            self._pending += 1
+
+    def _release(self, _future=None):
+        with self._lock:
+            self._pending -= 1
+
+    def acquire(self) -> None:
+        """
+        Reserves a slot for work driven outside the executor (e.g. a stream), raising
+        PoolSaturatedError when the queue is full. Must be paired with `release`.
+        """
+        self._admit()
+
+    def release(self) -> None:
+        self._release()
+
+    def submit(self, fn: Callable, *args) -> Future:
+        """
+        Admits and schedules `fn(*args)`, raising PoolSaturatedError when the queue is full.
+        """
+        self._admit()
+        try:
+            future = self._executor.submit(fn, *args)
+        except BaseException:
+            self._release()
+            raise
+        future.add_done_callback(self._release)
+        return future
+
+    async def run(self, fn: Callable, *args):
+        """
+        Awaitable version of `submit`.
+        """
+        return await asyncio.wrap_future(self.submit(fn, *args))
+
+    def stats(self) -> Dict:
+        with self._lock:
+            pending = self._pending
+            rejected = self._rejected
+        in_flight = min(pending, self.max_workers)
+        return {
+            "mode": self.mode,
+            "max_workers": self.max_workers,
+            "max_queue": self.max_queue,
+            "in_flight": in_flight,
+            "queue_depth": pending - in_flight,
+            "rejected": rejected,
+        }
+
+    def shutdown(self, wait: bool = True):
+        self._executor.shutdown(wait=wait)
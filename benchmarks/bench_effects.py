@@ -0,0 +1,121 @@
+"""
+Times every effect of the chain processor, a few representative chains and the portable
+conversion on synthetic clips of 1s, 10s and 60s at 16kHz, 22.05kHz and 48kHz.
+
+Every effect and chain is also run block by block (`EffectChainProcessor.block_processor`),
+timed, and checked against the whole-clip output: the benchmark fails when they differ.
+
+    python benchmarks/bench_effects.py [--repeat 3] [--output results.json] [--baseline baseline.json]
+    python benchmarks/bench_effects.py --quick     # 1s and 10s clips only
+"""
+import argparse
+import contextlib
+import sys
+import tempfile
+from pathlib import Path
+
+import numpy as np
+
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+from harness import APP_DIR, EFFECT_PARAMS, add_arguments, best_of, finish, synthetic_clip  # noqa: E402
+
+sys.path.insert(0, str(APP_DIR))
+from audio_file_utils import AudioFileUtils  # noqa: E402
+from audio_utils import to_portable_file  # noqa: E402
+from effects.chain_processor import EffectChainProcessor  # noqa: E402
+
+SECONDS = (1, 10, 60)
+FRAMERATES = (16000, 22050, 48000)
+
+CHAINS = {
+    "robot": [
+        {"name": "random_semitone_sawtooth_wave", "params": EFFECT_PARAMS["random_semitone_sawtooth_wave"]},
+        {"name": "normalize"},
+    ],
+    "chipmunk": [
+        {"name": "pitch_shift", "params": {"pitch_change": 50}},
+        {"name": "speed_change", "params": {"speed": 0.2}},
+        {"name": "normalize"},
+    ],
+    "everything": [{"name": name, "params": params} for name, params in EFFECT_PARAMS.items()],
+}
+
+# Regular blocks like a stream of fixed size buffers, and uneven ones like sentences
+BLOCK_SIZES = ((1024,), (37, 4410, 1, 20000, 999))
+# Largest allowed difference with the whole-clip output, in the 16-bit range
+BLOCK_TOLERANCE = 0.5
+
+
+def check_blocks(processor: EffectChainProcessor, audio: np.ndarray, framerate: int, chain, name: str) -> bool:
+    """
+    Compares the block by block output of a chain with the whole-clip one, for every BLOCK_SIZES.
+    """
+    expected = processor.apply_chain(audio, framerate, chain)
+    ok = True
+    for sizes in BLOCK_SIZES:
+        output = processor.block_processor(chain, framerate).run(audio, sizes)
+        error = float(np.max(np.abs(output - expected), initial=0.0)) if len(output) == len(expected) else float("inf")
+        if error > BLOCK_TOLERANCE:
+            print(f"{name}: block output (blocks {sizes}) differs from the whole-clip output, "
+                  f"{len(output)} vs {len(expected)} samples, max error {error}", file=sys.stderr)
+            ok = False
+    return ok
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--quick", action="store_true", help="Skip the 60s clips")
+    add_arguments(parser)
+    args = parser.parse_args()
+
+    processor = EffectChainProcessor()
+    missing = set(processor.effect_map) - set(EFFECT_PARAMS)
+    if missing:
+        parser.error(f"No benchmark params for: {', '.join(sorted(missing))}")
+
+    results = {}
+    seconds_list = SECONDS[:-1] if args.quick else SECONDS
+    blocks_ok = True
+
+    with tempfile.TemporaryDirectory() as tmp:
+        for framerate in FRAMERATES:
+            for seconds in seconds_list:
+                audio = synthetic_clip(seconds, framerate)
+                suffix = f"{framerate}Hz/{seconds}s"
+
+                chains = {f"effect/{name}": [{"name": name, "params": params}] for name, params in EFFECT_PARAMS.items()}
+                chains.update({f"chain/{name}": chain for name, chain in CHAINS.items()})
+
+                for name, func in processor.effect_map.items():
+                    params = EFFECT_PARAMS[name]
+                    ms = best_of(lambda: func(audio, framerate, **params), args.repeat)
+                    results[f"effect/{name}/{suffix}"] = {"best_ms": round(ms, 3)}
+
+                for name, chain in CHAINS.items():
+                    ms = best_of(lambda: processor.apply_chain(audio, framerate, chain), args.repeat)
+                    results[f"chain/{name}/{suffix}"] = {"best_ms": round(ms, 3)}
+
+                for name, chain in chains.items():
+                    blocks_ok &= check_blocks(processor, audio, framerate, chain, f"{name}/{suffix}")
+                    ms = best_of(lambda: processor.block_processor(chain, framerate).run(audio, BLOCK_SIZES[0]),
+                                 args.repeat)
+                    results[f"{name}/blocks/{suffix}"] = {"best_ms": round(ms, 3)}
+
+                source = Path(tmp) / f"{framerate}-{seconds}.wav"
+                target = Path(tmp) / "portable.wav"
+                AudioFileUtils.audio_to_wav(audio, framerate, source)
+                # to_portable_file prints what it does, keep stdout for the results
+                with contextlib.redirect_stdout(sys.stderr):
+                    ms = best_of(lambda: to_portable_file(source, target), args.repeat)
+                results[f"to_portable_file/{suffix}"] = {"best_ms": round(ms, 3)}
+
+                print(f"{suffix} done", file=sys.stderr)
+
+    if not blocks_ok:
+        sys.exit(1)
+    finish("effects", results, args)
+
+
+if __name__ == "__main__":
+    main()
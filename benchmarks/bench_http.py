@@ -0,0 +1,194 @@
+"""
+End-to-end throughput and latency of `POST /api/v1/synthesize` at several concurrency levels.
+
+The server runs in a subprocess with the piper subprocess engine, and `piper` on its PATH is a
+stub that ignores its input and emits a fixed clip, so no voice model or network is needed and
+the numbers measure the server itself (HTTP, worker pool, effects, encoding, disk).
+
+    python benchmarks/bench_http.py [--concurrency 1 4 16] [--requests 64] [--effects] \
+        [--output results.json] [--baseline baseline.json]
+"""
+import argparse
+import base64
+import http.client
+import json
+import os
+import socket
+import stat
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+from harness import APP_DIR, add_arguments, finish, percentiles, synthetic_clip  # noqa: E402
+
+STUB_RATE = 22050
+STUB_SECONDS = 3.0
+
+STUB_PIPER = """#!{python}
+# Stand-in for the piper CLI: reads the text, writes a fixed clip as raw 16-bit PCM
+import sys
+sys.stdin.buffer.read()
+with open({pcm!r}, "rb") as pcm:
+    sys.stdout.buffer.write(pcm.read())
+"""
+
+EFFECTS = [
+    {"name": "pitch_shift", "params": {"pitch_change": 30}},
+    {"name": "normalize"},
+]
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def prepare(root: Path) -> dict:
+    """
+    Stub piper executable, voice files and output directory. Returns the server environment.
+    """
+    clip = synthetic_clip(STUB_SECONDS, STUB_RATE)
+    pcm = root / "clip.pcm"
+    pcm.write_bytes(clip.clip(-32768, 32767).astype("<i2").tobytes())
+
+    bin_dir = root / "bin"
+    bin_dir.mkdir()
+    piper = bin_dir / "piper"
+    piper.write_text(STUB_PIPER.format(python=sys.executable, pcm=str(pcm)))
+    piper.chmod(piper.stat().st_mode | stat.S_IXUSR | stat.S_IXGRP | stat.S_IXOTH)
+
+    voices = root / "voices"
+    voices.mkdir()
+    (voices / "fr_FR-stub.onnx").write_bytes(b"")
+    (voices / "fr_FR-stub.onnx.json").write_text(json.dumps({"audio": {"sample_rate": STUB_RATE}}))
+
+    output = root / "output"
+    output.mkdir()
+
+    env = dict(os.environ)
+    env.pop("API_KEY", None)
+    env.update({
+        "PATH": f"{bin_dir}{os.pathsep}{env.get('PATH', '')}",
+        "PIPER_ENGINE": "subprocess",
+        "VOICE_PATH": str(voices),
+        "OUTPUT_PATH": str(output),
+    })
+    return env
+
+
+def wait_ready(port: int, server: subprocess.Popen, timeout: float = 30.0) -> None:
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if server.poll() is not None:
+            raise RuntimeError("The server exited during startup")
+        try:
+            connection = http.client.HTTPConnection("127.0.0.1", port, timeout=1)
+            connection.request("GET", "/api/healthcheck")
+            if connection.getresponse().status == 200:
+                return
+        except OSError:
+            time.sleep(0.1)
+    raise RuntimeError("The server did not start in time")
+
+
+class Client:
+    """
+    One keep-alive connection per thread, like a pool of HTTP clients would.
+    """
+
+    def __init__(self, port: int, effects: bool):
+        self.port = port
+        self.effects = effects
+        self.local = threading.local()
+        self.counter = iter(range(1 << 62))
+        self.counter_lock = threading.Lock()
+        # Basic credentials are always expected, checked only when API_KEY is set (and it is unset here)
+        self.headers = {
+            "Content-Type": "application/json",
+            "Authorization": "Basic " + base64.b64encode(b"piper:bench").decode(),
+        }
+
+    def post(self) -> tuple:
+        connection = getattr(self.local, "connection", None)
+        if connection is None:
+            connection = self.local.connection = http.client.HTTPConnection("127.0.0.1", self.port, timeout=60)
+        with self.counter_lock:
+            number = next(self.counter)
+        # A new text every time, so the result cache never answers
+        body = {"text": f"Phrase numéro {number}.", "local": "fr_FR", "voice": "stub"}
+        if self.effects:
+            body["effects"] = EFFECTS
+
+        start = time.perf_counter()
+        try:
+            connection.request("POST", "/api/v1/synthesize", json.dumps(body), self.headers)
+            response = connection.getresponse()
+            response.read()
+            status = response.status
+        except OSError:
+            self.local.connection = None
+            status = 0
+        return status, (time.perf_counter() - start) * 1000
+
+
+def run_level(client: Client, concurrency: int, requests: int) -> dict:
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        outcomes = list(pool.map(lambda _: client.post(), range(requests)))
+    wall = time.perf_counter() - start
+
+    latencies = [ms for status, ms in outcomes if status == 200]
+    result = {
+        "requests_per_s": round(len(latencies) / wall, 3),
+        "ok": len(latencies),
+        "rejected": sum(1 for status, _ in outcomes if status == 503),
+        "failed": sum(1 for status, _ in outcomes if status not in (200, 503)),
+    }
+    result.update(percentiles(latencies))
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 4, 16])
+    parser.add_argument("--requests", type=int, default=64, help="Requests per concurrency level")
+    parser.add_argument("--warmup", type=int, default=4)
+    parser.add_argument("--effects", action="store_true", help="Apply a pitch_shift + normalize chain")
+    add_arguments(parser)
+    args = parser.parse_args()
+
+    results = {}
+    with tempfile.TemporaryDirectory() as tmp:
+        env = prepare(Path(tmp))
+        port = free_port()
+        server = subprocess.Popen(
+            [sys.executable, "-m", "uvicorn", "piper_tts_server:app", "--host", "127.0.0.1",
+             "--port", str(port), "--log-level", "warning"],
+            cwd=APP_DIR,
+            env=env
+        )
+        try:
+            wait_ready(port, server)
+            client = Client(port, args.effects)
+            run_level(client, 1, args.warmup)
+
+            for concurrency in args.concurrency:
+                result = run_level(client, concurrency, args.requests)
+                results[f"synthesize/c{concurrency}{'/effects' if args.effects else ''}"] = result
+                print(f"c={concurrency:<3} {result['requests_per_s']:8.1f} req/s  p50 {result.get('p50_ms', 0):8.1f} ms  "
+                      f"p99 {result.get('p99_ms', 0):8.1f} ms  rejected {result['rejected']}  failed {result['failed']}", file=sys.stderr)
+        finally:
+            server.terminate()
+            server.wait(timeout=10)
+
+    finish("http", results, args)
+
+
+if __name__ == "__main__":
+    main()
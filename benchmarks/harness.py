@@ -0,0 +1,129 @@
+"""
+Shared helpers of the benchmarks (and of the effect tests): timing, synthetic clips, effect
+params, and machine-readable results that can be saved as a baseline and compared against it.
+
+Results are a JSON object `{"benchmark": ..., "results": {name: {metric: value}}}`. Metrics
+ending in `_ms` are lower-is-better, `_per_s` higher-is-better; only those are compared.
+"""
+import json
+import platform
+import statistics
+import sys
+import time
+from pathlib import Path
+from typing import Callable, Dict, List, Optional
+
+import numpy as np
+
+APP_DIR = Path(__file__).resolve().parent.parent / "app"
+
+
+def best_of(func: Callable[[], object], repeat: int) -> float:
+    """
+    Best wall time of `repeat` calls, in ms (the least disturbed by the rest of the machine).
+    """
+    best = float("inf")
+    for _ in range(max(1, repeat)):
+        start = time.perf_counter()
+        func()
+        best = min(best, time.perf_counter() - start)
+    return best * 1000
+
+
+def percentiles(samples_ms: List[float]) -> Dict[str, float]:
+    ordered = sorted(samples_ms)
+    if not ordered:
+        return {}
+
+    def at(fraction: float) -> float:
+        return ordered[min(len(ordered) - 1, int(round(fraction * (len(ordered) - 1))))]
+
+    return {
+        "p50_ms": round(at(0.50), 3),
+        "p95_ms": round(at(0.95), 3),
+        "p99_ms": round(at(0.99), 3),
+        "mean_ms": round(statistics.fmean(ordered), 3),
+    }
+
+
+# Params of each effect with an actual effect (the defaults of some effects are no-ops), shared
+# by the effect benchmark and the block processor tests
+EFFECT_PARAMS = {
+    "flanger": {},
+    "normalize": {},
+    "pitch_shift": {"pitch_change": 30},
+    "random_semitone_sawtooth_wave": {"min_freq": 80, "max_semitones": 12, "pitch_duration": 0.2, "wet": 0.3, "seed": 7},
+    "speed_change": {"speed": 0.15},
+}
+
+
+def synthetic_clip(seconds: float, framerate: int, seed: int = 0) -> np.ndarray:
+    """
+    Voice-like test signal in the 16-bit range: two harmonics with a slow vibrato, noise,
+    and a syllable-rate envelope so dynamics processors have something to do.
+    """
+    rng = np.random.default_rng(seed)
+    t = np.arange(int(seconds * framerate)) / framerate
+    f0 = 180 + 20 * np.sin(2 * np.pi * 5 * t)
+    phase = 2 * np.pi * np.cumsum(f0) / framerate
+    envelope = 0.55 + 0.45 * np.sin(2 * np.pi * 3 * t) ** 2
+    audio = envelope * (9000 * np.sin(phase) + 3000 * np.sin(2 * phase)) + 300 * rng.standard_normal(len(t))
+    return audio.astype(np.float32)
+
+
+def write_results(benchmark: str, results: Dict[str, Dict[str, float]], path: Optional[Path]) -> Dict:
+    report = {
+        "benchmark": benchmark,
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "machine": platform.machine(),
+        "results": results,
+    }
+    text = json.dumps(report, indent=2, sort_keys=True)
+    if path is None:
+        print(text)
+    else:
+        path.write_text(text + "\n")
+    return report
+
+
+def compare(report: Dict, baseline_path: Path, tolerance: float, min_ms: float = 1.0) -> bool:
+    """
+    Prints the change of every comparable metric against a saved report and returns False
+    when one regressed by more than `tolerance` (a fraction, 0.2 = 20%). Timings under
+    `min_ms` on both sides are too noisy to fail on.
+    """
+    baseline = json.loads(baseline_path.read_text())["results"]
+    ok = True
+    for name, metrics in sorted(report["results"].items()):
+        for metric, value in sorted(metrics.items()):
+            reference = baseline.get(name, {}).get(metric)
+            if reference is None or not reference:
+                continue
+            if metric.endswith("_ms"):
+                change = value / reference - 1
+            elif metric.endswith("_per_s"):
+                change = reference / value - 1 if value else float("inf")
+            else:
+                continue
+            regressed = change > tolerance
+            if metric.endswith("_ms") and max(value, reference) < min_ms:
+                regressed = False
+            ok &= not regressed
+            flag = "REGRESSION" if regressed else ""
+            print(f"{name:<48} {metric:<12} {reference:>10.3f} -> {value:>10.3f}  {change:+7.1%} {flag}",
+                  file=sys.stderr)
+    return ok
+
+
+def add_arguments(parser) -> None:
+    parser.add_argument("--output", type=Path, help="Write the JSON results there instead of stdout")
+    parser.add_argument("--baseline", type=Path, help="Compare against a saved report, exit 1 on regressions")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="Allowed slowdown vs the baseline (0.2 = 20%%)")
+    parser.add_argument("--min-ms", type=float, default=1.0, help="Timings below this never count as regressions")
+
+
+def finish(benchmark: str, results: Dict[str, Dict[str, float]], args) -> None:
+    report = write_results(benchmark, results, args.output)
+    if args.baseline is not None and not compare(report, args.baseline, args.tolerance, args.min_ms):
+        sys.exit(1)
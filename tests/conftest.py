@@ -0,0 +1,7 @@
+import sys
+from pathlib import Path
+
+# The app modules import each other as top-level modules, like the server does from app/
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "app"))
+# The benchmark harness holds the synthetic clips and effect params the tests share with it
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "benchmarks"))
@@ -0,0 +1,122 @@
+import threading
+import time
+
+import pytest
+
+from batch_scheduler import BatchScheduler
+from worker_pool import PoolSaturatedError
+
+
+class StubModel:
+    """
+    Stands in for a model: records the batches it is called with, and can be held so requests
+    pile up in the queue.
+    """
+
+    def __init__(self):
+        self.batches = []
+        self.release = threading.Event()
+        self.release.set()
+        self.started = threading.Event()
+
+    def process_batch(self, payloads):
+        self.started.set()
+        self.release.wait(5)
+        self.batches.append(list(payloads))
+        return [ValueError(payload) if payload == "bad" else payload.upper() for payload in payloads]
+
+
+@pytest.fixture
+def model():
+    return StubModel()
+
+
+def hold(model, scheduler):
+    # Occupies the scheduler thread with a first batch, so what follows waits in the queue
+    model.release.clear()
+    future = scheduler.submit("first")
+    assert model.started.wait(5)
+    return future
+
+
+def test_batches_up_to_max_batch_size(model):
+    scheduler = BatchScheduler(model.process_batch, max_batch_size=3, max_wait=0.2)
+    first = hold(model, scheduler)
+    futures = [scheduler.submit(text) for text in ["a", "b", "c", "d", "e"]]
+    model.release.set()
+
+    assert [future.result(5) for future in futures] == ["A", "B", "C", "D", "E"]
+    assert first.result(5) == "FIRST"
+    assert model.batches == [["first"], ["a", "b", "c"], ["d", "e"]]
+    assert scheduler.stats()["items"] == 6
+    scheduler.stop()
+
+
+def test_batch_closes_after_max_wait(model):
+    scheduler = BatchScheduler(model.process_batch, max_batch_size=10, max_wait=0.05)
+    start = time.monotonic()
+    assert scheduler.submit("a").result(5) == "A"
+    assert 0.04 <= time.monotonic() - start < 2
+    assert scheduler.submit("b").result(5) == "B"
+    assert model.batches == [["a"], ["b"]]
+    scheduler.stop()
+
+
+def test_groups_are_never_mixed(model):
+    scheduler = BatchScheduler(model.process_batch, max_batch_size=10, max_wait=0.2, group_key=lambda text: text[0])
+    hold(model, scheduler)
+    futures = [scheduler.submit(text) for text in ["x1", "y1", "x2", "y2"]]
+    model.release.set()
+
+    assert [future.result(5) for future in futures] == ["X1", "Y1", "X2", "Y2"]
+    assert model.batches[1:] == [["x1", "x2"], ["y1", "y2"]]
+    scheduler.stop()
+
+
+def test_item_error_fails_only_its_future(model):
+    scheduler = BatchScheduler(model.process_batch, max_batch_size=10, max_wait=0.2)
+    hold(model, scheduler)
+    futures = [scheduler.submit(text) for text in ["a", "bad", "c"]]
+    model.release.set()
+
+    assert futures[0].result(5) == "A"
+    with pytest.raises(ValueError):
+        futures[1].result(5)
+    assert futures[2].result(5) == "C"
+    scheduler.stop()
+
+
+def test_batch_error_fails_the_batch():
+    def process_batch(payloads):
+        raise RuntimeError("model crashed")
+
+    scheduler = BatchScheduler(process_batch, max_wait=0)
+    with pytest.raises(RuntimeError, match="model crashed"):
+        scheduler.submit("a").result(5)
+    scheduler.stop()
+
+
+def test_stop_processes_what_is_queued(model):
+    scheduler = BatchScheduler(model.process_batch, max_batch_size=2, max_wait=0.2)
+    hold(model, scheduler)
+    futures = [scheduler.submit(text) for text in ["a", "b", "c"]]
+    stopper = threading.Thread(target=scheduler.stop)
+    stopper.start()
+    model.release.set()
+    stopper.join(5)
+
+    assert not stopper.is_alive()
+    assert [future.result(0) for future in futures] == ["A", "B", "C"]
+
+
+def test_full_queue_rejects(model):
+    scheduler = BatchScheduler(model.process_batch, max_batch_size=1, max_wait=0, max_queue=2)
+    hold(model, scheduler)
+    futures = [scheduler.submit("a"), scheduler.submit("b")]
+    with pytest.raises(PoolSaturatedError):
+        scheduler.submit("c")
+    model.release.set()
+
+    assert [future.result(5) for future in futures] == ["A", "B"]
+    assert scheduler.stats()["rejected"] == 1
+    scheduler.stop()
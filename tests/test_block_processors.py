@@ -0,0 +1,44 @@
+import numpy as np
+import pytest
+
+from effects.chain_processor import EffectChainProcessor
+from harness import EFFECT_PARAMS, synthetic_clip
+
+FRAMERATES = (16000, 22050, 44100, 48000)
+
+# Odd block sizes, repeated until the clip is consumed: single samples, primes, and a block
+# longer than the analysis windows
+BLOCK_SIZES = ((1, 7, 997, 13, 4093), (331,), (1, 2, 3), (20011,))
+
+# Largest allowed difference with the whole-clip output, in the 16-bit range
+TOLERANCE = 0.5
+
+
+def test_every_effect_is_covered():
+    assert set(EffectChainProcessor().effect_map) == set(EFFECT_PARAMS)
+
+
+@pytest.mark.parametrize("sizes", BLOCK_SIZES, ids=lambda sizes: "-".join(map(str, sizes)))
+@pytest.mark.parametrize("framerate", FRAMERATES)
+@pytest.mark.parametrize("name", sorted(EFFECT_PARAMS))
+def test_blocks_match_whole_clip(name, framerate, sizes):
+    chain = [{"name": name, "params": EFFECT_PARAMS[name]}]
+    audio = synthetic_clip(0.75, framerate)
+    expected = EffectChainProcessor().apply_chain(audio, framerate, chain)
+
+    output = EffectChainProcessor().block_processor(chain, framerate).run(audio, sizes)
+
+    assert len(output) == len(expected)
+    np.testing.assert_allclose(output, expected, rtol=0, atol=TOLERANCE)
+
+
+@pytest.mark.parametrize("framerate", FRAMERATES)
+def test_chain_blocks_match_whole_clip(framerate):
+    chain = [{"name": name, "params": params} for name, params in EFFECT_PARAMS.items()]
+    audio = synthetic_clip(0.75, framerate)
+    expected = EffectChainProcessor().apply_chain(audio, framerate, chain)
+
+    output = EffectChainProcessor().block_processor(chain, framerate).run(audio, BLOCK_SIZES[0])
+
+    assert len(output) == len(expected)
+    np.testing.assert_allclose(output, expected, rtol=0, atol=TOLERANCE)
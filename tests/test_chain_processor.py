@@ -0,0 +1,23 @@
+import pytest
+
+from effects.chain_processor import EffectChainProcessor
+
+
+def speed_chain(*speeds):
+    return [{"name": "speed_change", "params": {"speed": speed}} for speed in speeds]
+
+
+def test_consecutive_speed_changes_merge():
+    plan = EffectChainProcessor().plan(speed_chain(0.5, -0.2))
+    assert [step.name for step in plan] == ["speed_change"]
+    assert plan[0].params["speed"] == pytest.approx(0.2)
+
+
+def test_speed_changes_cancelling_out_are_dropped():
+    assert EffectChainProcessor().plan(speed_chain(1.0, -0.5)) == ()
+
+
+@pytest.mark.parametrize("speeds", [(-1.0,), (-1.5, -3.0), (0.5, -2.0), (-3.0, 0.5, -1.5)])
+def test_invalid_speed_step_is_rejected_before_merging(speeds):
+    with pytest.raises(ValueError, match="speed factor must be > 0"):
+        EffectChainProcessor().plan(speed_chain(*speeds))
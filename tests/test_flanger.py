@@ -0,0 +1,42 @@
+import math
+
+import numpy as np
+import pytest
+
+from effects.flanger import FlangerProcessor, apply_flanger
+
+
+def reference_flanger(audio, framerate, rate=0.15, min_delay=0.0025, max_delay=0.0035, feedback=0.9,
+                      t_offset=0, dry=0.5, wet=0.5):
+    # The original per-sample loop, with the offset fixed instead of read from the clock
+    num_samples = len(audio)
+    delay_buffer_size = int(max_delay * framerate) + 2
+    delay_buffer = np.zeros(delay_buffer_size, dtype=np.float32)
+    output = np.zeros(num_samples, dtype=np.float32)
+    for n in range(num_samples):
+        lfo_phase = 2 * math.pi * rate * (n / framerate + t_offset + 0.0)
+        delay_time = min_delay + (max_delay - min_delay) * (0.5 * (1 + math.sin(lfo_phase)))
+        delay_samples = int(delay_time * framerate)
+        read_index = (n - delay_samples) % delay_buffer_size
+        write_index = n % delay_buffer_size
+        delayed_sample = delay_buffer[read_index]
+        delay_buffer[write_index] = audio[n] + feedback * delayed_sample
+        output[n] = dry * audio[n] + wet * delayed_sample
+    return output
+
+
+@pytest.mark.parametrize("framerate", [16000, 22050])
+@pytest.mark.parametrize("params", [
+    {},
+    {"rate": 2.0, "t_offset": 0.37},
+    {"rate": 0.5, "feedback": 0.0, "min_delay": 0.001, "max_delay": 0.006},
+])
+def test_matches_reference_loop(framerate, params):
+    audio = (np.random.default_rng(1).uniform(-1, 1, framerate) * 20000).astype(np.float32)
+    expected = reference_flanger(audio, framerate, **params)
+
+    np.testing.assert_allclose(apply_flanger(audio, framerate, **params), expected, rtol=0, atol=1e-3)
+
+    processor = FlangerProcessor(framerate, **params)
+    blocks = [processor.process(audio[start:start + 997]) for start in range(0, len(audio), 997)]
+    np.testing.assert_allclose(np.concatenate(blocks), expected, rtol=0, atol=1e-3)
@@ -0,0 +1,54 @@
+import pytest
+
+from sentence_synthesis import split_sentences
+
+
+@pytest.mark.parametrize("text, expected", [
+    ("Bonjour. Ça va ? Oui !", ["Bonjour.", "Ça va ?", "Oui !"]),
+    ("Première ligne\nSeconde ligne", ["Première ligne", "Seconde ligne"]),
+    ("Quoi ?! Bon…", ["Quoi ?!", "Bon…"]),
+    ("« Oui. » Non.", ["« Oui. »", "Non."]),
+    ('He said "stop." Then left.', ['He said "stop."', "Then left."]),
+    ("Fin. ...", ["Fin. ..."]),
+    ("", []),
+])
+def test_sentences(text, expected):
+    assert split_sentences(text) == expected
+
+
+@pytest.mark.parametrize("text, expected", [
+    ("Il est 3.5 heures!", ["Il est 3.5 heures!"]),
+    ("Pi vaut 3,14. Environ.", ["Pi vaut 3,14.", "Environ."]),
+    ("Version 1.2.3 est sortie.", ["Version 1.2.3 est sortie."]),
+])
+def test_decimals(text, expected):
+    assert split_sentences(text) == expected
+
+
+@pytest.mark.parametrize("text, expected", [
+    ("Bonjour M. Dupont. Ça va ?", ["Bonjour M. Dupont.", "Ça va ?"]),
+    ("Dr. Who arrive. Mme. Durand aussi.", ["Dr. Who arrive.", "Mme. Durand aussi."]),
+    ("J. R. R. Tolkien wrote it. Yes.", ["J. R. R. Tolkien wrote it.", "Yes."]),
+    ("I am OK. He is here.", ["I am OK.", "He is here."]),
+    ("We are. So are they.", ["We are.", "So are they."]),
+])
+def test_abbreviations(text, expected):
+    assert split_sentences(text) == expected
+
+
+@pytest.mark.parametrize("text, expected", [
+    ("He is in the U.S. Now.", ["He is in the U.S.", "Now."]),
+    ("La S.N.C.F. Voilà.", ["La S.N.C.F.", "Voilà."]),
+    ("Voir e.g. la suite, cf. la fin.", ["Voir e.g. la suite, cf. la fin."]),
+])
+def test_initialisms(text, expected):
+    assert split_sentences(text) == expected
+
+
+def test_sentences_are_slices_of_the_text():
+    text = "Bonjour  M.   Dupont.\tIl est 3.5 heures !  « Oui. »"
+    sentences = split_sentences(text)
+    assert sentences == ["Bonjour  M.   Dupont.", "Il est 3.5 heures !", "« Oui. »"]
+    position = 0
+    for sentence in sentences:
+        position = text.index(sentence, position) + len(sentence)